@@ -0,0 +1,211 @@
+# batch.py
+
+"""
+无界面批处理模式：从 JSONL 文件读取多个 (url, history) 任务，并发预热缓存并生成 prompt。
+
+用法:
+    python batch.py jobs.jsonl [--workers N] [--config config.yaml]
+
+jobs.jsonl 每行一个 JSON 对象:
+    {"job_id": "csr-2024", "url": "https://www.uscardforum.com/t/topic/12345", "history": "..."}
+job_id 可省略（默认为行号）；history 省略时只获取帖子并生成派生文件，不生成 prompt。
+用 "urls": [...] 代替 url 时，合并多个话题的回复生成一份 AI 输入文件和 prompt。
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from config_loader import load_config
+import cache_manager
+import metrics
+import read_write_posts
+from read_write_posts import (
+    aggregate_topics,
+    extract_topic_id,
+    generate_prompt,
+    get_all_posts,
+)
+
+
+def load_jobs(path):
+    """读取 JSONL 任务文件，返回任务列表。格式错误的行会被跳过并给出提示。"""
+    jobs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"警告: 第 {line_number} 行不是有效的 JSON，已跳过 ({e})。")
+                continue
+            if not isinstance(job, dict) or not (job.get("url") or job.get("urls")):
+                print(f"警告: 第 {line_number} 行缺少 url，已跳过。")
+                continue
+            job.setdefault("job_id", str(line_number))
+            jobs.append(job)
+    return jobs
+
+
+class BatchRunner:
+    """在有界线程池中执行批处理任务。同一话题的多个任务共用一次帖子获取。"""
+
+    def __init__(self, config, workers):
+        self.config = config
+        self.workers = workers
+        self._topic_locks = {}
+        self._topic_locks_lock = threading.Lock()
+
+    def _topic_lock(self, topic_id):
+        with self._topic_locks_lock:
+            return self._topic_locks.setdefault(topic_id, threading.Lock())
+
+    def run_job(self, job):
+        """执行单个任务，返回包含各阶段耗时的结果字典。"""
+        urls = job.get("urls") or [job["url"]]
+        topic_ids = [extract_topic_id(url) for url in urls]
+        result = {
+            "job_id": job["job_id"],
+            "topic_id": (
+                read_write_posts.merged_topic_id(topic_ids)
+                if len(urls) > 1 and all(topic_ids)
+                else topic_ids[0]
+            ),
+            "status": "ok",
+            "posts": 0,
+            "fetch_seconds": 0.0,
+            "prompt_seconds": 0.0,
+            "total_seconds": 0.0,
+        }
+        start = time.perf_counter()
+        run_context = contextlib.ExitStack()
+        try:
+            topic_id = result["topic_id"]
+            if not all(topic_ids):
+                result["status"] = "无效URL"
+                return result
+
+            print(f"[{job['job_id']}] 开始处理 Topic ID: {topic_id}")
+            run_context.enter_context(cache_manager.in_use(topic_id))
+            run_context.enter_context(
+                metrics.collect(
+                    self.config,
+                    os.path.join(read_write_posts.CACHE_DIR, "metrics"),
+                    f"{topic_id}_{job['job_id']}",
+                    topic_id=topic_id,
+                    job_id=job["job_id"],
+                )
+            )
+            # 同一话题的任务串行获取：第一个任务写好缓存后，后续任务直接命中缓存
+            with self._topic_lock(topic_id):
+                fetch_start = time.perf_counter()
+                if "+" in topic_id:
+                    topic_id = aggregate_topics(
+                        self.config["BASE_URL"], topic_ids, self.config
+                    )
+                    all_posts_raw = topic_id is not None
+                    if topic_id is not None:
+                        result["topic_id"] = topic_id
+                else:
+                    all_posts_raw = get_all_posts(
+                        self.config["BASE_URL"], topic_id, self.config
+                    )
+                result["fetch_seconds"] = time.perf_counter() - fetch_start
+
+            if not all_posts_raw:
+                result["status"] = "获取失败"
+                return result
+            if all_posts_raw is not True:
+                result["posts"] = len(all_posts_raw)
+
+            history = job.get("history")
+            if history:
+                prompt_start = time.perf_counter()
+                output_path = os.path.join(
+                    read_write_posts.CACHE_DIR, f"{topic_id}_{job['job_id']}_prompt.md"
+                )
+                if (
+                    generate_prompt(
+                        topic_id, history, output_path=output_path, config=self.config
+                    )
+                    is None
+                ):
+                    result["status"] = "prompt生成失败"
+                result["prompt_seconds"] = time.perf_counter() - prompt_start
+        except Exception as e:
+            result["status"] = f"错误: {e}"
+            traceback.print_exc()
+        finally:
+            run_context.close()
+            result["total_seconds"] = time.perf_counter() - start
+            print(f"[{job['job_id']}] 完成: {result['status']}")
+        return result
+
+    def run(self, jobs):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self.run_job, jobs))
+
+
+def print_summary(results, elapsed):
+    """打印每个任务的耗时汇总。"""
+    print("\n" + "=" * 15 + " 批处理汇总 " + "=" * 15)
+    print(
+        f"{'job_id':<16}{'topic':>10}{'帖子数':>8}{'获取(s)':>10}"
+        f"{'prompt(s)':>11}{'总计(s)':>10}  状态"
+    )
+    for r in results:
+        print(
+            f"{r['job_id']:<16}{str(r['topic_id']):>10}{r['posts']:>8}"
+            f"{r['fetch_seconds']:>10.2f}{r['prompt_seconds']:>11.2f}"
+            f"{r['total_seconds']:>10.2f}  {r['status']}"
+        )
+    succeeded = sum(1 for r in results if r["status"] == "ok")
+    print(f"\n共 {len(results)} 个任务，成功 {succeeded} 个，总耗时 {elapsed:.2f} 秒。")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量获取帖子并生成 prompt（无界面模式）。")
+    parser.add_argument("jobs", help="JSONL 任务文件，每行包含 url 和可选的 history")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="同时处理的任务数，默认使用配置中的 BATCH_CONCURRENCY"
+    )
+    parser.add_argument("--config", default="config.yaml", help="配置文件路径")
+    args = parser.parse_args(argv)
+
+    try:
+        config = load_config(args.config)
+        jobs = load_jobs(args.jobs)
+    except (ValueError, IOError) as e:
+        print(f"错误: {e}")
+        return 1
+
+    if not jobs:
+        print("任务文件中没有有效的任务。")
+        return 1
+
+    workers = max(1, args.workers or config["BATCH_CONCURRENCY"])
+    print(
+        f"共 {len(jobs)} 个任务，并发数 {workers}，"
+        f"每个主机限速 {config['RATE_LIMIT_PER_SECOND'] or '不限'} 次/秒。\n"
+    )
+    cache_manager.cleanup(read_write_posts.CACHE_DIR, config)
+    start = time.perf_counter()
+    results = BatchRunner(config, workers).run(jobs)
+    # STALE_WHILE_REVALIDATE 启用时，等后台刷新写完缓存再退出
+    read_write_posts.wait_for_revalidation()
+    print_summary(results, time.perf_counter() - start)
+    return 0 if all(r["status"] == "ok" for r in results) else 2
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
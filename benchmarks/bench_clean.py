@@ -0,0 +1,82 @@
+# benchmarks/bench_clean.py
+
+"""
+对比旧的正则清理与 html_cleaner.html_to_text 在大型合成帖子上的耗时。
+
+用法:
+    python benchmarks/bench_clean.py [--paragraphs 2000] [--posts 50] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from html_cleaner import html_to_text
+
+
+def regex_clean(raw_content):
+    """html_cleaner 之前 clean_post_data 使用的实现。"""
+    return re.sub(
+        r"<blockquote.*?/blockquote>|<[^>]+>", "", raw_content, flags=re.DOTALL
+    ).strip()
+
+
+def make_post(paragraphs, rng):
+    """生成一个类似 Discourse cooked 的长帖子，含嵌套引用、链接、实体和中文。"""
+    parts = []
+    for i in range(paragraphs):
+        kind = rng.random()
+        if kind < 0.1:
+            parts.append(
+                '<aside class="quote" data-username="u"><div class="title">u:</div>'
+                "<blockquote><p>引用 &amp; quote</p><blockquote><p>inner</p></blockquote>"
+                "</blockquote></aside>"
+            )
+        elif kind < 0.2:
+            parts.append(
+                f'<p>链接 <a href="https://example.com/{i}">example &lt;{i}&gt;</a><br>\n第二行</p>'
+            )
+        else:
+            parts.append(
+                f"<p>DP {i}: personal, 4/24, FICO 7{i % 100:02d}, 秒批 &amp; CL 12k</p>"
+            )
+    return "\n".join(parts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--paragraphs", type=int, default=2000, help="每个帖子的段落数")
+    parser.add_argument("--posts", type=int, default=50, help="帖子数")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数，取最快一次")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    posts = [make_post(args.paragraphs, rng) for _ in range(args.posts)]
+    total_kb = sum(len(p) for p in posts) / 1024
+    print(f"{args.posts} 个帖子，每个 {args.paragraphs} 段，共 {total_kb:.0f} KB")
+
+    _run(posts, args.repeat)
+
+    # 截断或格式错误的帖子中出现大量未闭合的 <blockquote> 时，
+    # 旧正则的 .*? 会从每个 <blockquote 向后扫描到结尾，耗时随长度平方增长
+    broken = ["<blockquote><p>未闭合的引用 &amp;</p>\n" * (args.paragraphs // 4)]
+    print(f"\n1 个含 {args.paragraphs // 4} 个未闭合 <blockquote> 的帖子")
+    _run(broken, args.repeat)
+
+
+def _run(posts, repeat):
+    total_mb = sum(len(p) for p in posts) / 1024 / 1024
+    for name, func in (("regex", regex_clean), ("html_to_text", html_to_text)):
+        best = min(
+            timeit.repeat(lambda: [func(p) for p in posts], number=1, repeat=repeat)
+        )
+        print(f"{name:<14}{best * 1000:>10.1f} ms  {total_mb / best:>8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
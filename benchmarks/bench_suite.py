@@ -0,0 +1,276 @@
+# benchmarks/bench_suite.py
+
+"""
+基准测试套件：在本地 Discourse 替身服务器上测量获取和处理各阶段的耗时。
+
+用法:
+    python benchmarks/bench_suite.py [--posts 5000] [--latency-ms 20] [--output results.json]
+    python benchmarks/bench_suite.py --compare baseline.json   # 与之前的结果对比，变慢超过阈值时返回 1
+
+测试项:
+    fetch_cold         没有任何缓存时完整获取话题
+    fetch_warm         缓存有效时再次获取（读取原始缓存，派生文件已是最新）
+    fetch_expired      缓存过期后完整重新获取
+    fetch_incremental  缓存过期且话题新增回复时增量刷新
+    fetch_faulty       注入 5xx 和 429 时完整获取
+    clean_post_data    清理话题中的所有帖子
+    group_and_sort     按用户分组和排序
+    write_derived      重新生成派生文件（AI 输入文件和可读文件）
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import read_write_posts
+from fake_discourse import FakeDiscourse
+from read_write_posts import (
+    clean_post_data,
+    get_all_posts,
+    group_and_sort_replies_by_user,
+)
+
+TOPIC_ID = 1
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _quiet(func, *args, **kwargs):
+    """运行 func 并丢弃它的 print 输出。"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def _best_of(repeat, func, setup=None):
+    """运行 repeat 次，返回最快一次的秒数和该次的返回值。"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best, result = elapsed, value
+    return best, result
+
+
+class Suite:
+    def __init__(self, args):
+        self.args = args
+        self.results = {}
+        self.cache_dir = tempfile.mkdtemp(prefix="bench_cache_")
+        read_write_posts.CACHE_DIR = self.cache_dir
+        self.config = {
+            "CACHE_DURATION_HOURS": 24,
+            "MAX_RETRIES": 5,
+            "BACKOFF_FACTOR": 0.05,
+            "FETCH_CONCURRENCY": args.concurrency,
+            "FETCH_MODE": args.fetch_mode,
+            "RATE_LIMIT_PER_SECOND": 0,
+            "RAW_CACHE_FORMAT": args.raw_cache_format,
+            "RAW_CACHE_COMPRESSION": args.raw_cache_compression,
+        }
+
+    def clear_cache(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir)
+
+    def record(self, name, seconds, **extra):
+        self.results[name] = dict({"seconds": round(seconds, 6)}, **extra)
+        details = "  ".join(f"{key}={value}" for key, value in extra.items())
+        print(f"{name:<20}{seconds * 1000:>12.1f} ms  {details}")
+
+    def fetch(self, fake, **overrides):
+        fake.reset_stats()
+        config = dict(self.config, **overrides)
+        posts = _quiet(get_all_posts, fake.base_url, TOPIC_ID, config)
+        return posts, fake.requests
+
+    def run_fetch_benchmarks(self):
+        args = self.args
+        with FakeDiscourse(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms) as fake:
+            fake.add_topic(TOPIC_ID, args.posts)
+
+            seconds, (posts, requests) = _best_of(
+                args.repeat, lambda: self.fetch(fake), setup=self.clear_cache
+            )
+            self.record("fetch_cold", seconds, posts=len(posts), requests=requests)
+
+            seconds, (posts, requests) = _best_of(args.repeat, lambda: self.fetch(fake))
+            self.record("fetch_warm", seconds, posts=len(posts), requests=requests)
+
+            seconds, (posts, requests) = _best_of(
+                args.repeat, lambda: self.fetch(fake, CACHE_DURATION_HOURS=0)
+            )
+            self.record("fetch_expired", seconds, posts=len(posts), requests=requests)
+
+            def grow_topic():
+                fake.add_topic(TOPIC_ID, args.posts)
+                self.clear_cache()
+                _quiet(get_all_posts, fake.base_url, TOPIC_ID, self.config)
+                fake.add_replies(TOPIC_ID, 50)
+
+            seconds, (posts, requests) = _best_of(
+                args.repeat,
+                lambda: self.fetch(fake, CACHE_DURATION_HOURS=0, INCREMENTAL_REFRESH=True),
+                setup=grow_topic,
+            )
+            self.record("fetch_incremental", seconds, posts=len(posts), requests=requests)
+
+        with FakeDiscourse(
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate,
+            throttle_rate=args.throttle_rate,
+            retry_after=0,
+        ) as fake:
+            fake.add_topic(TOPIC_ID, args.posts)
+            seconds, (posts, requests) = _best_of(
+                args.repeat, lambda: self.fetch(fake), setup=self.clear_cache
+            )
+            self.record("fetch_faulty", seconds, posts=len(posts), requests=requests)
+
+    def run_processing_benchmarks(self):
+        args = self.args
+        posts = FakeDiscourse()
+        posts.add_topic(TOPIC_ID, args.posts)
+        all_posts = posts.topics[TOPIC_ID]
+        base_url = "https://www.uscardforum.com"
+
+        seconds, _ = _best_of(
+            args.repeat, lambda: [clean_post_data(base_url, post) for post in all_posts]
+        )
+        self.record("clean_post_data", seconds, posts=len(all_posts))
+
+        seconds, grouped = _best_of(
+            args.repeat, lambda: group_and_sort_replies_by_user(base_url, all_posts)
+        )
+        self.record("group_and_sort", seconds, users=len(grouped))
+
+        def remove_manifest():
+            path = os.path.join(self.cache_dir, "internal", f"{TOPIC_ID}_manifest.json")
+            if os.path.exists(path):
+                os.remove(path)
+
+        seconds, _ = _best_of(
+            args.repeat,
+            lambda: _quiet(
+                read_write_posts._write_derived_files,
+                TOPIC_ID,
+                base_url,
+                all_posts,
+                config=self.config,
+            ),
+            setup=remove_manifest,
+        )
+        self.record("write_derived", seconds, posts=len(all_posts))
+
+    def run(self):
+        try:
+            self.run_fetch_benchmarks()
+            self.run_processing_benchmarks()
+        finally:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+        return {
+            "meta": {
+                "revision": _git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "params": vars(self.args),
+            },
+            "results": self.results,
+        }
+
+
+def compare(baseline, current, threshold):
+    """打印与基线结果的对比，返回变慢超过 threshold（比例）的测试项列表。"""
+    print(
+        f"\n与基线 {baseline['meta'].get('revision')} 对比 "
+        f"(变慢超过 {threshold:.0%} 视为退化):"
+    )
+    regressions = []
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"{name:<20}{'(基线中没有)':>16}")
+            continue
+        ratio = result["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  <-- 退化"
+            regressions.append(name)
+        print(
+            f"{name:<20}{old['seconds'] * 1000:>10.1f} -> {result['seconds'] * 1000:>10.1f} ms"
+            f"  x{ratio:.2f}{flag}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posts", type=int, default=5000, help="合成话题的帖子数")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最快一次")
+    parser.add_argument("--latency-ms", type=float, default=20, help="每个请求的固定延迟")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="每个请求的随机抖动上限")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="fetch_faulty 中 5xx 的比例")
+    parser.add_argument(
+        "--throttle-rate", type=float, default=0.05, help="fetch_faulty 中 429 的比例"
+    )
+    parser.add_argument("--concurrency", type=int, default=4, help="FETCH_CONCURRENCY")
+    parser.add_argument("--fetch-mode", choices=("pages", "stream"), default="pages")
+    parser.add_argument("--raw-cache-format", choices=("json", "compact"), default="compact")
+    parser.add_argument(
+        "--raw-cache-compression", choices=("none", "gzip", "lzma"), default="gzip"
+    )
+    parser.add_argument("--output", help="把结果写入 JSON 文件，供以后对比")
+    parser.add_argument("--compare", help="要对比的基线结果文件")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="判定为退化的变慢比例，默认 0.2"
+    )
+    args = parser.parse_args(argv)
+
+    print(
+        f"合成话题 {args.posts} 个帖子，请求延迟 {args.latency_ms:g}±{args.jitter_ms:g} ms，"
+        f"并发 {args.concurrency}，每项取 {args.repeat} 次中最快一次\n"
+    )
+    current = Suite(args).run()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(baseline, current, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+# benchmarks/fake_discourse.py
+
+"""
+本地的 Discourse 替身服务器，用于在不访问 uscardforum.com 的情况下测量获取性能。
+
+支持的接口（与程序实际用到的一致）:
+    /t/{topic_id}.json?page=N          每页 page_size 个帖子；第 1 页带 posts_count 和 post_stream.stream
+    /t/{topic_id}/posts.json?post_ids[]=...   按 id 批量返回帖子
+
+可以注入固定延迟和随机抖动、随机的 5xx 错误，以及带 Retry-After 的 429 限流响应。
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+_DP_LINES = (
+    "personal or biz? personal\napproved or rejected or pop-up window? approved",
+    "x/24 status? {x24}/24, FICO {fico}, income {income}k",
+    "秒批 CL {cl}k，信用历史 {years} 年",
+    "被拒了，{x24}/24，recon 也没用",
+)
+
+
+def make_topic(topic_id, post_count, seed=0):
+    """
+    生成一个合成话题的帖子列表。帖子内容是类似 DP 的 cooked HTML，含引用、链接和实体，
+    并带上真实接口中占体积的冗余字段（头像、actions_summary 等）。
+    """
+    rng = random.Random(seed)
+    posts = []
+    for number in range(1, post_count + 1):
+        user_id = rng.randrange(1, max(2, post_count // 4))
+        paragraphs = [
+            "<p>"
+            + rng.choice(_DP_LINES).format(
+                x24=rng.randrange(0, 12),
+                fico=rng.randrange(650, 830),
+                income=rng.randrange(40, 400),
+                cl=rng.randrange(2, 50),
+                years=rng.randrange(1, 15),
+            ).replace("\n", "<br>\n")
+            + "</p>"
+            for _ in range(rng.randrange(1, 6))
+        ]
+        if number > 1 and rng.random() < 0.3:
+            paragraphs.insert(
+                0,
+                f'<aside class="quote" data-post="{number - 1}"><div class="title">u:</div>'
+                "<blockquote><p>引用上一楼 &amp; 内容</p></blockquote></aside>",
+            )
+        if rng.random() < 0.2:
+            paragraphs.append(
+                f'<p><a href="https://example.com/{number}">链接 &lt;{number}&gt;</a></p>'
+            )
+        posts.append(
+            {
+                "id": topic_id * 1000000 + number,
+                "topic_id": topic_id,
+                "post_number": number,
+                "user_id": user_id,
+                "username": f"user{user_id}",
+                "name": f"User {user_id}",
+                "avatar_template": f"/user_avatar/example.com/user{user_id}/{{size}}/1_2.png",
+                "created_at": time.strftime(
+                    "%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(1600000000 + number * 3600)
+                ),
+                "updated_at": time.strftime(
+                    "%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(1600000000 + number * 3600)
+                ),
+                "version": 1,
+                "reply_to_post_number": None,
+                "reads": rng.randrange(10, 500),
+                "score": rng.random() * 100,
+                "actions_summary": [{"id": 2, "count": rng.randrange(0, 5)}],
+                "link_counts": [],
+                "cooked": "\n".join(paragraphs),
+            }
+        )
+    return posts
+
+
+class FakeDiscourse:
+    """
+    在后台线程中运行的替身服务器。
+
+    latency_ms / jitter_ms: 每个请求的固定延迟和随机抖动（毫秒）
+    error_rate: 返回 500/502/504 的概率
+    throttle_rate: 返回 429 的概率，响应带 Retry-After: retry_after 秒
+    """
+
+    def __init__(
+        self,
+        page_size=20,
+        latency_ms=0,
+        jitter_ms=0,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        retry_after=1,
+        seed=0,
+    ):
+        self.topics = {}
+        self.page_size = page_size
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.bytes_sent = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def add_topic(self, topic_id, post_count, seed=0):
+        self.topics[topic_id] = make_topic(topic_id, post_count, seed)
+
+    def add_replies(self, topic_id, count):
+        """在话题末尾追加 count 个新回复，模拟缓存过期期间的新帖子。"""
+        posts = self.topics[topic_id]
+        new_posts = make_topic(topic_id, len(posts) + count, seed=len(posts))[len(posts) :]
+        posts.extend(new_posts)
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = 0
+            self.bytes_sent = 0
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, port=0):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _decide(self):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency_ms + self._rng.uniform(0, self.jitter_ms)
+            roll = self._rng.random()
+        if roll < self.throttle_rate:
+            return delay, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, self._rng.choice((500, 502, 504))
+        return delay, 200
+
+    def _send(self, handler, status, body=None, headers=()):
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+        with self._lock:
+            self.bytes_sent += len(data)
+
+    def _handle(self, handler):
+        delay_ms, status = self._decide()
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        if status == 429:
+            self._send(handler, 429, headers=(("Retry-After", str(self.retry_after)),))
+            return
+        if status != 200:
+            self._send(handler, status)
+            return
+
+        url = urlsplit(handler.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+        try:
+            topic_id = int(parts[1].split(".")[0])
+        except (IndexError, ValueError):
+            self._send(handler, 404)
+            return
+        posts = self.topics.get(topic_id)
+        if posts is None or parts[0] != "t":
+            self._send(handler, 404)
+            return
+
+        if len(parts) == 3 and parts[2] == "posts.json":
+            wanted = {int(post_id) for post_id in query.get("post_ids[]", [])}
+            body = {"post_stream": {"posts": [p for p in posts if p["id"] in wanted]}}
+        else:
+            page = int(query.get("page", ["1"])[0])
+            start = (page - 1) * self.page_size
+            body = {
+                "posts_count": len(posts),
+                "post_stream": {"posts": posts[start : start + self.page_size]},
+            }
+            if page == 1:
+                body["post_stream"]["stream"] = [p["id"] for p in posts]
+        self._send(handler, 200, body)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="启动本地的 Discourse 替身服务器。")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--posts", type=int, default=1000, help="话题 1 的帖子数")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeDiscourse(
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+    )
+    fake.add_topic(1, args.posts)
+    fake.start(args.port)
+    print(f"已在 {fake.base_url} 启动，话题地址: {fake.base_url}/t/topic/1 (Ctrl+C 退出)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,268 @@
+# cache_manager.py
+
+"""
+缓存目录的容量和过期管理。
+
+缓存按话题分组：cache/ 和 cache/internal/ 中以 "{topic_id}_" 开头的文件属于同一个话题，
+一起保留或一起删除。cache/internal/cache_index.json 记录每个话题最近一次被使用的时间，
+清理时先删除超过最长保留时间的话题，总大小仍超过上限时再按最近最少使用 (LRU) 的顺序删除。
+SQLite 帖子库 (cache/internal/posts.sqlite3) 的文件大小计入总大小，其中每个话题的数据
+与该话题的文件一起删除。cache/metrics/ 中的运行指标只按保留时间清理。
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from post_store import open_store
+
+INDEX_NAME = "cache_index.json"
+STORE_NAME = "posts.sqlite3"
+
+# 单个话题为 "{topic_id}_"，多话题合并结果为 "{topic_id}+{topic_id}_"
+_TOPIC_FILE = re.compile(r"^(\d+(?:\+\d+)*)_")
+_index_lock = threading.Lock()
+# 正在处理中的话题 {topic_id: 嵌套或并发的 in_use 次数}，清理时跳过
+_active_topics = Counter()
+
+
+def _index_path(cache_dir):
+    return os.path.join(cache_dir, "internal", INDEX_NAME)
+
+
+def _load_index(cache_dir):
+    try:
+        with open(_index_path(cache_dir), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        return index if isinstance(index, dict) else {}
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _save_index(cache_dir, index):
+    path = _index_path(cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(temp_path, path)
+
+
+def touch(cache_dir, topic_id):
+    """记录话题刚被使用过。"""
+    with _index_lock:
+        index = _load_index(cache_dir)
+        index[str(topic_id)] = time.time()
+        try:
+            _save_index(cache_dir, index)
+        except (IOError, OSError) as e:
+            print(f"警告: 无法更新缓存索引: {e}")
+
+
+@contextmanager
+def in_use(topic_id):
+    """with cache_manager.in_use(topic_id): 期间该话题的缓存不会被清理。"""
+    topic_id = str(topic_id)
+    with _index_lock:
+        _active_topics[topic_id] += 1
+    try:
+        yield
+    finally:
+        with _index_lock:
+            _active_topics[topic_id] -= 1
+            if _active_topics[topic_id] <= 0:
+                del _active_topics[topic_id]
+
+
+def _scan_topics(cache_dir):
+    """返回 {topic_id: {"files": [路径], "size": 字节数, "mtime": 最近修改时间}}。"""
+    topics = {}
+    for directory in (cache_dir, os.path.join(cache_dir, "internal")):
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            match = _TOPIC_FILE.match(entry.name)
+            if not match or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            topic = topics.setdefault(
+                match.group(1), {"files": [], "size": 0, "mtime": 0.0}
+            )
+            topic["files"].append(entry.path)
+            topic["size"] += stat.st_size
+            topic["mtime"] = max(topic["mtime"], stat.st_mtime)
+    return topics
+
+
+def _store_path(cache_dir):
+    return os.path.join(cache_dir, "internal", STORE_NAME)
+
+
+def _store_file_size(path):
+    """帖子库文件和 WAL 文件的总字节数。"""
+    total = 0
+    for suffix in ("", "-wal"):
+        try:
+            total += os.path.getsize(path + suffix)
+        except OSError:
+            pass
+    return total
+
+
+def _scan_store(cache_dir, topics):
+    """
+    把 SQLite 帖子库中各话题占用的空间计入 topics，返回无法归到任何话题的字节数。
+    没有帖子库时返回 0。
+    """
+    path = _store_path(cache_dir)
+    if not os.path.exists(path):
+        return 0
+    total = _store_file_size(path)
+    try:
+        sizes = open_store(path).topic_sizes()
+    except sqlite3.Error as e:
+        print(f"警告: 无法读取 SQLite 帖子库，清理时不计入其中的话题: {e}")
+        return total
+    # 数据量只是估计值，按比例放大到帖子库文件的实际大小，索引和空闲页也分摊到各话题
+    estimated = sum(size for size, _ in sizes.values())
+    scale = total / estimated if estimated else 0
+    for topic_id, (size, fetched_at) in sizes.items():
+        topic = topics.setdefault(topic_id, {"files": [], "size": 0, "mtime": 0.0})
+        topic["store_size"] = int(size * scale)
+        topic["size"] += topic["store_size"]
+        topic["mtime"] = max(topic["mtime"], fetched_at or 0.0)
+    return 0 if estimated else total
+
+
+def _remove_from_store(cache_dir, topic_ids):
+    """删除 SQLite 帖子库中这些话题的数据，返回释放的字节数。"""
+    path = _store_path(cache_dir)
+    if not topic_ids or not os.path.exists(path):
+        return 0
+    before = _store_file_size(path)
+    try:
+        open_store(path).delete_topics(topic_ids)
+    except sqlite3.Error as e:
+        print(f"警告: 无法从 SQLite 帖子库中删除话题: {e}")
+        return 0
+    return max(0, before - _store_file_size(path))
+
+
+def _remove_files(paths):
+    freed = 0
+    for path in paths:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            freed += size
+        except OSError:
+            pass
+    return freed
+
+
+def enforce_limits(cache_dir, max_bytes=0, max_age_seconds=0):
+    """
+    按保留时间和总大小清理缓存目录。max_bytes、max_age_seconds 为 0 表示不限制。
+    返回 (删除的话题数, 释放的字节数)。
+    """
+    now = time.time()
+    # 扫描前记下正在使用的话题；扫描期间才开始使用的话题在删除前还会再检查一次
+    with _index_lock:
+        active = set(_active_topics)
+    topics = _scan_topics(cache_dir)
+    store_overhead = _scan_store(cache_dir, topics)
+    with _index_lock:
+        index = _load_index(cache_dir)
+
+    def last_used(topic_id):
+        # 索引中没有记录的话题（如升级前留下的缓存）以文件的修改时间为准
+        return max(index.get(topic_id, 0), topics[topic_id]["mtime"])
+
+    candidates = sorted((t for t in topics if t not in active), key=last_used)
+    evicted = []
+    if max_age_seconds:
+        evicted = [t for t in candidates if now - last_used(t) > max_age_seconds]
+    total = store_overhead + sum(topic["size"] for topic in topics.values())
+    total -= sum(topics[t]["size"] for t in evicted)
+    if max_bytes:
+        for topic_id in candidates:
+            if total <= max_bytes:
+                break
+            if topic_id not in evicted:
+                evicted.append(topic_id)
+                total -= topics[topic_id]["size"]
+
+    freed = 0
+    removed = []
+    for topic_id in evicted:
+        # 持有锁时再确认一次，清理过程中开始使用的话题保留，删除期间也不会有新的使用者
+        with _index_lock:
+            if topic_id in _active_topics:
+                continue
+            freed += _remove_files(topics[topic_id]["files"])
+        removed.append(topic_id)
+    with _index_lock:
+        freed += _remove_from_store(
+            cache_dir,
+            [
+                t
+                for t in removed
+                if topics[t].get("store_size") and t not in _active_topics
+            ],
+        )
+
+    if max_age_seconds:
+        metrics_dir = os.path.join(cache_dir, "metrics")
+        try:
+            old_metrics = [
+                entry.path
+                for entry in os.scandir(metrics_dir)
+                if entry.is_file() and now - entry.stat().st_mtime > max_age_seconds
+            ]
+        except OSError:
+            old_metrics = []
+        freed += _remove_files(old_metrics)
+
+    if removed:
+        with _index_lock:
+            index = _load_index(cache_dir)
+            for topic_id in removed:
+                index.pop(topic_id, None)
+            try:
+                _save_index(cache_dir, index)
+            except (IOError, OSError):
+                pass
+    return len(removed), freed
+
+
+def cleanup(cache_dir, config):
+    """按配置中的 CACHE_MAX_SIZE_MB 和 CACHE_MAX_AGE_DAYS 清理缓存，并打印结果。"""
+    max_bytes = int(config.get("CACHE_MAX_SIZE_MB", 0) * 1024 * 1024)
+    max_age_seconds = config.get("CACHE_MAX_AGE_DAYS", 0) * 86400
+    if not max_bytes and not max_age_seconds:
+        return 0, 0
+    start = time.perf_counter()
+    evicted, freed = enforce_limits(cache_dir, max_bytes, max_age_seconds)
+    if evicted:
+        print(
+            f"缓存清理: 删除了 {evicted} 个话题的缓存，释放 {freed / 1024 / 1024:.1f} MB "
+            f"(耗时 {(time.perf_counter() - start) * 1000:.0f} 毫秒)。"
+        )
+    return evicted, freed
+
+
+def start_background_cleanup(cache_dir, config):
+    """在后台线程中清理缓存，不阻塞界面启动。"""
+    thread = threading.Thread(target=cleanup, args=(cache_dir, config), daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,67 @@
+# cancellation.py
+
+"""
+取消令牌：让 GUI 中排队的分析任务可以中途停止。
+
+用 scope(token) 包住一次任务，期间获取帖子的请求和重试循环会调用 check()，
+令牌被取消后在下一个请求之前抛出 Cancelled；重试前的等待也会被立即打断。
+当前令牌保存在 contextvars 中，与 metrics 一样随 contextvars.copy_context().run 传到线程池。
+没有令牌时 check() 直接返回。
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+_current_token = contextvars.ContextVar("cancel_token", default=None)
+
+
+class Cancelled(Exception):
+    """任务已被取消。"""
+
+    def __init__(self):
+        super().__init__("任务已取消。")
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, seconds):
+        """最多等待 seconds 秒，期间被取消时提前返回 True。"""
+        return self._event.wait(seconds)
+
+
+@contextmanager
+def scope(token):
+    """with cancellation.scope(token): 期间的 check() 和 sleep() 都以 token 为准。"""
+    reset_token = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset_token)
+
+
+def check():
+    """当前任务已被取消时抛出 Cancelled。"""
+    token = _current_token.get()
+    if token is not None and token.cancelled:
+        raise Cancelled()
+
+
+def sleep(seconds):
+    """可以被取消打断的 time.sleep。被取消时抛出 Cancelled。"""
+    token = _current_token.get()
+    if token is None:
+        time.sleep(seconds)
+        return
+    if token.wait(seconds):
+        raise Cancelled()
@@ -0,0 +1,218 @@
+# config_loader.py
+
+import os
+
+import yaml
+
+import time_window
+from read_write_posts import get_persistent_path
+
+
+# {配置文件路径: (修改时间, 验证后的配置)}
+_config_cache = {}
+
+
+def load_config(path="config.yaml"):
+    """
+    加载并验证YAML配置文件。
+    文件未修改时复用上次解析和验证的结果，每次返回一份副本，调用方修改它不会影响缓存。
+    """
+    config_path = get_persistent_path(path)
+    try:
+        mtime = os.path.getmtime(config_path)
+    except OSError as e:
+        raise ValueError(f"无法加载或解析配置文件 '{config_path}': {e}")
+    cached = _config_cache.get(config_path)
+    if cached is not None and cached[0] == mtime:
+        return dict(cached[1])
+
+    config = _parse_config(path, config_path)
+    _config_cache[config_path] = (mtime, config)
+    return dict(config)
+
+
+def _parse_config(path, config_path):
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+    except (IOError, yaml.YAMLError) as e:
+        # 抛出异常而不是打印和退出
+        raise ValueError(f"无法加载或解析配置文件 '{config_path}': {e}")
+
+    if "CACHE_DURATION_HOURS" not in config or not isinstance(
+        config["CACHE_DURATION_HOURS"], int
+    ):
+        raise ValueError(f"配置文件 '{path}' 中缺少或无效的 'CACHE_DURATION_HOURS'。")
+    if "BASE_URL" not in config or not isinstance(config["BASE_URL"], str):
+        raise ValueError(f"配置文件 '{path}' 中缺少或无效的 'BASE_URL'。")
+    if "MAX_RETRIES" not in config or not isinstance(config["MAX_RETRIES"], int):
+        config["MAX_RETRIES"] = 5
+    if "BACKOFF_FACTOR" not in config or not isinstance(
+        config["BACKOFF_FACTOR"], (int, float)
+    ):
+        config["BACKOFF_FACTOR"] = 1
+    if (
+        "FETCH_CONCURRENCY" not in config
+        or not isinstance(config["FETCH_CONCURRENCY"], int)
+        or config["FETCH_CONCURRENCY"] < 1
+    ):
+        config["FETCH_CONCURRENCY"] = 1
+    if config.get("FETCH_MODE") not in ("pages", "stream"):
+        config["FETCH_MODE"] = "pages"
+    if (
+        "POST_ID_BATCH_SIZE" not in config
+        or not isinstance(config["POST_ID_BATCH_SIZE"], int)
+        or config["POST_ID_BATCH_SIZE"] < 1
+    ):
+        config["POST_ID_BATCH_SIZE"] = 100
+    if "USE_SQLITE_STORE" not in config or not isinstance(
+        config["USE_SQLITE_STORE"], bool
+    ):
+        config["USE_SQLITE_STORE"] = False
+    if "INCREMENTAL_REFRESH" not in config or not isinstance(
+        config["INCREMENTAL_REFRESH"], bool
+    ):
+        config["INCREMENTAL_REFRESH"] = False
+    if (
+        "INCREMENTAL_REFETCH_PAGES" not in config
+        or not isinstance(config["INCREMENTAL_REFETCH_PAGES"], int)
+        or config["INCREMENTAL_REFETCH_PAGES"] < 0
+    ):
+        config["INCREMENTAL_REFETCH_PAGES"] = 1
+    if (
+        "FULL_REFRESH_EVERY_DAYS" not in config
+        or not isinstance(config["FULL_REFRESH_EVERY_DAYS"], (int, float))
+        or config["FULL_REFRESH_EVERY_DAYS"] < 0
+    ):
+        config["FULL_REFRESH_EVERY_DAYS"] = 7
+    if (
+        "GUI_CONCURRENCY" not in config
+        or not isinstance(config["GUI_CONCURRENCY"], int)
+        or config["GUI_CONCURRENCY"] < 1
+    ):
+        config["GUI_CONCURRENCY"] = 2
+    if (
+        "BATCH_CONCURRENCY" not in config
+        or not isinstance(config["BATCH_CONCURRENCY"], int)
+        or config["BATCH_CONCURRENCY"] < 1
+    ):
+        config["BATCH_CONCURRENCY"] = 2
+    if "RATE_LIMIT_PER_SECOND" not in config or not isinstance(
+        config["RATE_LIMIT_PER_SECOND"], (int, float)
+    ):
+        config["RATE_LIMIT_PER_SECOND"] = 5
+    for key in ("RATE_LIMIT_MIN_PER_SECOND", "RATE_LIMIT_MAX_PER_SECOND"):
+        if key in config and not (
+            isinstance(config[key], (int, float)) and config[key] > 0
+        ):
+            del config[key]
+    if (
+        "RETRY_AFTER_MAX_SECONDS" not in config
+        or not isinstance(config["RETRY_AFTER_MAX_SECONDS"], (int, float))
+        or config["RETRY_AFTER_MAX_SECONDS"] < 0
+    ):
+        config["RETRY_AFTER_MAX_SECONDS"] = 120
+    if "ENABLE_RELEVANCE_FILTER" not in config or not isinstance(
+        config["ENABLE_RELEVANCE_FILTER"], bool
+    ):
+        config["ENABLE_RELEVANCE_FILTER"] = False
+    if (
+        "RELEVANCE_TOP_K" not in config
+        or not isinstance(config["RELEVANCE_TOP_K"], int)
+        or config["RELEVANCE_TOP_K"] < 1
+    ):
+        config["RELEVANCE_TOP_K"] = 200
+    if (
+        "RELEVANCE_MAX_CHARS" not in config
+        or not isinstance(config["RELEVANCE_MAX_CHARS"], int)
+        or config["RELEVANCE_MAX_CHARS"] < 1
+    ):
+        config["RELEVANCE_MAX_CHARS"] = 60000
+    if "ENABLE_DEDUP" not in config or not isinstance(config["ENABLE_DEDUP"], bool):
+        config["ENABLE_DEDUP"] = False
+    if (
+        "DEDUP_THRESHOLD" not in config
+        or not isinstance(config["DEDUP_THRESHOLD"], (int, float))
+        or not 0 < config["DEDUP_THRESHOLD"] <= 1
+    ):
+        config["DEDUP_THRESHOLD"] = 0.8
+    for key in ("DP_SINCE", "DP_UNTIL"):
+        if config.get(key) in (None, ""):
+            config[key] = ""
+            continue
+        try:
+            time_window.parse_date(config[key])
+        except ValueError as e:
+            raise ValueError(f"配置文件 '{path}' 中的 '{key}' 无效: {e}")
+    if (
+        "RECENCY_HALF_LIFE_DAYS" not in config
+        or not isinstance(config["RECENCY_HALF_LIFE_DAYS"], (int, float))
+        or config["RECENCY_HALF_LIFE_DAYS"] < 0
+    ):
+        config["RECENCY_HALF_LIFE_DAYS"] = 0
+    if "ENABLE_DP_EXTRACTION" not in config or not isinstance(
+        config["ENABLE_DP_EXTRACTION"], bool
+    ):
+        config["ENABLE_DP_EXTRACTION"] = False
+    if (
+        "DP_EXTRACT_WORKERS" not in config
+        or not isinstance(config["DP_EXTRACT_WORKERS"], int)
+        or config["DP_EXTRACT_WORKERS"] < 1
+    ):
+        config["DP_EXTRACT_WORKERS"] = 1
+    if (
+        "DP_EXTRACT_PARALLEL_THRESHOLD" not in config
+        or not isinstance(config["DP_EXTRACT_PARALLEL_THRESHOLD"], int)
+        or config["DP_EXTRACT_PARALLEL_THRESHOLD"] < 1
+    ):
+        config["DP_EXTRACT_PARALLEL_THRESHOLD"] = 5000
+    if "ENABLE_PROMPT_BUDGET" not in config or not isinstance(
+        config["ENABLE_PROMPT_BUDGET"], bool
+    ):
+        config["ENABLE_PROMPT_BUDGET"] = False
+    if (
+        "PROMPT_TOKEN_BUDGET" not in config
+        or not isinstance(config["PROMPT_TOKEN_BUDGET"], int)
+        or config["PROMPT_TOKEN_BUDGET"] < 1
+    ):
+        config["PROMPT_TOKEN_BUDGET"] = 32000
+    if (
+        "PROMPT_MAX_CHUNKS" not in config
+        or not isinstance(config["PROMPT_MAX_CHUNKS"], int)
+        or config["PROMPT_MAX_CHUNKS"] < 1
+    ):
+        config["PROMPT_MAX_CHUNKS"] = 3
+    if config.get("RAW_CACHE_FORMAT") not in ("json", "compact"):
+        config["RAW_CACHE_FORMAT"] = "json"
+    if config.get("RAW_CACHE_COMPRESSION") not in ("none", "gzip", "lzma"):
+        config["RAW_CACHE_COMPRESSION"] = "none"
+    if "STALE_WHILE_REVALIDATE" not in config or not isinstance(
+        config["STALE_WHILE_REVALIDATE"], bool
+    ):
+        config["STALE_WHILE_REVALIDATE"] = False
+    if "STREAMING_PIPELINE" not in config or not isinstance(
+        config["STREAMING_PIPELINE"], bool
+    ):
+        config["STREAMING_PIPELINE"] = False
+    # 缺少这两项时不限制缓存；随附的 config.yaml 中启用了上限
+    for key in ("CACHE_MAX_SIZE_MB", "CACHE_MAX_AGE_DAYS"):
+        if (
+            key not in config
+            or not isinstance(config[key], (int, float))
+            or config[key] < 0
+        ):
+            config[key] = 0
+    if "PERSIST_SESSION" not in config or not isinstance(
+        config["PERSIST_SESSION"], bool
+    ):
+        config["PERSIST_SESSION"] = False
+    if (
+        "SESSION_MAX_AGE_HOURS" not in config
+        or not isinstance(config["SESSION_MAX_AGE_HOURS"], (int, float))
+        or config["SESSION_MAX_AGE_HOURS"] <= 0
+    ):
+        config["SESSION_MAX_AGE_HOURS"] = 24
+    for key in ("ENABLE_METRICS", "METRICS_PROFILE"):
+        if key not in config or not isinstance(config[key], bool):
+            config[key] = False
+    return config
@@ -0,0 +1,176 @@
+# dedup.py
+
+"""
+近似重复回复的合并。
+
+DP 帖中常见 "+1 同"、重复转发的 DP 和稍作修改后重发的同一份报告。
+每条回复去掉空白和标点后切成字符 n-gram（对没有空格分词的中文同样适用），
+用单次哈希分桶的 MinHash 计算签名，再按 LSH 分段找出候选，
+最后用精确的 Jaccard 相似度确认。整体耗时与回复数大致成线性关系。
+"""
+
+import re
+import zlib
+
+# 签名长度 = BANDS * ROWS；相似度 0.8 的两条回复成为候选的概率约 99.98%
+BANDS = 16
+ROWS = 4
+SIGNATURE_SIZE = BANDS * ROWS
+SHINGLE_SIZE = 3
+
+_NON_WORD = re.compile(r"[\W_]+")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_EMPTY_BIN = -1
+
+
+def _shingles_of(normalized, size=SHINGLE_SIZE):
+    """返回已规范化文本的字符 n-gram 集合。短于 size 的文本整体作为一个 n-gram。"""
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i : i + size] for i in range(len(normalized) - size + 1)}
+
+
+def minhash_signature(shingle_set):
+    """
+    单次哈希 MinHash：每个 n-gram 只算一次 crc32，按低位分到 SIGNATURE_SIZE 个桶中各取最小值，
+    空桶借用后面最近的非空桶的值（加上距离以示区分）。
+    """
+    bins = [_EMPTY_BIN] * SIGNATURE_SIZE
+    # 从小到大遍历哈希值，每个桶第一次遇到的就是最小值
+    for h in sorted(zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set):
+        index = h % SIGNATURE_SIZE
+        if bins[index] == _EMPTY_BIN:
+            bins[index] = h // SIGNATURE_SIZE
+    if _EMPTY_BIN in bins and any(value != _EMPTY_BIN for value in bins):
+        densified = list(bins)
+        for index in range(SIGNATURE_SIZE):
+            if bins[index] != _EMPTY_BIN:
+                continue
+            distance = 1
+            while bins[(index + distance) % SIGNATURE_SIZE] == _EMPTY_BIN:
+                distance += 1
+            densified[index] = (
+                bins[(index + distance) % SIGNATURE_SIZE] + distance * (1 << 32)
+            )
+        bins = densified
+    return bins
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def find_duplicates(texts, threshold=0.8):
+    """
+    返回与 texts 等长的列表：第 i 项是 texts[i] 所归入的代表文本的下标，代表自身指向自己。
+    每条文本只与已有的代表比较，代表总是组内最早出现的那条。
+    除相似度外还要求两条文本中的数字完全相同，避免把模板相同、数据不同的 DP 当作重复。
+    空文本（如只有图片的回复）不参与合并。
+    """
+    representative = list(range(len(texts)))
+    # {(段号, 数字, 段内签名): [代表下标]}
+    buckets = {}
+    rep_shingles = {}
+    # 规范化后完全相同的文本（"+1"、原样转发）直接归入第一次出现的那条，不必计算签名
+    exact = {}
+    for index, text in enumerate(texts):
+        normalized = _NON_WORD.sub("", text.lower())
+        if not normalized:
+            continue
+        previous = exact.get(normalized)
+        if previous is not None:
+            representative[index] = representative[previous]
+            continue
+        exact[normalized] = index
+        shingle_set = _shingles_of(normalized)
+        # 数字也作为分桶键的一部分：数字不同的文本不会成为候选，
+        # 模板相同而数据不同的大量 DP 不会挤在同一个桶里
+        numbers = tuple(_NUMBER.findall(text))
+        signature = minhash_signature(shingle_set)
+        keys = [
+            (band, numbers, tuple(signature[band * ROWS : (band + 1) * ROWS]))
+            for band in range(BANDS)
+        ]
+
+        checked = set()
+        match = None
+        for key in keys:
+            for candidate in buckets.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if jaccard(shingle_set, rep_shingles[candidate]) >= threshold:
+                    match = candidate
+                    break
+            if match is not None:
+                break
+
+        if match is not None:
+            representative[index] = match
+            continue
+        rep_shingles[index] = shingle_set
+        for key in keys:
+            buckets.setdefault(key, []).append(index)
+    return representative
+
+
+def _post_number(reply):
+    return reply.get("post_number", 0)
+
+
+def collapse_near_duplicates(grouped_data, threshold=0.8, order_key=_post_number):
+    """
+    合并按用户分组的回复中的近似重复项，格式与 group_and_sort_replies_by_user 的结果相同。
+    按 order_key（默认为楼层号）的顺序比较，每组只保留最早的一条，
+    并在其上记录 duplicate_count（被合并的回复数）；回复全部被合并掉的用户随之移除。
+    返回 (合并后的数据, 统计信息字典)。
+    """
+    replies = sorted(
+        (reply for user_data in grouped_data for reply in user_data.get("replies", [])),
+        key=order_key,
+    )
+    texts = [reply.get("reply_content", "") for reply in replies]
+    representative = find_duplicates(texts, threshold)
+
+    # {id(原回复): 替换后的回复，被合并掉的为 None}
+    replacements = {}
+    duplicate_counts = {}
+    removed = 0
+    removed_chars = 0
+    for index, rep_index in enumerate(representative):
+        if rep_index != index:
+            # 被合并的回复本身已经合并过其他回复时（如多个话题的合并结果），计数一并累加
+            duplicate_counts[rep_index] = (
+                duplicate_counts.get(rep_index, 0)
+                + 1
+                + replies[index].get("duplicate_count", 0)
+            )
+            replacements[id(replies[index])] = None
+            removed += 1
+            removed_chars += len(texts[index])
+    for rep_index, count in duplicate_counts.items():
+        reply = replies[rep_index]
+        replacements[id(reply)] = dict(
+            reply, duplicate_count=reply.get("duplicate_count", 0) + count
+        )
+
+    collapsed = []
+    for user_data in grouped_data:
+        user_replies = []
+        for reply in user_data.get("replies", []):
+            reply = replacements.get(id(reply), reply)
+            if reply is not None:
+                user_replies.append(reply)
+        if user_replies:
+            collapsed.append(dict(user_data, replies=user_replies))
+
+    stats = {
+        "replies_before": len(replies),
+        "replies_after": len(replies) - removed,
+        "groups": len(duplicate_counts),
+        "chars_before": sum(len(text) for text in texts),
+        "chars_removed": removed_chars,
+    }
+    return collapsed, stats
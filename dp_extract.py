@@ -0,0 +1,340 @@
+# dp_extract.py
+
+import json
+import math
+import os
+import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+# 提取规则有变化时递增，缓存的 DP 表会随之重建
+EXTRACTOR_VERSION = 2
+
+RESULT_CODES = {"approved": 1, "denied": 2, "pending": 3}
+ACCOUNT_TYPE_CODES = {"personal": 1, "business": 2}
+_RESULT_NAMES = {code: name for name, code in RESULT_CODES.items()}
+_ACCOUNT_TYPE_NAMES = {code: name for name, code in ACCOUNT_TYPE_CODES.items()}
+
+# 数值列用 array('d') 存储，缺失值为 NaN；整数列用 array('q')；类别列用 array('b') 存编码，0 表示缺失
+NUMERIC_COLUMNS = ("x24", "fico", "income_k", "account_age_years")
+INTEGER_COLUMNS = ("post_number", "user_id")
+CODE_COLUMNS = ("result", "account_type")
+STRING_COLUMNS = ("card", "dp_date")
+
+_FLAGS = re.IGNORECASE
+
+# DP 模板中的问句本身就包含 approved/rejected、personal/biz 等关键词，先取出问句后面的回答
+_RESULT_QUESTION = re.compile(r"approved or rejected[^\n?？:：]*[?？:：]([^\n]*)", _FLAGS)
+_TYPE_QUESTION = re.compile(r"personal or biz[^\n?？:：]*[?？:：]([^\n]*)", _FLAGS)
+_TEMPLATE_QUESTIONS = re.compile(
+    r"approved or rejected[^\n?？:：]*[?？:：]?|personal or biz[^\n?？:：]*[?？:：]?", _FLAGS
+)
+
+_APPROVED = re.compile(r"approv|秒批|批了|获批|已批|下卡|批准|\bapp?d\b", _FLAGS)
+_DENIED = re.compile(r"denied|reject|declin|被拒|拒了|拒信|拒绝|秒拒|没批|未批", _FLAGS)
+_PENDING = re.compile(r"pending|pop.?up|挂起|待定|审核中", _FLAGS)
+# recon 本身不是结果："被拒 recon 批了" 以后面的批准为准，"被拒了，recon 也没用" 仍是被拒；
+# 只有回答中没有其他结果词时（如 "等 recon"）才视为待定
+_RECON = re.compile(r"recon", _FLAGS)
+# 紧挨在批准词前面的否定词，如 "not approved"、"没有获批"、"未获批准"
+_NEGATION = re.compile(r"(?:\bnot|\bnever|没有?|未|没能)\s*(?:been\s+|be\s+|被)?$", _FLAGS)
+_PERSONAL = re.compile(r"personal|个人卡?|私人卡", _FLAGS)
+_BUSINESS = re.compile(r"\bbiz\b|business|商业卡?|公司卡", _FLAGS)
+
+_X24 = re.compile(r"(?<!\d)(\d{1,2})\s*/\s*24(?!\d)")
+_FICO = re.compile(
+    r"(?:fico|信用分|分数|credit score|\btu\b|\bex\b|\beq\b|experian|transunion|equifax)"
+    r"[^\d\n]{0,10}(\d{3})(?!\d)",
+    _FLAGS,
+)
+_INCOME = re.compile(
+    r"(?:income|收入)[^\d\n]{0,10}\$?\s*(\d+(?:\.\d+)?)\s*(k|w|万|m)?", _FLAGS
+)
+_ACCOUNT_AGE = re.compile(
+    r"(?:aaoa|aoa|信用历史|信用记录|credit history|oldest)[^\d\n]{0,12}"
+    r"(\d+(?:\.\d+)?)\s*(年|years?|yrs?|y\b|个月|months?|mo\b)",
+    _FLAGS,
+)
+_CARD = re.compile(r"(?:^|\n)\s*(?:card|卡片?|申请的卡)\s*[:：]\s*([^\n]{1,40})", _FLAGS)
+_DATE = re.compile(r"(20\d{2})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})")
+
+
+def _classify_result(text):
+    match = _RESULT_QUESTION.search(text)
+    answer = match.group(1) if match else _TEMPLATE_QUESTIONS.sub("", text)
+    # 同时出现多种结果时（如 "被拒后 recon 批了"），以最后出现的为准
+    last = None
+    for name, pattern in (
+        ("approved", _APPROVED),
+        ("denied", _DENIED),
+        ("pending", _PENDING),
+    ):
+        for found in pattern.finditer(answer):
+            if name == "approved" and _NEGATION.search(
+                answer[max(0, found.start() - 12) : found.start()]
+            ):
+                result = "denied"
+            else:
+                result = name
+            if last is None or found.start() >= last[0]:
+                last = (found.start(), result)
+    if last is None and _RECON.search(answer):
+        return "pending"
+    return last[1] if last else None
+
+
+def _classify_account_type(text):
+    match = _TYPE_QUESTION.search(text)
+    answer = match.group(1) if match else _TEMPLATE_QUESTIONS.sub("", text)
+    is_personal = bool(_PERSONAL.search(answer))
+    is_business = bool(_BUSINESS.search(answer))
+    if is_personal == is_business:
+        return None
+    return "personal" if is_personal else "business"
+
+
+def _parse_income_k(match):
+    value = float(match.group(1))
+    unit = (match.group(2) or "").lower()
+    if unit in ("w", "万"):
+        return value * 10
+    if unit == "m":
+        return value * 1000
+    if unit == "k":
+        return value
+    # 没有单位时，大于 1000 的数按美元理解
+    return value / 1000 if value >= 1000 else value
+
+
+def _parse_account_age_years(match):
+    value = float(match.group(1))
+    unit = match.group(2).lower()
+    if unit in ("个月", "mo") or unit.startswith("month"):
+        return value / 12
+    return value
+
+
+def extract_dp_fields(text, created_at=None):
+    """从一条回复的纯文本中提取 DP 字段，无法识别的字段为 None。"""
+    fields = {
+        "card": None,
+        "account_type": _classify_account_type(text),
+        "x24": None,
+        "fico": None,
+        "income_k": None,
+        "account_age_years": None,
+        "result": _classify_result(text),
+        "dp_date": created_at[:10] if created_at else None,
+    }
+
+    match = _CARD.search(text)
+    if match:
+        fields["card"] = match.group(1).strip()
+    match = _X24.search(text)
+    if match and int(match.group(1)) <= 30:
+        fields["x24"] = int(match.group(1))
+    for match in _FICO.finditer(text):
+        if 300 <= int(match.group(1)) <= 850:
+            fields["fico"] = int(match.group(1))
+            break
+    match = _INCOME.search(text)
+    if match:
+        fields["income_k"] = _parse_income_k(match)
+    match = _ACCOUNT_AGE.search(text)
+    if match:
+        fields["account_age_years"] = _parse_account_age_years(match)
+    match = _DATE.search(text)
+    if match:
+        year, month, day = (int(part) for part in match.groups())
+        if 1 <= month <= 12 and 1 <= day <= 31:
+            fields["dp_date"] = f"{year:04d}-{month:02d}-{day:02d}"
+    return fields
+
+
+def _extract_chunk(chunk):
+    """在工作进程中提取一批回复。chunk 为 (post_number, user_id, created_at, text) 元组列表。"""
+    records = []
+    for post_number, user_id, created_at, text in chunk:
+        fields = extract_dp_fields(text, created_at)
+        fields["post_number"] = post_number
+        fields["user_id"] = user_id
+        records.append(fields)
+    return records
+
+
+class DPTable:
+    """
+    按列存储的 DP 表。每一列是一个等长的 array 或 list，第 i 行对应第 i 条回复。
+    数值列可以直接用 numpy.frombuffer 转为 NumPy 数组。
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_records(cls, records):
+        columns = {}
+        for name in NUMERIC_COLUMNS:
+            columns[name] = array(
+                "d", (math.nan if r[name] is None else r[name] for r in records)
+            )
+        for name in INTEGER_COLUMNS:
+            columns[name] = array("q", (r[name] or 0 for r in records))
+        columns["result"] = array("b", (RESULT_CODES.get(r["result"], 0) for r in records))
+        columns["account_type"] = array(
+            "b", (ACCOUNT_TYPE_CODES.get(r["account_type"], 0) for r in records)
+        )
+        for name in STRING_COLUMNS:
+            columns[name] = [r[name] for r in records]
+        return cls(columns)
+
+    def __len__(self):
+        return len(self.columns["post_number"])
+
+    def _take(self, indices):
+        columns = {}
+        for name, column in self.columns.items():
+            values = [column[i] for i in indices]
+            columns[name] = (
+                array(column.typecode, values) if isinstance(column, array) else values
+            )
+        return DPTable(columns)
+
+    def filter(
+        self,
+        result=None,
+        account_type=None,
+        max_x24=None,
+        min_fico=None,
+        since=None,
+    ):
+        """
+        按条件筛选，返回新的 DPTable。每个条件逐列计算布尔掩码后再按行合并，
+        例如 filter(result="approved", max_x24=3, since="2024-01-01")。
+        缺失对应字段的行不满足该条件。
+        """
+        mask = [True] * len(self)
+        if result is not None:
+            code = RESULT_CODES[result]
+            mask = [m and v == code for m, v in zip(mask, self.columns["result"])]
+        if account_type is not None:
+            code = ACCOUNT_TYPE_CODES[account_type]
+            mask = [m and v == code for m, v in zip(mask, self.columns["account_type"])]
+        if max_x24 is not None:
+            # NaN 与任何数比较均为 False，缺失值自然被排除
+            mask = [m and v <= max_x24 for m, v in zip(mask, self.columns["x24"])]
+        if min_fico is not None:
+            mask = [m and v >= min_fico for m, v in zip(mask, self.columns["fico"])]
+        if since is not None:
+            mask = [
+                m and v is not None and v >= since
+                for m, v in zip(mask, self.columns["dp_date"])
+            ]
+        return self._take([i for i, m in enumerate(mask) if m])
+
+    def completeness(self):
+        """每一行已识别出的 DP 字段个数，用于优先选择信息完整的 DP。"""
+        counts = [0] * len(self)
+        for name in NUMERIC_COLUMNS:
+            counts = [c + (not math.isnan(v)) for c, v in zip(counts, self.columns[name])]
+        for name in CODE_COLUMNS:
+            counts = [c + (v != 0) for c, v in zip(counts, self.columns[name])]
+        return [c + (v is not None) for c, v in zip(counts, self.columns["card"])]
+
+    def rows(self):
+        """按行返回字典列表，类别列还原为名称，缺失值为 None。"""
+        rows = []
+        for i in range(len(self)):
+            row = {}
+            for name, column in self.columns.items():
+                value = column[i]
+                if name in NUMERIC_COLUMNS and math.isnan(value):
+                    value = None
+                elif name == "result":
+                    value = _RESULT_NAMES.get(value)
+                elif name == "account_type":
+                    value = _ACCOUNT_TYPE_NAMES.get(value)
+                row[name] = value
+            rows.append(row)
+        return rows
+
+    def to_json(self):
+        return {
+            name: [None if isinstance(v, float) and math.isnan(v) else v for v in column]
+            if name in NUMERIC_COLUMNS
+            else list(column)
+            for name, column in self.columns.items()
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        columns = {}
+        for name in NUMERIC_COLUMNS:
+            columns[name] = array(
+                "d", (math.nan if v is None else v for v in data[name])
+            )
+        for name in INTEGER_COLUMNS:
+            columns[name] = array("q", data[name])
+        for name in CODE_COLUMNS:
+            columns[name] = array("b", data[name])
+        for name in STRING_COLUMNS:
+            columns[name] = list(data[name])
+        return cls(columns)
+
+
+def extract_table(grouped_data, workers=1, parallel_threshold=5000):
+    """
+    对按用户分组的回复提取 DP 字段，返回按 post_number 排序的 DPTable。
+    回复数不少于 parallel_threshold 且 workers > 1 时，分块交给进程池并行提取。
+    """
+    items = sorted(
+        (
+            (
+                reply.get("post_number"),
+                reply.get("user_id"),
+                reply.get("created_at"),
+                reply.get("reply_content", ""),
+            )
+            for user_data in grouped_data
+            for reply in user_data.get("replies", [])
+        ),
+        key=lambda item: item[0] or 0,
+    )
+    if workers > 1 and len(items) >= parallel_threshold:
+        chunk_size = -(-len(items) // (workers * 4))
+        chunks = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            records = [r for chunk in executor.map(_extract_chunk, chunks) for r in chunk]
+    else:
+        records = _extract_chunk(items)
+    return DPTable.from_records(records)
+
+
+def load_or_build_table(
+    path, fingerprint, load_grouped_data, workers=1, parallel_threshold=5000
+):
+    """
+    读取 path 处缓存的 DP 表；缓存不存在或 fingerprint 不一致时，
+    调用 load_grouped_data() 取得按用户分组的回复，重新提取并写回。
+    返回 (DPTable, 是否重新构建)。
+    """
+    cache_key = f"{fingerprint}:{EXTRACTOR_VERSION}"
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("key") == cache_key:
+                return DPTable.from_json(cached["columns"]), False
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    table = extract_table(load_grouped_data(), workers, parallel_threshold)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"key": cache_key, "columns": table.to_json()},
+            f,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+    return table, True
@@ -0,0 +1,202 @@
+# metrics.py
+
+"""
+可选的运行指标收集：各阶段耗时、每个请求的延迟分布、下载字节数、重试次数和缓存命中情况。
+
+用 collect() 包住一次运行（GUI 中的一次分析，或批处理中的一个任务）。
+当前运行保存在 contextvars 中，没有进行中的运行时所有记录函数都直接返回，几乎没有开销。
+线程池中的任务需要用 contextvars.copy_context().run 提交，才能记到同一次运行中。
+"""
+
+import contextvars
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 请求延迟直方图的桶上限（毫秒），最后一个桶收集所有更慢的请求
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_current_run = contextvars.ContextVar("metrics_run", default=None)
+
+
+class RunMetrics:
+    """一次运行的指标。各记录方法可以在多个线程中同时调用。"""
+
+    def __init__(self, label, info=None):
+        self.label = label
+        self.info = dict(info or {})
+        self.started_at = time.time()
+        self.phases = {}
+        self.counters = {}
+        self.latencies_ms = []
+        self.status_counts = {}
+        self.bytes_downloaded = 0
+        self.cache_outcome = None
+        self._lock = threading.Lock()
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            phase = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+            phase["seconds"] += seconds
+            phase["calls"] += 1
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_request(self, seconds, nbytes, status):
+        with self._lock:
+            self.latencies_ms.append(seconds * 1000)
+            self.bytes_downloaded += nbytes
+            key = str(status)
+            self.status_counts[key] = self.status_counts.get(key, 0) + 1
+
+    def _latency_summary(self):
+        latencies = sorted(self.latencies_ms)
+        histogram = {f"<={bound}ms": 0 for bound in LATENCY_BUCKETS_MS}
+        histogram[f">{LATENCY_BUCKETS_MS[-1]}ms"] = 0
+        for latency in latencies:
+            for bound in LATENCY_BUCKETS_MS:
+                if latency <= bound:
+                    histogram[f"<={bound}ms"] += 1
+                    break
+            else:
+                histogram[f">{LATENCY_BUCKETS_MS[-1]}ms"] += 1
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 1)
+
+        return {
+            "count": len(latencies),
+            "p50_ms": percentile(0.5),
+            "p90_ms": percentile(0.9),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(latencies[-1], 1) if latencies else None,
+            "histogram": histogram,
+        }
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "label": self.label,
+                "info": self.info,
+                "started_at": self.started_at,
+                "wall_seconds": round(time.time() - self.started_at, 4),
+                "cache_outcome": self.cache_outcome,
+                "phases": {
+                    name: {"seconds": round(p["seconds"], 4), "calls": p["calls"]}
+                    for name, p in self.phases.items()
+                },
+                "requests": dict(
+                    self._latency_summary(),
+                    bytes_downloaded=self.bytes_downloaded,
+                    status_counts=self.status_counts,
+                ),
+                "counters": self.counters,
+            }
+
+
+@contextmanager
+def collect(config, metrics_dir, label, **info):
+    """
+    在 config 启用 ENABLE_METRICS 时收集这次运行的指标，结束时写入
+    {metrics_dir}/{时间}_{label}.json；启用 METRICS_PROFILE 时还会把当前线程的
+    cProfile 结果写入同名的 .prof 文件。未启用时什么也不做。
+    """
+    if not config.get("ENABLE_METRICS", False):
+        yield None
+        return
+
+    run = RunMetrics(label, info)
+    token = _current_run.set(run)
+    profiler = cProfile.Profile() if config.get("METRICS_PROFILE", False) else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield run
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _current_run.reset(token)
+
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(run.started_at))
+        base_path = os.path.join(metrics_dir, f"{stamp}_{label}")
+        try:
+            os.makedirs(metrics_dir, exist_ok=True)
+            with open(base_path + ".json", "w", encoding="utf-8") as f:
+                json.dump(run.to_dict(), f, ensure_ascii=False, indent=2)
+            if profiler is not None:
+                profiler.dump_stats(base_path + ".prof")
+            print(f"运行指标已写入 {os.path.basename(base_path)}.json")
+        except (IOError, OSError) as e:
+            print(f"警告: 无法写入运行指标: {e}")
+
+
+def current():
+    """返回当前进行中的 RunMetrics，没有时返回 None。"""
+    return _current_run.get()
+
+
+@contextmanager
+def phase(name):
+    """记录 with 块的耗时，计入名为 name 的阶段。"""
+    run = _current_run.get()
+    if run is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        run.add_phase(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """装饰器：把函数每次调用的耗时计入名为 name 的阶段。"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            run = _current_run.get()
+            if run is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                run.add_phase(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def record_request(seconds, nbytes, status):
+    """记录一次 HTTP 请求。status 为状态码，连接失败时为 "error"。"""
+    run = _current_run.get()
+    if run is not None:
+        run.add_request(seconds, nbytes, status)
+
+
+def increment(name, amount=1):
+    run = _current_run.get()
+    if run is not None:
+        run.increment(name, amount)
+
+
+def set_cache_outcome(outcome):
+    """
+    记录缓存结果，取值为:
+    "hit"（缓存有效）、"stale"（先用过期缓存并在后台刷新）、"miss"（没有缓存）、
+    "expired"（过期后完整获取）、"expired_incremental"（过期后增量获取）、
+    "expired_full_refresh"（过期且到了定期完整获取的时间）。
+    """
+    run = _current_run.get()
+    if run is not None:
+        run.cache_outcome = outcome
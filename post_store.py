@@ -0,0 +1,232 @@
+# post_store.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS topics (
+    topic_id INTEGER PRIMARY KEY,
+    fetched_at REAL NOT NULL,
+    replies_built_at REAL,
+    cleaner_version TEXT
+);
+
+CREATE TABLE IF NOT EXISTS posts (
+    topic_id INTEGER NOT NULL,
+    post_number INTEGER NOT NULL,
+    post_id INTEGER,
+    user_id INTEGER,
+    created_at TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (topic_id, post_number)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_posts_user ON posts (user_id);
+CREATE INDEX IF NOT EXISTS idx_posts_created ON posts (topic_id, created_at);
+
+CREATE TABLE IF NOT EXISTS replies (
+    topic_id INTEGER NOT NULL,
+    post_number INTEGER NOT NULL,
+    user_id INTEGER,
+    username TEXT,
+    created_at TEXT,
+    reply_to_post_number INTEGER,
+    reply_content TEXT,
+    original_post_url TEXT,
+    PRIMARY KEY (topic_id, post_number)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_replies_user ON replies (user_id);
+CREATE INDEX IF NOT EXISTS idx_replies_created ON replies (topic_id, created_at);
+"""
+
+REPLY_COLUMNS = (
+    "post_number",
+    "user_id",
+    "username",
+    "created_at",
+    "reply_to_post_number",
+    "reply_content",
+    "original_post_url",
+)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class PostStore:
+    """
+    基于 SQLite 的帖子存储，替代每个话题一个的 JSON 文件。
+    原始帖子和清理后的回复均以 (topic_id, post_number) 为主键，
+    并按 user_id 和 created_at 建立索引，按条件查询时无需加载整个话题。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 同一个连接会被多个抓取线程共用，由 self._lock 保证串行访问
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            # 旧版本创建的帖子库没有 cleaner_version 列，其中的回复视为需要重新清理
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(topics)")]
+            if "cleaner_version" not in columns:
+                self._conn.execute("ALTER TABLE topics ADD COLUMN cleaner_version TEXT")
+
+    def topic_fetched_at(self, topic_id):
+        """返回话题最近一次写入的时间戳，不存在时返回 None。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fetched_at FROM topics WHERE topic_id = ?", (int(topic_id),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def load_posts(self, topic_id):
+        """按 post_number 顺序返回话题的全部原始帖子。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM posts WHERE topic_id = ? ORDER BY post_number",
+                (int(topic_id),),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def save_posts(self, topic_id, posts):
+        """用新获取的原始帖子整体替换话题的旧数据，并使已清理的回复失效。"""
+        topic_id = int(topic_id)
+        rows = [
+            (
+                topic_id,
+                post.get("post_number"),
+                post.get("id"),
+                post.get("user_id"),
+                post.get("created_at"),
+                json.dumps(post, ensure_ascii=False, separators=(",", ":")),
+            )
+            for post in posts
+        ]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM posts WHERE topic_id = ?", (topic_id,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO topics "
+                "(topic_id, fetched_at, replies_built_at, cleaner_version) "
+                "VALUES (?, ?, NULL, NULL)",
+                (topic_id, time.time()),
+            )
+
+    def replies_current(self, topic_id, cleaner_version):
+        """已清理的回复是否基于话题当前的原始帖子、由 cleaner_version 版本的清理器生成。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fetched_at, replies_built_at, cleaner_version FROM topics "
+                "WHERE topic_id = ?",
+                (int(topic_id),),
+            ).fetchone()
+        return bool(
+            row
+            and row[1] is not None
+            and row[1] >= row[0]
+            and row[2] == str(cleaner_version)
+        )
+
+    def load_replies(self, topic_id):
+        """按 post_number 顺序返回话题的全部已清理回复。"""
+        return self._query_replies(
+            "WHERE topic_id = ? ORDER BY post_number", (int(topic_id),)
+        )
+
+    def save_replies(self, topic_id, replies, cleaner_version):
+        """保存话题已清理的回复，覆盖旧数据，并记录生成它们的清理器版本。"""
+        topic_id = int(topic_id)
+        rows = [
+            (topic_id,) + tuple(reply.get(column) for column in REPLY_COLUMNS)
+            for reply in replies
+        ]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM replies WHERE topic_id = ?", (topic_id,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO replies VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.execute(
+                "UPDATE topics SET replies_built_at = ?, cleaner_version = ? "
+                "WHERE topic_id = ?",
+                (time.time(), str(cleaner_version), topic_id),
+            )
+
+    def replies_since(self, topic_id, since, user_id=None, until=None):
+        """
+        查询话题中 created_at >= since 且 < until 的回复，可选按用户过滤，按 created_at 排序。
+        since、until 为 ISO 8601 字符串 (如 "2024-01-01")，与 Discourse 的 created_at 格式按字典序比较；
+        为 None 时该端不限制，但没有 created_at 的回复不会返回。
+        """
+        conditions = ["topic_id = ?", "created_at > ''"]
+        params = [int(topic_id)]
+        if since is not None:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            params.append(until)
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        return self._query_replies(
+            f"WHERE {' AND '.join(conditions)} ORDER BY created_at", params
+        )
+
+    def topic_sizes(self):
+        """返回 {topic_id: (原始帖子和回复内容的字节数估计, 最近写入时间)}，供缓存清理使用。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT t.topic_id, t.fetched_at, "
+                "COALESCE((SELECT SUM(LENGTH(data)) FROM posts p "
+                "WHERE p.topic_id = t.topic_id), 0), "
+                "COALESCE((SELECT SUM(LENGTH(reply_content)) FROM replies r "
+                "WHERE r.topic_id = t.topic_id), 0) "
+                "FROM topics t"
+            ).fetchall()
+        return {
+            str(topic_id): (posts_bytes + replies_bytes, fetched_at)
+            for topic_id, fetched_at, posts_bytes, replies_bytes in rows
+        }
+
+    def delete_topics(self, topic_ids):
+        """删除这些话题的全部数据，并整理数据库文件以归还磁盘空间。"""
+        params = [(int(topic_id),) for topic_id in topic_ids]
+        if not params:
+            return
+        with self._lock:
+            with self._conn:
+                for table in ("posts", "replies", "topics"):
+                    self._conn.executemany(
+                        f"DELETE FROM {table} WHERE topic_id = ?", params
+                    )
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _query_replies(self, where_clause, params):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(REPLY_COLUMNS)} FROM replies {where_clause}",
+                params,
+            ).fetchall()
+        return [dict(zip(REPLY_COLUMNS, row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_store(path):
+    """返回指定路径的 PostStore。同一进程内相同路径共用一个实例。"""
+    path = os.path.abspath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = PostStore(path)
+        return _stores[path]
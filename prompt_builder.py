@@ -0,0 +1,147 @@
+# prompt_builder.py
+
+import json
+import math
+import os
+import re
+from datetime import datetime, timezone
+
+import dp_extract
+import time_window
+
+_CJK_CHAR = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+CHUNK_HEADER = "\n\n# DP(data point) 数据（第 {index} 部分）\n以下 JSON 每行是同一个用户的回复：\n```json\n"
+CHUNK_FOOTER = "```\n"
+
+
+def estimate_tokens(text):
+    """
+    粗略估算文本的 token 数，不依赖具体模型的分词器。
+    中文字符和全角标点大约各占 1 个 token，其余字符大约每 4 个占 1 个 token。
+    """
+    cjk_count = len(_CJK_CHAR.findall(text))
+    return cjk_count + math.ceil((len(text) - cjk_count) / 4)
+
+
+def rank_replies(grouped_data, dp_table=None, half_life_days=0):
+    """
+    返回按优先级排序的 (user_index, reply) 列表：
+    识别出的 DP 字段越多越靠前，字段数相同时越新越靠前。
+    dp_table 为已提取好的 DPTable，没有时现场提取。
+    half_life_days 不为 0 时，字段完整度再乘以按发布时间衰减的权重，每过 half_life_days 天减半。
+    """
+    replies = [
+        (user_index, reply)
+        for user_index, user_data in enumerate(grouped_data)
+        for reply in user_data.get("replies", [])
+    ]
+    if dp_table is None or len(dp_table) != len(replies):
+        dp_table = dp_extract.extract_table(grouped_data)
+    # DP 表的各行与按楼层号稳定排序后的回复一一对应。多话题合并的语料中不同话题的楼层号会重复，
+    # 所以按位置而不是按楼层号把完整度对应回每条回复
+    by_post_number = sorted(
+        range(len(replies)), key=lambda i: replies[i][1].get("post_number") or 0
+    )
+    completeness = [0] * len(replies)
+    for reply_index, score in zip(by_post_number, dp_table.completeness()):
+        completeness[reply_index] = score
+
+    order = list(range(len(replies)))
+    # 先按时间倒序，再按完整度稳定排序，得到“完整度优先、其次最新”的顺序
+    order.sort(key=lambda i: replies[i][1].get("created_at") or "", reverse=True)
+    if half_life_days:
+        now = datetime.now(timezone.utc)
+        order.sort(
+            key=lambda i: completeness[i]
+            * time_window.recency_weight(replies[i][1].get("created_at"), half_life_days, now),
+            reverse=True,
+        )
+    else:
+        order.sort(key=lambda i: completeness[i], reverse=True)
+    return [replies[i] for i in order]
+
+
+def _user_entry(user_data, replies):
+    return {
+        "username": user_data.get("username"),
+        "user_id": user_data.get("user_id"),
+        "replies": sorted(replies, key=lambda r: r.get("post_number") or 0),
+    }
+
+
+def _write_chunk(path, base_prompt, index, grouped_data, chunk):
+    """把一个分块写入 prompt 文件。用户按原有顺序逐行写出，不在内存中拼接整个文件。"""
+    users = {}
+    for user_index, reply in chunk:
+        users.setdefault(user_index, []).append(reply)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(base_prompt)
+        f.write(CHUNK_HEADER.format(index=index))
+        for user_index in sorted(users):
+            entry = _user_entry(grouped_data[user_index], users[user_index])
+            f.write(json.dumps(entry, ensure_ascii=False))
+            f.write("\n")
+        f.write(CHUNK_FOOTER)
+
+
+def chunk_path(prompt_path, index):
+    base, ext = os.path.splitext(prompt_path)
+    return f"{base}_part{index}{ext}"
+
+
+def write_chunked_prompts(
+    base_prompt, grouped_data, prompt_path, token_budget, max_chunks, dp_table=None, half_life_days=0
+):
+    """
+    将回复按优先级装入若干个 prompt 分块，每个分块（含 prompt 模板本身）不超过 token_budget。
+    分块写入 {prompt 文件名}_part1.md、_part2.md……，每写满一块立即落盘。
+    超过 max_chunks 个分块后剩余的回复被丢弃；单条就超出预算的回复会被跳过。
+    返回 (分块文件路径列表, 写入的回复数, 回复总数)。
+    """
+    reply_budget = token_budget - estimate_tokens(base_prompt) - estimate_tokens(
+        CHUNK_HEADER + CHUNK_FOOTER
+    )
+    ranked = rank_replies(grouped_data, dp_table, half_life_days)
+    if reply_budget <= 0:
+        print("警告: prompt 模板本身已超出 token 预算，无法放入任何 DP。")
+        return [], 0, len(ranked)
+
+    paths = []
+    written = 0
+    chunk = []
+    chunk_users = set()
+    used = 0
+    for user_index, reply in ranked:
+        cost = estimate_tokens(json.dumps(reply, ensure_ascii=False))
+        if user_index not in chunk_users:
+            # 每个用户在分块中还有一行 username/user_id 的开销
+            cost += estimate_tokens(
+                json.dumps(_user_entry(grouped_data[user_index], []), ensure_ascii=False)
+            )
+        if cost > reply_budget:
+            continue
+        if used + cost > reply_budget:
+            paths.append(chunk_path(prompt_path, len(paths) + 1))
+            _write_chunk(paths[-1], base_prompt, len(paths), grouped_data, chunk)
+            written += len(chunk)
+            chunk, chunk_users, used = [], set(), 0
+            if len(paths) >= max_chunks:
+                break
+            cost = estimate_tokens(json.dumps(reply, ensure_ascii=False)) + estimate_tokens(
+                json.dumps(_user_entry(grouped_data[user_index], []), ensure_ascii=False)
+            )
+        chunk.append((user_index, reply))
+        chunk_users.add(user_index)
+        used += cost
+    if chunk and len(paths) < max_chunks:
+        paths.append(chunk_path(prompt_path, len(paths) + 1))
+        _write_chunk(paths[-1], base_prompt, len(paths), grouped_data, chunk)
+        written += len(chunk)
+
+    # 删除上一次生成、本次已不需要的分块文件
+    stale_index = len(paths) + 1
+    while os.path.exists(chunk_path(prompt_path, stale_index)):
+        os.remove(chunk_path(prompt_path, stale_index))
+        stale_index += 1
+    return paths, written, len(ranked)
@@ -0,0 +1,144 @@
+# rate_limit.py
+
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import cancellation
+
+
+class AdaptiveTokenBucket:
+    """
+    自适应令牌桶限速器。
+    每次请求消耗一个令牌，令牌按 rate 个/秒补充，最多积攒 burst 个。
+    请求连续成功时缓慢提高 rate（加性增），遇到 429/503 时减半（乘性减），
+    并在 Retry-After 指定的时间内暂停发出新请求。
+    """
+
+    def __init__(self, rate, min_rate, max_rate, burst=1, increase_step=0.25):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, rate)
+        self.burst = burst
+        self.increase_step = increase_step
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
+
+    def acquire(self):
+        """阻塞直到拿到一个令牌。当前任务被取消时立即抛出 cancellation.Cancelled。"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_time = max(
+                    self._blocked_until - now, (1 - self._tokens) / self.rate
+                )
+            cancellation.sleep(wait_time)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttled(self, retry_after=None):
+        """服务器返回 429/503 时调用。retry_after 为服务器要求等待的秒数。"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+_settings = (0, 0, 0)
+# 愿意按 Retry-After 等待的最长秒数
+_retry_after_max = 120
+
+
+def configure(rate, min_rate=None, max_rate=None, retry_after_max=120):
+    """
+    设置每个主机的初始请求速率（次/秒）及自适应调整的上下限。
+    rate <= 0 表示不限速。设置改变时丢弃已有的限速器。
+    retry_after_max 为愿意按 Retry-After 等待的最长秒数。
+    """
+    global _settings, _retry_after_max
+    settings = (rate, min_rate or rate / 10, max_rate or rate * 2)
+    with _limiters_lock:
+        _retry_after_max = retry_after_max
+        if settings != _settings:
+            _settings = settings
+            _limiters.clear()
+
+
+def _get_limiter(url):
+    rate, min_rate, max_rate = _settings
+    if rate <= 0:
+        return None
+    host = urlsplit(url).netloc
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = AdaptiveTokenBucket(rate, min_rate, max_rate)
+    return limiter
+
+
+def acquire(url):
+    """在向 url 发出请求前调用。同一主机的所有请求（包括不同线程、不同话题）共用一个限速器。"""
+    limiter = _get_limiter(url)
+    if limiter is not None:
+        limiter.acquire()
+
+
+def report_success(url):
+    limiter = _get_limiter(url)
+    if limiter is not None:
+        limiter.on_success()
+
+
+def report_throttled(url, retry_after=None):
+    limiter = _get_limiter(url)
+    if limiter is not None:
+        limiter.on_throttled(retry_after)
+
+
+def current_rate(url):
+    """返回 url 所在主机当前的请求速率，未限速时返回 None。"""
+    limiter = _get_limiter(url)
+    return limiter.rate if limiter is not None else None
+
+
+def retry_after_max():
+    """返回愿意按 Retry-After 等待的最长秒数。"""
+    return _retry_after_max
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），返回需要等待的秒数；无法解析时返回 None。"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
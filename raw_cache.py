@@ -0,0 +1,216 @@
+# raw_cache.py
+
+"""
+原始帖子缓存文件的读写。
+
+支持两种格式，读取时自动识别：
+* 旧格式：完整的 Discourse 帖子对象组成的 JSON 数组（以 "[" 开头）。
+* 紧凑格式：第一行是描述格式版本和字段列表的 JSON 头，之后每行是一个帖子的字段值数组。
+  只保留 RAW_POST_FIELDS 中程序实际用到的字段，不缩进，可选 gzip 或 lzma 压缩
+  （按文件开头的魔数识别，文件名不变）。
+"""
+
+import gzip
+import json
+import lzma
+import os
+import threading
+from contextlib import contextmanager
+
+FORMAT_NAME = "discourse-posts"
+FORMAT_VERSION = 1
+
+# 清理、增量刷新和指纹计算用到的帖子字段，其余字段（头像、actions_summary 等）不写入缓存
+RAW_POST_FIELDS = (
+    "id",
+    "topic_id",
+    "post_number",
+    "user_id",
+    "username",
+    "created_at",
+    "updated_at",
+    "version",
+    "reply_to_post_number",
+    "cooked",
+)
+
+COMPRESSIONS = ("none", "gzip", "lzma")
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_XZ_MAGIC = b"\xfd7zXZ\x00"
+
+
+def _open_text(path, mode, compression):
+    if compression == "gzip":
+        # 压缩级别 6 在速度和体积之间比较均衡，默认的 9 写入明显更慢而体积相差无几
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+    if compression == "lzma":
+        return lzma.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _detect_compression(path):
+    with open(path, "rb") as f:
+        head = f.read(len(_XZ_MAGIC))
+    if head.startswith(_GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(_XZ_MAGIC):
+        return "lzma"
+    return "none"
+
+
+class PostWriter:
+    """
+    逐个追加帖子的紧凑格式写入器，用于边获取边写入缓存。
+    头部不记录帖子总数，读取时以实际行数为准。
+    """
+
+    def __init__(self, path, compression="gzip"):
+        self.count = 0
+        self._file = _open_text(path, "w", compression)
+        header = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "fields": RAW_POST_FIELDS,
+        }
+        self._file.write(json.dumps(header))
+        self._file.write("\n")
+
+    def write(self, post):
+        self._file.write(
+            json.dumps(
+                [post.get(field) for field in RAW_POST_FIELDS],
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+        )
+        self._file.write("\n")
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def unique_temp_path(path):
+    """返回 path 的临时文件名。进程号和线程号使同时写同一个文件的多个写入方互不干扰。"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    with atomic_path(path) as temp_path: 在 temp_path 写入文件，with 块正常结束后原子地替换 path。
+    出错时删除临时文件，path 保持原样，读取方不会看到写了一半的文件。
+    """
+    temp_path = unique_temp_path(path)
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_posts(path, posts, compact=True, compression="gzip"):
+    """将帖子原子地写入缓存文件。compact 为 False 时写出旧的缩进 JSON 格式（不压缩）。"""
+    with atomic_path(path) as temp_path:
+        if not compact:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(posts, f, ensure_ascii=False, indent=4)
+        else:
+            with PostWriter(temp_path, compression) as writer:
+                for post in posts:
+                    writer.write(post)
+
+
+def read_posts(path):
+    """读取任意格式的缓存文件，返回帖子字典列表。格式无法识别或文件损坏时抛出 ValueError。"""
+    try:
+        return _read_posts(path)
+    except (EOFError, lzma.LZMAError, UnicodeDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f"缓存文件已损坏: {e}") from e
+
+
+def _read_header(first_line):
+    header = json.loads(first_line)
+    if header.get("format") != FORMAT_NAME:
+        raise ValueError(f"未知的缓存格式: {header.get('format')}")
+    if header.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(f"缓存格式版本 {header.get('version')} 高于当前支持的版本")
+    return header
+
+
+def _read_posts(path):
+    with _open_text(path, "r", _detect_compression(path)) as f:
+        first_line = f.readline()
+        if first_line.lstrip().startswith("["):
+            # 旧格式：整个文件是一个 JSON 数组
+            return json.loads(first_line + f.read())
+
+        fields = _read_header(first_line)["fields"]
+        # 拼成一个 JSON 数组一次解析，比逐行调用 json.loads 快
+        rows = json.loads("[" + ",".join(line for line in f if line.strip()) + "]")
+        return [dict(zip(fields, row)) for row in rows]
+
+
+def iter_posts(path):
+    """
+    逐个读取缓存文件中的帖子。紧凑格式每次只解析一行，内存占用与话题大小无关；
+    旧格式只能整体解析后再逐个返回。
+    """
+    try:
+        with _open_text(path, "r", _detect_compression(path)) as f:
+            first_line = f.readline()
+            if first_line.lstrip().startswith("["):
+                yield from json.loads(first_line + f.read())
+                return
+            fields = _read_header(first_line)["fields"]
+            for line in f:
+                if line.strip():
+                    yield dict(zip(fields, json.loads(line)))
+    except (EOFError, lzma.LZMAError, UnicodeDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f"缓存文件已损坏: {e}") from e
+
+
+def count_posts(path):
+    """返回缓存文件中的帖子数。紧凑格式只数行数，不解析帖子内容。"""
+    try:
+        with _open_text(path, "r", _detect_compression(path)) as f:
+            first_line = f.readline()
+            if first_line.lstrip().startswith("["):
+                return len(json.loads(first_line + f.read()))
+            _read_header(first_line)
+            return sum(1 for line in f if line.strip())
+    except (EOFError, lzma.LZMAError, UnicodeDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f"缓存文件已损坏: {e}") from e
+
+
+class LazyPosts:
+    """
+    缓存文件中帖子的只读视图。每次迭代都从文件重新流式读取，不在内存中保留帖子。
+    len() 第一次调用时数一遍帖子数，之后复用。
+    """
+
+    def __init__(self, path, count=None):
+        self.path = path
+        self._count = count
+
+    def __iter__(self):
+        return iter_posts(self.path)
+
+    def __len__(self):
+        if self._count is None:
+            self._count = count_posts(self.path)
+        return self._count
+
+    def __bool__(self):
+        return len(self) > 0
@@ -3,11 +3,46 @@
 import time
 import os
 import json
+import hashlib
 import re
 import sys
-import certifi
-import cloudscraper
-import requests.exceptions
+import sqlite3
+import contextvars
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlencode
+
+import cache_manager
+import cancellation
+import metrics
+import rate_limit
+import raw_cache
+import session_pool
+import time_window
+from html_cleaner import CLEANER_VERSION, html_to_text
+from relevance import build_reply_index, select_relevant_replies
+from post_store import open_store
+import dedup
+import dp_extract
+import prompt_builder
+
+
+# 网络库 (cloudscraper 及其依赖的 requests、urllib3 等) 导入较慢，且只有缓存未命中时才需要，
+# 由 _load_network_modules 在第一次访问网络前导入
+cloudscraper = None
+certifi = None
+requests = None
+
+
+def _load_network_modules():
+    global cloudscraper, certifi, requests
+    if cloudscraper is None:
+        # cloudscraper 最后赋值，其他线程看到它不为 None 时另外两个模块已经就绪
+        import requests.exceptions
+        import certifi
+        import cloudscraper
 
 
 def get_internal_path(relative_path):
@@ -51,15 +86,50 @@ def get_persistent_path(relative_path):
 # --- Constants ---
 CACHE_DIR = get_persistent_path("cache")
 
+# 进程内最多为多少个话题保留分组回复和索引。每项都持有话题的全部回复，
+# 只保留最近用过的几个，长时间运行或批处理大量话题时内存不会一直增长
+INDEX_CACHE_TOPICS = 4
+
+
+class _LRUCache:
+    """线程安全的小容量 LRU 缓存，超出容量时丢弃最久未使用的项。"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+# {topic_id: ((topic_id, AI 输入文件的修改时间), grouped_data, BM25Index)}
+_reply_index_cache = _LRUCache(INDEX_CACHE_TOPICS)
+
 # show_progress 函数已被移除，其功能由GUI进度条替代
 
 
+def extract_topic_id(url):
+    """从帖子 URL 中提取 topic_id，找不到时返回 None。"""
+    match = re.search(r"/t/(?:topic/)?(\d+)", url)
+    return match.group(1) if match else None
+
+
+@metrics.timed("clean_post_data")
 def clean_post_data(base_url, post):
     """清理单个帖子字典。"""
-    raw_content = post.get("cooked", "")
-    cleaned_content = re.sub(
-        r"<blockquote.*?/blockquote>|<[^>]+>", "", raw_content, flags=re.DOTALL
-    ).strip()
+    cleaned_content = html_to_text(post.get("cooked") or "")
     return {
         "post_number": post.get("post_number"),
         "user_id": post.get("user_id"),
@@ -79,20 +149,38 @@ def get_main_post(all_posts):
     return None
 
 
-def group_and_sort_replies_by_user(base_url, all_posts):
-    """按用户分组和排序回复。"""
-    replies_only = [p for p in all_posts if p.get("post_number", 0) > 1]
+@metrics.timed("group_and_sort_replies_by_user")
+def group_and_sort_replies_by_user(base_url, all_posts, store=None, topic_id=None):
+    """
+    按用户分组和排序回复。
+    传入 store 和 topic_id 时，若 SQLite 帖子库中已有基于当前帖子清理好的回复则直接读取，
+    否则清理后写回帖子库。
+    """
+    if store is not None and store.replies_current(topic_id, CLEANER_VERSION):
+        cleaned_replies = store.load_replies(topic_id)
+    else:
+        cleaned_replies = [
+            clean_post_data(base_url, p)
+            for p in all_posts
+            if p.get("post_number", 0) > 1
+        ]
+        if store is not None:
+            store.save_replies(topic_id, cleaned_replies, CLEANER_VERSION)
+    return _group_replies(cleaned_replies)
+
+
+def _group_replies(cleaned_replies):
+    """按用户分组，用户按首次回复的楼层排序，每个用户的回复按楼层排序。"""
     users = {}
-    for post in replies_only:
-        user_id = post.get("user_id")
+    for cleaned_reply in cleaned_replies:
+        user_id = cleaned_reply["user_id"]
         if user_id not in users:
             users[user_id] = {
-                "username": post.get("username"),
+                "username": cleaned_reply["username"],
                 "user_id": user_id,
                 "replies": [],
                 "first_post_num": float("inf"),
             }
-        cleaned_reply = clean_post_data(base_url, post)
         users[user_id]["replies"].append(cleaned_reply)
         if cleaned_reply["post_number"] < users[user_id]["first_post_num"]:
             users[user_id]["first_post_num"] = cleaned_reply["post_number"]
@@ -104,183 +192,1606 @@ def group_and_sort_replies_by_user(base_url, all_posts):
     return sorted_users_list
 
 
-def _write_derived_files(topic_id, base_url, all_posts_raw):
-    """写入派生文件。"""
+# clean_post_data 从原始帖子中读取的字段
+_FINGERPRINT_FIELDS = (
+    "topic_id",
+    "post_number",
+    "user_id",
+    "username",
+    "created_at",
+    "reply_to_post_number",
+    "cooked",
+)
+
+
+def _new_fingerprint():
+    return hashlib.sha256(f"cleaner:{CLEANER_VERSION}\n".encode("utf-8"))
+
+
+def _add_to_fingerprint(digest, post):
+    digest.update(
+        json.dumps(
+            [post.get(field) for field in _FINGERPRINT_FIELDS], ensure_ascii=False
+        ).encode("utf-8")
+    )
+
+
+def posts_fingerprint(all_posts):
+    """
+    帖子列表的内容指纹：对 clean_post_data 用到的每个字段以及清理规则版本计算哈希。
+    帖子的增删、编辑或重新渲染，以及清理规则的变化都会改变指纹，派生数据以此判断是否需要重建。
+    all_posts 可以是任意可迭代对象，按迭代顺序计算。
+    """
+    digest = _new_fingerprint()
+    for post in all_posts:
+        _add_to_fingerprint(digest, post)
+    return digest.hexdigest()
+
+
+def dp_table_path(topic_id):
+    return os.path.join(CACHE_DIR, "internal", f"{topic_id}_dp_table.json")
+
+
+def _write_dp_table(topic_id, fingerprint, load_grouped_data, config):
+    """提取结构化 DP 字段，帖子没有变化时直接复用缓存的 DP 表。"""
+    table, rebuilt = dp_extract.load_or_build_table(
+        dp_table_path(topic_id),
+        fingerprint,
+        load_grouped_data,
+        workers=config.get("DP_EXTRACT_WORKERS", 1),
+        parallel_threshold=config.get("DP_EXTRACT_PARALLEL_THRESHOLD", 5000),
+    )
+    approved = len(table.filter(result="approved"))
+    action = "提取" if rebuilt else "从缓存加载"
+    print(f"已{action} {len(table)} 条回复的 DP 字段，其中 {approved} 条为批卡。")
+    return table
+
+
+def load_dp_table(topic_id):
+    """读取已缓存的 DP 表，不存在时返回 None。"""
+    try:
+        with open(dp_table_path(topic_id), "r", encoding="utf-8") as f:
+            return dp_extract.DPTable.from_json(json.load(f)["columns"])
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+
+def _manifest_path(topic_id):
+    return os.path.join(CACHE_DIR, "internal", f"{topic_id}_manifest.json")
+
+
+def _derived_files_current(manifest_path, derived_key, paths):
+    """清单中记录的键与当前一致，且派生文件都存在、大小未变时返回 True。"""
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return manifest.get("key") == derived_key and all(
+            os.path.getsize(path) == manifest["sizes"][os.path.basename(path)]
+            for path in paths
+        )
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return False
+
+
+def _write_manifest(manifest_path, derived_key, paths):
+    """记录派生文件对应的键和文件大小，供 _derived_files_current 检查。"""
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with raw_cache.atomic_path(manifest_path) as manifest_temp, open(
+        manifest_temp, "w", encoding="utf-8"
+    ) as f:
+        json.dump(
+            {
+                "key": derived_key,
+                "sizes": {os.path.basename(path): os.path.getsize(path) for path in paths},
+            },
+            f,
+        )
+
+
+class _ReplySpool:
+    """
+    流式模式下按用户分桶的已清理回复。
+    回复本身依次写入磁盘上的临时文件，内存中每个用户只保留 (post_number, 文件偏移) 列表，
+    占用与回复正文的大小无关。
+    """
+
+    def __init__(self, base_url, window=None):
+        self.base_url = base_url
+        self.window = window
+        self._file = tempfile.TemporaryFile(dir=os.path.join(CACHE_DIR, "internal"))
+        self._users = {}
+
+    def add(self, post):
+        if post.get("post_number", 0) <= 1:
+            return
+        if self.window is not None and not time_window.in_window(
+            post.get("created_at"), self.window
+        ):
+            return
+        reply = clean_post_data(self.base_url, post)
+        offset = self._file.seek(0, os.SEEK_END)
+        self._file.write(json.dumps(reply, ensure_ascii=False).encode("utf-8"))
+        self._file.write(b"\n")
+        bucket = self._users.get(reply["user_id"])
+        if bucket is None:
+            bucket = self._users[reply["user_id"]] = []
+        bucket.append((reply["post_number"], offset))
+
+    def users(self):
+        """按首次回复的楼层顺序逐个生成用户，格式与 group_and_sort_replies_by_user 一致。"""
+        buckets = sorted(self._users.values(), key=lambda bucket: min(bucket)[0])
+        for bucket in buckets:
+            replies = []
+            for _, offset in sorted(bucket):
+                self._file.seek(offset)
+                replies.append(json.loads(self._file.readline()))
+            yield {
+                "username": replies[0]["username"],
+                "user_id": replies[0]["user_id"],
+                "replies": replies,
+            }
+
+    def close(self):
+        self._file.close()
+
+
+def _write_grouped_and_readable(grouped_path, readable_path, users):
+    """
+    逐个用户写入 AI 输入文件和可读文件，users 可以是生成器。
+    AI 输入文件的内容与 json.dump(list(users), indent=4) 完全相同。
+    两个文件都先写入临时文件，全部写完后再替换，中途出错不会留下写了一半的文件。
+    """
+    with raw_cache.atomic_path(grouped_path) as grouped_temp, raw_cache.atomic_path(
+        readable_path
+    ) as readable_temp, open(grouped_temp, "w", encoding="utf-8") as grouped_file, open(
+        readable_temp, "w", encoding="utf-8"
+    ) as readable_file:
+        grouped_file.write("[")
+        index = -1
+        for index, user_data in enumerate(users):
+            entry = json.dumps(user_data, ensure_ascii=False, indent=4)
+            grouped_file.write(",\n    " if index else "\n    ")
+            grouped_file.write(entry.replace("\n", "\n    "))
+
+            readable_file.write(f'"username": "{user_data.get("username", "N/A")}"\n')
+            for reply in user_data.get("replies", []):
+                # 可读文件中每条回复占一行
+                content = reply.get("reply_content", "").replace("\n", " ")
+                if reply.get("duplicate_count"):
+                    content += f" (另有 {reply['duplicate_count']} 条相似回复已合并)"
+                readable_file.write(f"{reply.get('created_at', 'N/A')}: {content}\n")
+            readable_file.write("\n")
+        grouped_file.write("\n]" if index >= 0 else "]")
+
+
+def _time_index_paths(topic_id):
+    internal = os.path.join(CACHE_DIR, "internal")
+    return (
+        os.path.join(internal, f"{topic_id}_time_index.json"),
+        os.path.join(internal, f"{topic_id}_time_replies.jsonl"),
+    )
+
+
+class _TimeIndexedReplies:
+    """
+    磁盘上按 created_at 索引的完整分组回复。
+    回复逐行保存在 {topic_id}_time_replies.jsonl 中；{topic_id}_time_index.json 记录帖子内容键、
+    用户信息、每条回复的文件偏移和排好序的 created_at 索引。
+    选择时间窗口时只读取窗口内的回复，程序重启后也不必重新清理、分组和排序。
+    """
+
+    def __init__(self, replies_path, users, offsets, index):
+        self.replies_path = replies_path
+        self.users = users
+        self.offsets = offsets
+        self.index = index
+
+    @classmethod
+    def save(cls, topic_id, content_key, grouped_data):
+        index_path, replies_path = _time_index_paths(topic_id)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        index = time_window.CreatedAtIndex(grouped_data)
+        offsets = []
+        with raw_cache.atomic_path(replies_path) as replies_temp, open(
+            replies_temp, "wb"
+        ) as f:
+            for user_data in grouped_data:
+                user_offsets = []
+                for reply in user_data.get("replies", []):
+                    user_offsets.append(f.tell())
+                    f.write(json.dumps(reply, ensure_ascii=False).encode("utf-8"))
+                    f.write(b"\n")
+                offsets.append(user_offsets)
+        users = [
+            {key: value for key, value in user_data.items() if key != "replies"}
+            for user_data in grouped_data
+        ]
+        # 索引最后写入，回复文件写入失败时不会留下指向它的索引
+        with raw_cache.atomic_path(index_path) as index_temp, open(
+            index_temp, "w", encoding="utf-8"
+        ) as f:
+            json.dump(
+                {
+                    "key": content_key,
+                    "users": users,
+                    "offsets": offsets,
+                    "keys": index.keys,
+                    "positions": index.positions,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        return cls(replies_path, users, offsets, index)
+
+    @classmethod
+    def load(cls, topic_id, content_key):
+        """读取磁盘上的索引。不存在、已损坏或内容键不同时返回 None。"""
+        index_path, replies_path = _time_index_paths(topic_id)
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("key") != content_key or not os.path.exists(replies_path):
+                return None
+            index = time_window.CreatedAtIndex.from_sorted(
+                data["keys"], [tuple(position) for position in data["positions"]]
+            )
+            return cls(replies_path, data["users"], data["offsets"], index)
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def __len__(self):
+        return len(self.index)
+
+    def select(self, window):
+        """返回只包含窗口内回复的分组数据，与 CreatedAtIndex.select 的结果相同。"""
+        selected = self.index.selected_replies(window)
+        result = []
+        with open(self.replies_path, "rb") as f:
+            for user_index in sorted(selected):
+                replies = []
+                for reply_index in sorted(selected[user_index]):
+                    f.seek(self.offsets[user_index][reply_index])
+                    replies.append(json.loads(f.readline()))
+                result.append(dict(self.users[user_index], replies=replies))
+        return result
+
+
+# {topic_id: (帖子内容键, _TimeIndexedReplies)}，调整时间窗口时不必重新读取磁盘上的索引
+_time_index_cache = _LRUCache(INDEX_CACHE_TOPICS)
+
+
+def _select_time_window(topic_id, content_key, window, build_grouped_data, store=None):
+    """
+    只保留时间窗口内的回复。created_at 索引以帖子内容键为键保存在磁盘上，
+    同一话题内容未变时（包括程序重启后）直接按索引读取窗口内的回复。
+    启用 SQLite 帖子库时改为用其 created_at 索引直接查询窗口内的回复。
+    """
+    if store is not None:
+        if not store.replies_current(topic_id, CLEANER_VERSION):
+            # 清理后的回复还不在帖子库中，先清理并写回
+            build_grouped_data()
+        selected = _group_replies(store.replies_since(topic_id, window[0], until=window[1]))
+        kept = sum(len(user_data["replies"]) for user_data in selected)
+        print(f"时间窗口 {time_window.describe(window)}: 从 SQLite 帖子库查询到 {kept} 条回复。")
+        return selected
+
+    cached = _time_index_cache.get(topic_id)
+    if cached is not None and cached[0] == content_key:
+        indexed_replies = cached[1]
+    else:
+        indexed_replies = _TimeIndexedReplies.load(topic_id, content_key)
+        if indexed_replies is None:
+            indexed_replies = _TimeIndexedReplies.save(
+                topic_id, content_key, build_grouped_data()
+            )
+        _time_index_cache.put(topic_id, (content_key, indexed_replies))
+    selected = indexed_replies.select(window)
+    kept = sum(len(user_data["replies"]) for user_data in selected)
+    print(
+        f"时间窗口 {time_window.describe(window)}: 保留 {kept} / {len(indexed_replies)} 条回复。"
+    )
+    return selected
+
+
+@metrics.timed("dedup")
+def _collapse_duplicates(grouped_data, threshold):
+    """合并近似重复的回复，并打印缩减的比例。"""
+    collapsed, stats = dedup.collapse_near_duplicates(grouped_data, threshold)
+    before, after = stats["replies_before"], stats["replies_after"]
+    if before > after:
+        print(
+            f"近似重复合并: 回复 {before} -> {after} 条 ({stats['groups']} 组重复)，"
+            f"回复正文减少 {stats['chars_removed'] / max(1, stats['chars_before']):.1%}。"
+        )
+    metrics.increment("dedup_replies_removed", before - after)
+    return collapsed
+
+
+@metrics.timed("write_derived_files")
+def _write_derived_files(
+    topic_id, base_url, all_posts_raw, store=None, config=None, spool=None, fingerprint=None
+):
+    """
+    写入派生文件。
+    派生文件以原始帖子的内容指纹（含清理规则版本）和 base_url 为键，记录在
+    cache/internal/{topic_id}_manifest.json 中；键未变化且文件完好时跳过清理、分组和写入。
+    流式模式 (STREAMING_PIPELINE) 下回复经 _ReplySpool 逐个清理和分组，不在内存中保留整个话题；
+    spool 和 fingerprint 为获取帖子时已经边获取边算好的结果。
+    """
+    streaming = bool(config and config.get("STREAMING_PIPELINE")) and store is None
     try:
         if not os.path.exists(CACHE_DIR):
             os.makedirs(CACHE_DIR)
 
-        grouped_data = group_and_sort_replies_by_user(base_url, all_posts_raw)
         grouped_path = os.path.join(CACHE_DIR, f"{topic_id}_ai_input_file.json")
         readable_path = os.path.join(CACHE_DIR, f"{topic_id}_readable.txt")
+        manifest_path = _manifest_path(topic_id)
+        if fingerprint is None:
+            fingerprint = posts_fingerprint(all_posts_raw)
+        derived_key = f"{fingerprint}:{base_url}"
+        dedup_enabled = bool(config and config.get("ENABLE_DEDUP", False)) and not streaming
+        if dedup_enabled:
+            derived_key += f":dedup={config.get('DEDUP_THRESHOLD', 0.8)}"
+        window = time_window.resolve(config)
+        if window is not None:
+            # 相对日期按天解析，窗口随日期推移时派生文件会重新生成
+            derived_key += f":window={window[0]}~{window[1]}"
 
-        with open(grouped_path, "w", encoding="utf-8") as f:
-            json.dump(grouped_data, f, ensure_ascii=False, indent=4)
+        def load_grouped_data():
+            with open(grouped_path, "r", encoding="utf-8") as f:
+                return json.load(f)
 
-        with open(readable_path, "w", encoding="utf-8") as f:
-            for user_data in grouped_data:
-                f.write(f'"username": "{user_data.get("username", "N/A")}"\n')
-                for reply in user_data.get("replies", []):
-                    f.write(
-                        f"{reply.get('created_at', 'N/A')}: {reply.get('reply_content', '').replace('n', ' ')}\n"
+        if _derived_files_current(manifest_path, derived_key, (grouped_path, readable_path)):
+            print("原始帖子未变化，派生文件已是最新，跳过重新生成。")
+        else:
+            if streaming:
+                if spool is None:
+                    os.makedirs(os.path.join(CACHE_DIR, "internal"), exist_ok=True)
+                    spool = _ReplySpool(base_url, window)
+                    for post in all_posts_raw:
+                        spool.add(post)
+                users = spool.users()
+            else:
+                if window is not None:
+                    grouped_data = _select_time_window(
+                        topic_id,
+                        f"{fingerprint}:{base_url}",
+                        window,
+                        lambda: group_and_sort_replies_by_user(
+                            base_url, all_posts_raw, store=store, topic_id=topic_id
+                        ),
+                        store=store,
+                    )
+                else:
+                    grouped_data = group_and_sort_replies_by_user(
+                        base_url, all_posts_raw, store=store, topic_id=topic_id
+                    )
+                if dedup_enabled:
+                    grouped_data = _collapse_duplicates(
+                        grouped_data, config.get("DEDUP_THRESHOLD", 0.8)
                     )
-                f.write("\n")
+                users = grouped_data
+                load_grouped_data = lambda: grouped_data
 
-        print(f"成功将处理后的派生文件保存到 ./{CACHE_DIR}/ 目录中。")
-    except (IOError, OSError) as e:
+            _write_grouped_and_readable(grouped_path, readable_path, users)
+
+            _write_manifest(manifest_path, derived_key, (grouped_path, readable_path))
+            print(f"成功将处理后的派生文件保存到 ./{CACHE_DIR}/ 目录中。")
+
+        if config and config.get("ENABLE_DP_EXTRACTION", False):
+            # DP 表随派生文件的内容（去重、时间窗口）变化，以 derived_key 为键
+            _write_dp_table(topic_id, derived_key, load_grouped_data, config)
+    except (IOError, OSError, ValueError, sqlite3.Error) as e:
         print(f"错误: 写入派生缓存文件失败: {e}")
+    finally:
+        if spool is not None:
+            spool.close()
+
+
+class FetchInterrupted(Exception):
+    """抓取中途失败。partial_posts 为失败前已经获取到的帖子，可保存下来供下次续传。"""
+
+    def __init__(self, partial_posts):
+        super().__init__(f"抓取中断，已获取 {len(partial_posts)} 个帖子。")
+        self.partial_posts = partial_posts
+
+
+def _get_post_store(config):
+    """USE_SQLITE_STORE 启用时返回共用的 SQLite 帖子库，否则返回 None。"""
+    if not config.get("USE_SQLITE_STORE", False):
+        return None
+    return open_store(os.path.join(CACHE_DIR, "internal", cache_manager.STORE_NAME))
+
+
+def _read_raw_cache(raw_cache_path):
+    """读取原始帖子缓存，自动识别旧的 JSON 格式和紧凑格式（含压缩）。"""
+    return raw_cache.read_posts(raw_cache_path)
+
+
+def _write_raw_cache(raw_cache_path, posts, config):
+    """按 RAW_CACHE_FORMAT 和 RAW_CACHE_COMPRESSION 写入原始帖子缓存。"""
+    raw_cache.write_posts(
+        raw_cache_path,
+        posts,
+        compact=config.get("RAW_CACHE_FORMAT", "json") == "compact",
+        compression=config.get("RAW_CACHE_COMPRESSION", "none"),
+    )
+
+
+def _partial_cache_path(topic_id):
+    return os.path.join(CACHE_DIR, "internal", f"{topic_id}_partial.json")
+
+
+def _full_fetch_path(topic_id):
+    return os.path.join(CACHE_DIR, "internal", f"{topic_id}_full_fetch.json")
+
+
+def _full_refresh_due(topic_id, config):
+    """距上次完整获取是否已超过 FULL_REFRESH_EVERY_DAYS 天。没有记录时（如升级前的缓存）视为已超过。"""
+    every_days = config.get("FULL_REFRESH_EVERY_DAYS", 7)
+    if not every_days:
+        return False
+    try:
+        with open(_full_fetch_path(topic_id), "r", encoding="utf-8") as f:
+            fetched_at = json.load(f)["fetched_at"]
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return True
+    return time.time() - fetched_at > every_days * 86400
+
+
+def _record_full_fetch(topic_id):
+    try:
+        with raw_cache.atomic_path(_full_fetch_path(topic_id)) as temp_path:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"fetched_at": time.time()}, f)
+    except (IOError, OSError) as e:
+        print(f"警告: 无法记录完整获取的时间: {e}")
+
+
+def _session_state_path():
+    return os.path.join(CACHE_DIR, "internal", "session_state.json")
+
+
+def _is_session_rejected(error):
+    """Cloudflare 质询失败或服务器返回 403 时，保存的会话已不可用。"""
+    if isinstance(error, cloudscraper.exceptions.CloudflareException):
+        return True
+    response = getattr(error, "response", None)
+    return response is not None and response.status_code == 403
 
 
+def _save_partial_posts(topic_id, partial_posts, config):
+    """保存中断时已获取的帖子，下次获取该话题时只需补齐剩余部分。"""
+    if not partial_posts:
+        return
+    partial_path = _partial_cache_path(topic_id)
+    try:
+        os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+        _write_raw_cache(partial_path, partial_posts, config)
+        print(f"已保存 {len(partial_posts)} 个已获取的帖子，下次运行时将继续获取剩余部分。")
+    except (IOError, OSError) as e:
+        print(f"警告: 无法保存已获取的帖子: {e}")
+
+
+def _fetch_json(scraper, url, max_retries, backoff_factor):
+    """
+    请求一个 JSON 接口。
+    对 5xx 和连接错误按指数退避重试；对 429/503 限流响应优先按 Retry-After 等待，
+    并通知共用的限速器降低请求速率。
+    """
+    _load_network_modules()
+    response = None
+
+    for attempt in range(max_retries):
+        # 任务被取消时不再发出新请求，已获取的分页由调用方保存
+        cancellation.check()
+        try:
+            rate_limit.acquire(url)
+            cancellation.check()
+            request_start = time.perf_counter()
+            try:
+                response = scraper.get(url, timeout=15, verify=certifi.where())
+            except requests.exceptions.RequestException:
+                metrics.record_request(time.perf_counter() - request_start, 0, "error")
+                raise
+            metrics.record_request(
+                time.perf_counter() - request_start,
+                len(response.content),
+                response.status_code,
+            )
+            response.raise_for_status()
+            rate_limit.report_success(url)
+            break
+        except requests.exceptions.RequestException as e:
+            status_code = (
+                e.response.status_code
+                if isinstance(e, requests.exceptions.HTTPError)
+                and e.response is not None
+                else None
+            )
+            is_throttled = status_code in [429, 503]
+            is_retryable_http_error = status_code in [500, 502, 504]
+            is_connection_error = not isinstance(e, requests.exceptions.HTTPError)
+
+            if attempt == max_retries - 1 or not (
+                is_throttled or is_retryable_http_error or is_connection_error
+            ):
+                raise e
+
+            metrics.increment(
+                f"retries_http_{status_code}" if status_code else "retries_connection"
+            )
+            wait_time = backoff_factor * (2**attempt)
+            if is_throttled:
+                retry_after = rate_limit.parse_retry_after(
+                    e.response.headers.get("Retry-After")
+                )
+                max_wait = rate_limit.retry_after_max()
+                # 限速器最多暂停 max_wait 秒，过长的 Retry-After 不会让同一主机的所有请求停顿几个小时
+                rate_limit.report_throttled(
+                    url, min(retry_after, max_wait) if retry_after is not None else None
+                )
+                new_rate = rate_limit.current_rate(url)
+                if new_rate is not None:
+                    print(f"服务器限流 (HTTP {status_code})，请求速率降至 {new_rate:.2f} 次/秒。")
+                if retry_after is not None and retry_after > max_wait:
+                    print(
+                        f"服务器要求 {retry_after:.0f} 秒后再重试，超过 RETRY_AFTER_MAX_SECONDS "
+                        f"({max_wait} 秒)，本次请求按失败处理。"
+                    )
+                    raise e
+                if retry_after is not None:
+                    wait_time = retry_after
+            # 使用 print 来输出到GUI日志
+            print(
+                f"请求失败 ({str(e)}), {wait_time:.1f}秒后重试 (第 {attempt + 1}/{max_retries} 次)..."
+            )
+            cancellation.sleep(wait_time)
+            response = None
+
+    if response is None:
+        print("\n错误：所有重试尝试均失败。")
+        return None
+
+    with metrics.phase("json_parse"):
+        return response.json()
+
+
+def _fetch_page_posts(scraper, base_url, topic_id, page, max_retries, backoff_factor):
+    """获取单个分页中的帖子列表。"""
+    data = _fetch_json(
+        scraper, f"{base_url}/t/{topic_id}.json?page={page}", max_retries, backoff_factor
+    )
+    if data is None:
+        raise requests.exceptions.RequestException(f"第 {page} 页获取失败。")
+    return data.get("post_stream", {}).get("posts", [])
+
+
+def _fetch_posts_by_ids(
+    scraper, base_url, topic_id, post_ids, max_retries, backoff_factor
+):
+    """通过 /t/{topic_id}/posts.json?post_ids[]=... 一次获取一批指定 id 的帖子。"""
+    query = urlencode([("post_ids[]", post_id) for post_id in post_ids])
+    data = _fetch_json(
+        scraper,
+        f"{base_url}/t/{topic_id}/posts.json?{query}",
+        max_retries,
+        backoff_factor,
+    )
+    if data is None:
+        raise requests.exceptions.RequestException(
+            f"批量获取 {len(post_ids)} 个帖子失败。"
+        )
+    return data.get("post_stream", {}).get("posts", [])
+
+
+def _fetch_concurrently(fetch_one, keys, concurrency, on_result=None, results=None):
+    """
+    对每个 key 调用 fetch_one(key)，返回 {key: result}。concurrency > 1 时使用有界线程池。
+    传入 results 时结果直接写入其中，中途失败时调用方仍能拿到已完成的部分。
+    """
+    if results is None:
+        results = {}
+    if concurrency <= 1:
+        for key in keys:
+            results[key] = fetch_one(key)
+            if on_result:
+                on_result(results[key])
+        return results
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # 每个任务在调用方上下文的副本中运行，运行指标等 contextvars 才能传到工作线程
+        futures = {
+            executor.submit(contextvars.copy_context().run, fetch_one, key): key
+            for key in keys
+        }
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                results[futures[future]] = result
+                if on_result:
+                    on_result(result)
+        except BaseException:
+            # 任意一个请求彻底失败时，取消尚未开始的请求，尽快返回
+            for future in futures:
+                future.cancel()
+            raise
+    return results
+
+
+def _fetch_pages(
+    scraper, base_url, topic_id, pages, concurrency, max_retries, backoff_factor,
+    on_page=None, results=None,
+):
+    """获取多个分页，返回 {page: posts}。"""
+    return _fetch_concurrently(
+        lambda page: _fetch_page_posts(
+            scraper, base_url, topic_id, page, max_retries, backoff_factor
+        ),
+        pages,
+        concurrency,
+        on_result=on_page,
+        results=results,
+    )
+
+
+def _reassemble_pages(pages_posts):
+    """按页码拼接分页结果，去掉分页边界移动造成的重复帖子，并按 post_number 排序。"""
+    seen_ids = set()
+    posts = []
+    for page in sorted(pages_posts):
+        for post in pages_posts[page]:
+            post_id = post.get("id")
+            if post_id is not None:
+                if post_id in seen_ids:
+                    continue
+                seen_ids.add(post_id)
+            posts.append(post)
+    posts.sort(key=lambda p: p.get("post_number", 0))
+    return posts
+
+
+def _plan_incremental_refresh(first_page_data, cached_posts, page_size, refetch_pages):
+    """
+    根据第 1 页返回的帖子 id 流 (post_stream.stream)，计算增量刷新需要获取哪些分页。
+    返回 (pages, kept_posts)；服务器未返回 id 流时返回 None，表示只能完整获取。
+    """
+    stream = first_page_data.get("post_stream", {}).get("stream")
+    if not stream:
+        return None
+
+    stream_ids = set(stream)
+    # 不再出现在 id 流中的帖子已被删除，直接从缓存中丢弃
+    kept_posts = [p for p in cached_posts if p.get("id") in stream_ids]
+    cached_ids = {p.get("id") for p in kept_posts}
+    # 第 N 页对应 id 流中 [(N-1)*page_size, N*page_size) 的帖子，只获取含有未缓存帖子的分页
+    missing_pages = {
+        i // page_size + 1
+        for i, post_id in enumerate(stream)
+        if post_id not in cached_ids
+    }
+    # 额外重新获取第一个缺失分页之前的 refetch_pages 页（全部已缓存时为最后几页），
+    # 以拿到最近被编辑过的帖子的新内容
+    first_missing_page = (
+        min(missing_pages) if missing_pages else -(-len(stream) // page_size) + 1
+    )
+    refetch = range(first_missing_page - refetch_pages, first_missing_page)
+    pages = sorted(page for page in missing_pages.union(refetch) if page >= 2)
+    return pages, kept_posts
+
+
+def _merge_posts(base_posts, new_posts):
+    """将新获取的帖子合并到已有帖子中。同一 id 以新数据为准，结果按 post_number 排序。"""
+    merged = {post.get("id"): post for post in base_posts}
+    for post in new_posts:
+        merged[post.get("id")] = post
+    return sorted(merged.values(), key=lambda p: p.get("post_number", 0))
+
+
+def _fetch_first_page(scraper, base_url, topic_id, config):
+    """
+    各种获取方式共用的开头：读取重试和并发设置，获取第 1 页并检查话题是否有帖子。
+    返回 (第 1 页数据, (max_retries, backoff_factor, concurrency))，
+    请求失败或话题无效时返回 None。
+    """
+    _load_network_modules()
+    fetch_settings = (
+        config.get("MAX_RETRIES", 5),
+        config.get("BACKOFF_FACTOR", 1),
+        max(1, config.get("FETCH_CONCURRENCY", 1)),
+    )
+    first_page_data = _fetch_json(
+        scraper, f"{base_url}/t/{topic_id}.json?page=1", *fetch_settings[:2]
+    )
+    if first_page_data is None:
+        return None
+    if first_page_data.get("posts_count", 0) == 0:
+        print("\n错误: 未找到任何帖子，或帖子URL无效。")
+        return None
+    return first_page_data, fetch_settings
+
+
+def _fetch_topic_posts(
+    scraper, base_url, topic_id, config, progress_callback=None, cached_posts=None,
+    first_page=None,
+):
+    """
+    从网络获取话题的所有帖子。
+    传入 cached_posts 时进行增量刷新：只获取缓存之后新增的分页，再与缓存合并。
+    first_page 为已经获取的 _fetch_first_page 结果，传入时不再重复请求第 1 页。
+    """
+    if first_page is None:
+        first_page = _fetch_first_page(scraper, base_url, topic_id, config)
+        if first_page is None:
+            return None
+    first_page_data, (max_retries, backoff_factor, concurrency) = first_page
+    total_posts_count = first_page_data["posts_count"]
+
+    first_posts = first_page_data.get("post_stream", {}).get("posts", [])
+    if not first_posts:
+        return []
+
+    page_size = len(first_posts)
+    last_page = -(-total_posts_count // page_size)
+    pages = range(2, last_page + 1)
+    base_posts = []
+
+    if cached_posts:
+        plan = _plan_incremental_refresh(
+            first_page_data,
+            cached_posts,
+            page_size,
+            config.get("INCREMENTAL_REFETCH_PAGES", 1),
+        )
+        if plan is None:
+            print("服务器未返回帖子 id 列表，无法增量刷新，将完整获取。")
+        else:
+            pages, base_posts = plan
+            print(
+                f"增量刷新: 缓存中保留 {len(base_posts)} 个帖子，"
+                f"需要获取 {len(pages)} 页 (共 {last_page} 页)。"
+            )
+
+    total_pages = len(pages) + 1
+    pages_posts = {1: first_posts}
+
+    def on_page(page_posts):
+        # 调用回调函数来更新GUI进度条
+        if progress_callback:
+            progress_callback(min(len(pages_posts), total_pages), total_pages)
+
+    on_page(first_posts)
+    if concurrency > 1 and len(pages) > 1:
+        print(
+            f"共 {total_posts_count} 个帖子，使用 {concurrency} 个并发连接获取 {len(pages)} 页..."
+        )
+
+    try:
+        _fetch_pages(
+            scraper, base_url, topic_id, pages, concurrency, max_retries,
+            backoff_factor, on_page=on_page, results=pages_posts,
+        )
+
+        # 抓取期间有新回复时，最后一页会比预期多，继续向后获取直到遇到不满的一页
+        page = last_page
+        expected_last_page_size = total_posts_count - (last_page - 1) * page_size
+        while len(pages_posts.get(page, [])) >= page_size and (
+            page > last_page or expected_last_page_size < page_size
+        ):
+            page += 1
+            posts = _fetch_page_posts(
+                scraper, base_url, topic_id, page, max_retries, backoff_factor
+            )
+            if not posts:
+                break
+            pages_posts[page] = posts
+    except (
+        requests.exceptions.RequestException,
+        cloudscraper.exceptions.CloudflareException,
+        cancellation.Cancelled,
+    ) as e:
+        raise FetchInterrupted(
+            _merge_posts(base_posts, _reassemble_pages(pages_posts))
+        ) from e
+
+    # 确保进度条在循环结束后显示为100%
+    if progress_callback:
+        progress_callback(total_posts_count, total_posts_count)
+
+    fetched_posts = _reassemble_pages(pages_posts)
+    if base_posts:
+        fetched_posts = _merge_posts(base_posts, fetched_posts)
+    return fetched_posts
+
+
+def _fetch_topic_posts_by_stream(
+    scraper, base_url, topic_id, config, progress_callback=None, cached_posts=None
+):
+    """
+    按帖子 id 流获取话题的所有帖子。
+    第 1 页返回的 post_stream.stream 是整个话题的 id 快照，之后按 id 分批获取，
+    不受抓取期间新增或删除回复导致的分页移动影响。缺失的 id 会重新请求。
+    服务器未返回 id 流时退回分页模式。
+    """
+    first_page = _fetch_first_page(scraper, base_url, topic_id, config)
+    if first_page is None:
+        return None
+    first_page_data, (max_retries, backoff_factor, concurrency) = first_page
+    batch_size = max(1, config.get("POST_ID_BATCH_SIZE", 100))
+
+    post_stream = first_page_data.get("post_stream", {})
+    stream = post_stream.get("stream")
+    if not stream:
+        print("服务器未返回帖子 id 列表，改用分页模式获取。")
+        return _fetch_topic_posts(
+            scraper, base_url, topic_id, config, progress_callback, cached_posts,
+            first_page,
+        )
+
+    stream_ids = set(stream)
+    posts_by_id = {}
+    if cached_posts:
+        # 不再出现在 id 流中的帖子已被删除，直接丢弃
+        for post in cached_posts:
+            if post.get("id") in stream_ids:
+                posts_by_id[post.get("id")] = post
+        # 与分页模式一致，第一个未缓存帖子之前 INCREMENTAL_REFETCH_PAGES 页范围内的帖子
+        # 重新获取，以拿到最近被编辑过的回复
+        first_missing = next(
+            (i for i, post_id in enumerate(stream) if post_id not in posts_by_id),
+            len(stream),
+        )
+        refetch_count = config.get("INCREMENTAL_REFETCH_PAGES", 1) * len(
+            post_stream.get("posts", [])
+        )
+        for post_id in stream[max(0, first_missing - refetch_count) : first_missing]:
+            posts_by_id.pop(post_id, None)
+    for post in post_stream.get("posts", []):
+        posts_by_id[post.get("id")] = post
+
+    missing_ids = [post_id for post_id in stream if post_id not in posts_by_id]
+    if cached_posts:
+        print(
+            f"增量刷新: 缓存中保留 {len(posts_by_id)} 个帖子，需要获取 {len(missing_ids)} 个。"
+        )
+
+    def on_batch(batch_posts):
+        # 调用回调函数来更新GUI进度条
+        if progress_callback:
+            progress_callback(min(len(posts_by_id), len(stream)), len(stream))
+
+    def fetch_batch(batch):
+        batch_posts = _fetch_posts_by_ids(
+            scraper, base_url, topic_id, batch, max_retries, backoff_factor
+        )
+        for post in batch_posts:
+            if post.get("id") in stream_ids:
+                posts_by_id[post.get("id")] = post
+        return batch_posts
+
+    def ordered_posts():
+        return [posts_by_id[post_id] for post_id in stream if post_id in posts_by_id]
+
+    on_batch(None)
+    try:
+        for attempt in range(max(1, max_retries)):
+            if not missing_ids:
+                break
+            batches = [
+                tuple(missing_ids[i : i + batch_size])
+                for i in range(0, len(missing_ids), batch_size)
+            ]
+            if attempt == 0:
+                print(
+                    f"共 {len(stream)} 个帖子，分 {len(batches)} 批获取 (每批最多 {batch_size} 个)..."
+                )
+            else:
+                print(f"仍有 {len(missing_ids)} 个帖子未返回，重新请求...")
+            _fetch_concurrently(fetch_batch, batches, concurrency, on_result=on_batch)
+            missing_ids = [
+                post_id for post_id in missing_ids if post_id not in posts_by_id
+            ]
+    except (
+        requests.exceptions.RequestException,
+        cloudscraper.exceptions.CloudflareException,
+        cancellation.Cancelled,
+    ) as e:
+        raise FetchInterrupted(ordered_posts()) from e
+
+    if missing_ids:
+        print(f"警告: 有 {len(missing_ids)} 个帖子多次请求后仍未返回，可能已被删除或隐藏。")
+
+    # 确保进度条在循环结束后显示为100%
+    if progress_callback:
+        progress_callback(len(stream), len(stream))
+
+    return ordered_posts()
+
+
+def _stream_pages(
+    scraper, base_url, topic_id, first_page_data, fetch_settings, progress_callback
+):
+    """
+    按页码顺序逐页产出帖子列表。每批并发获取最多 FETCH_CONCURRENCY * 2 页，
+    抓取期间有新回复时继续向后获取，直到遇到不满的一页。
+    """
+    max_retries, backoff_factor, concurrency = fetch_settings
+    total_posts_count = first_page_data["posts_count"]
+    first_posts = first_page_data.get("post_stream", {}).get("posts", [])
+    page_size = max(1, len(first_posts))
+    last_page = -(-total_posts_count // page_size)
+    expected_last_page_size = total_posts_count - (last_page - 1) * page_size
+    window_size = concurrency * 2
+    print(f"流式获取: 共 {total_posts_count} 个帖子 ({last_page} 页)，边获取边写入缓存。")
+
+    yield first_posts
+    if progress_callback:
+        progress_callback(1, last_page)
+    page = 1
+    last_page_len = len(first_posts)
+    while page < last_page or (
+        last_page_len >= page_size
+        and (page > last_page or expected_last_page_size < page_size)
+    ):
+        if page < last_page:
+            window = range(page + 1, min(last_page, page + window_size) + 1)
+        else:
+            window = range(page + 1, page + 2)
+        window_posts = _fetch_pages(
+            scraper, base_url, topic_id, window, concurrency, max_retries,
+            backoff_factor,
+        )
+        for page in window:
+            yield window_posts[page]
+            last_page_len = len(window_posts[page])
+        if progress_callback:
+            progress_callback(min(page, last_page), last_page)
+        if page >= last_page and not last_page_len:
+            break
+
+
+def _stream_id_batches(
+    scraper, base_url, topic_id, first_page_data, fetch_settings, config,
+    progress_callback,
+):
+    """
+    按第 1 页返回的 id 流顺序产出帖子列表。每批并发获取最多 FETCH_CONCURRENCY * 2 组 id，
+    每组最多 POST_ID_BATCH_SIZE 个；本批中未返回的 id 重新请求，多次仍未返回的跳过。
+    """
+    max_retries, backoff_factor, concurrency = fetch_settings
+    batch_size = max(1, config.get("POST_ID_BATCH_SIZE", 100))
+    post_stream = first_page_data["post_stream"]
+    stream = post_stream["stream"]
+    first_posts = {post.get("id"): post for post in post_stream.get("posts", [])}
+    window_size = batch_size * concurrency * 2
+    print(
+        f"流式获取: 共 {len(stream)} 个帖子，按 id 分批获取 (每批最多 {batch_size} 个)，"
+        "边获取边写入缓存。"
+    )
+
+    def fetch_batch(batch):
+        return _fetch_posts_by_ids(
+            scraper, base_url, topic_id, batch, max_retries, backoff_factor
+        )
+
+    skipped = 0
+    for start in range(0, len(stream), window_size):
+        window_ids = stream[start : start + window_size]
+        wanted_ids = set(window_ids)
+        posts_by_id = {
+            post_id: first_posts[post_id]
+            for post_id in window_ids
+            if post_id in first_posts
+        }
+        missing_ids = [post_id for post_id in window_ids if post_id not in posts_by_id]
+        for _ in range(max(1, max_retries)):
+            if not missing_ids:
+                break
+            batches = [
+                tuple(missing_ids[i : i + batch_size])
+                for i in range(0, len(missing_ids), batch_size)
+            ]
+            for batch_posts in _fetch_concurrently(
+                fetch_batch, batches, concurrency
+            ).values():
+                for post in batch_posts:
+                    if post.get("id") in wanted_ids:
+                        posts_by_id[post.get("id")] = post
+            missing_ids = [
+                post_id for post_id in missing_ids if post_id not in posts_by_id
+            ]
+        skipped += len(missing_ids)
+        yield [posts_by_id[post_id] for post_id in window_ids if post_id in posts_by_id]
+        if progress_callback:
+            progress_callback(min(start + window_size, len(stream)), len(stream))
+
+    if skipped:
+        print(f"警告: 有 {skipped} 个帖子多次请求后仍未返回，可能已被删除或隐藏。")
+
+
+def _stream_topic_posts(
+    scraper, base_url, topic_id, config, raw_cache_path, spool, digest,
+    progress_callback=None,
+):
+    """
+    流式完整获取，用于非常大的话题。FETCH_MODE 为 stream 且服务器返回了 id 流时按 id 分批获取，
+    否则按分页获取。帖子按顺序逐个追加写入紧凑格式的原始缓存，
+    同时计入内容指纹并交给 spool 清理分组。内存中只保留当前这一批帖子。
+    成功时返回帖子数，话题无效时返回 None。
+    中途失败时已写入的部分移作续传文件，并抛出 FetchInterrupted。
+    """
+    first_page = _fetch_first_page(scraper, base_url, topic_id, config)
+    if first_page is None:
+        return None
+    first_page_data, fetch_settings = first_page
+
+    stream = first_page_data.get("post_stream", {}).get("stream")
+    if config.get("FETCH_MODE", "pages") == "stream" and stream:
+        chunks = _stream_id_batches(
+            scraper, base_url, topic_id, first_page_data, fetch_settings, config,
+            progress_callback,
+        )
+    else:
+        if config.get("FETCH_MODE", "pages") == "stream":
+            print("服务器未返回帖子 id 列表，流式获取改用分页模式。")
+        chunks = _stream_pages(
+            scraper, base_url, topic_id, first_page_data, fetch_settings,
+            progress_callback,
+        )
+
+    # 同一话题可能同时有多个获取（多个任务、后台刷新），各自写自己的临时文件
+    temp_path = raw_cache.unique_temp_path(raw_cache_path)
+    os.makedirs(os.path.dirname(raw_cache_path), exist_ok=True)
+    writer = raw_cache.PostWriter(temp_path, config.get("RAW_CACHE_COMPRESSION", "none"))
+    seen_ids = set()
+
+    try:
+        for chunk in chunks:
+            # 分页边界移动时相邻两页可能返回同一个帖子，只保留第一次出现的
+            for post in chunk:
+                post_id = post.get("id")
+                if post_id is not None:
+                    if post_id in seen_ids:
+                        continue
+                    seen_ids.add(post_id)
+                writer.write(post)
+                _add_to_fingerprint(digest, post)
+                spool.add(post)
+    except (
+        requests.exceptions.RequestException,
+        cloudscraper.exceptions.CloudflareException,
+        cancellation.Cancelled,
+    ) as e:
+        writer.close()
+        # 已写入的部分本身就是完整的紧凑格式缓存，直接作为下次续传的基础
+        os.replace(temp_path, _partial_cache_path(topic_id))
+        print(f"\n已保存 {writer.count} 个已获取的帖子，下次运行时将继续获取剩余部分。")
+        raise FetchInterrupted([]) from e
+    except BaseException:
+        writer.close()
+        os.remove(temp_path)
+        raise
+
+    writer.close()
+    os.replace(temp_path, raw_cache_path)
+    if progress_callback:
+        progress_callback(1, 1)
+    return writer.count
+
+
+@metrics.timed("get_all_posts")
 def get_all_posts(
     base_url, topic_id, config, progress_callback=None
 ):  # 新增 progress_callback
     """获取所有帖子，使用正确的分页逻辑。"""
     cache_hours = config.get("CACHE_DURATION_HOURS", 24)
-    max_retries = config.get("MAX_RETRIES", 5)
-    backoff_factor = config.get("BACKOFF_FACTOR", 1)
+    rate_limit.configure(
+        config.get("RATE_LIMIT_PER_SECOND", 5),
+        config.get("RATE_LIMIT_MIN_PER_SECOND"),
+        config.get("RATE_LIMIT_MAX_PER_SECOND"),
+        config.get("RETRY_AFTER_MAX_SECONDS", 120),
+    )
     raw_cache_path = os.path.join(CACHE_DIR, "internal", f"{topic_id}_raw.json")
+    cache_manager.touch(CACHE_DIR, topic_id)
+    store = _get_post_store(config)
+    # 流式模式下不把整个话题载入内存，缓存命中时返回按需读取文件的 LazyPosts
+    streaming = config.get("STREAMING_PIPELINE", False) and store is None
     all_posts_raw = None
+    cached_posts = None
+    spool = None
+    fingerprint = None
+    revalidate = False
 
-    if os.path.exists(raw_cache_path):
-        try:
-            file_mod_time = os.path.getmtime(raw_cache_path)
-            age_seconds = time.time() - file_mod_time
-            if age_seconds < (cache_hours * 3600):
-                print(
-                    f"缓存命中。正在从 '{os.path.basename(raw_cache_path)}' 加载帖子。"
-                )
-                with open(raw_cache_path, "r", encoding="utf-8") as f:
-                    all_posts_raw = json.load(f)
+    try:
+        if store is not None:
+            cache_name = "SQLite 帖子库"
+            cache_mod_time = store.topic_fetched_at(topic_id)
+            load_cached_posts = lambda: store.load_posts(topic_id)
+        else:
+            cache_name = f"'{os.path.basename(raw_cache_path)}'"
+            cache_mod_time = (
+                os.path.getmtime(raw_cache_path)
+                if os.path.exists(raw_cache_path)
+                else None
+            )
+            load_cached_posts = lambda: _read_raw_cache(raw_cache_path)
+
+        if cache_mod_time is not None:
+            age_seconds = time.time() - cache_mod_time
+            fresh = age_seconds < (cache_hours * 3600)
+            if fresh or config.get("STALE_WHILE_REVALIDATE", False):
+                if fresh:
+                    print(f"缓存命中。正在从 {cache_name} 加载帖子。")
+                    metrics.set_cache_outcome("hit")
+                with metrics.phase("cache_load"):
+                    if streaming:
+                        lazy_posts = raw_cache.LazyPosts(raw_cache_path)
+                        # 先数一遍帖子数，缓存文件损坏时在这里报错并改为从网络获取
+                        len(lazy_posts)
+                        all_posts_raw = lazy_posts
+                    else:
+                        all_posts_raw = load_cached_posts()
+                if not fresh and all_posts_raw:
+                    # 旧缓存读取成功后才使用它并启动后台刷新；读取失败时下面直接从网络获取一次
+                    print(f"缓存已过期，先使用 {cache_name} 中的旧数据，同时在后台刷新。")
+                    metrics.set_cache_outcome("stale")
+                    revalidate = True
                 # 如果从缓存加载，也更新一下进度条到100%
                 if progress_callback:
                     progress_callback(1, 1)  # (current, total)
+            elif config.get("INCREMENTAL_REFRESH", False) and _full_refresh_due(
+                topic_id, config
+            ):
+                print(
+                    f"缓存文件已过期，且距上次完整获取已超过 "
+                    f"{config.get('FULL_REFRESH_EVERY_DAYS', 7)} 天，"
+                    "将完整重新获取以更新被编辑过的旧回复。"
+                )
+                metrics.set_cache_outcome("expired_full_refresh")
+            elif config.get("INCREMENTAL_REFRESH", False):
+                print("缓存文件已过期，将从网络增量获取新帖子。")
+                metrics.set_cache_outcome("expired_incremental")
+                with metrics.phase("cache_load"):
+                    cached_posts = load_cached_posts()
             else:
                 print("缓存文件已过期，将从网络重新获取。")
-        except (IOError, json.JSONDecodeError) as e:
-            print(f"警告: 无法读取或解析缓存文件 ({e})。将从网络获取。")
+                metrics.set_cache_outcome("expired")
+        else:
+            metrics.set_cache_outcome("miss")
+    except (IOError, ValueError, sqlite3.Error) as e:
+        print(f"警告: 无法读取或解析缓存文件 ({e})。将从网络获取。")
+    # 基于过期缓存的增量刷新；上次中断时保存的帖子是刚获取的，续传仍算作完整获取
+    incremental = cached_posts is not None
+
+    partial_path = _partial_cache_path(topic_id)
+    if not all_posts_raw and os.path.exists(partial_path):
+        # 上次获取中途失败时保存的帖子，与过期缓存合并后作为增量获取的基础
+        try:
+            partial_posts = _read_raw_cache(partial_path)
+            print(f"发现上次中断时保存的 {len(partial_posts)} 个帖子，将继续获取剩余部分。")
+            cached_posts = _merge_posts(cached_posts or [], partial_posts)
+        except (IOError, ValueError) as e:
+            print(f"警告: 无法读取上次中断时保存的帖子 ({e})。")
 
     if not all_posts_raw:
         # 用 sys.stdout.write 以避免被重定向器添加不必要的换行符
         sys.stdout.write(f"正在从网络获取 topic_id: {topic_id} 的所有帖子...\n")
-        fetched_posts = []
-        page = 1
-        total_posts_count = 0
-
-        scraper = cloudscraper.create_scraper()
 
+        _load_network_modules()
+        user_agent = None
         if config.get("EnableCustomUserAgent") and config.get("CustomUserAgent"):
             user_agent = config["CustomUserAgent"]
             print(f"已启用自定义 User-Agent: {user_agent}")
-            headers = {
-                "User-Agent": user_agent
-            }
-            scraper.headers.update(headers)
+        session_state_path = (
+            _session_state_path() if config.get("PERSIST_SESSION", False) else None
+        )
+        scraper = session_pool.get_scraper(
+            base_url,
+            user_agent,
+            session_state_path,
+            config.get("SESSION_MAX_AGE_HOURS", 24) * 3600,
+        )
 
         try:
-            while True:
-                url = f"{base_url}/t/{topic_id}.json?page={page}"
-                response = None
-
-                for attempt in range(max_retries):
-                    try:
-                        response = scraper.get(url, timeout=15, verify=certifi.where())
-                        response.raise_for_status()
-                        break
-                    except requests.exceptions.RequestException as e:
-                        is_retryable_http_error = isinstance(
-                            e, requests.exceptions.HTTPError
-                        ) and e.response.status_code in [500, 502, 504]
-                        is_connection_error = not isinstance(
-                            e, requests.exceptions.HTTPError
-                        )
-
-                        if attempt == max_retries - 1 or not (
-                            is_retryable_http_error or is_connection_error
-                        ):
-                            raise e
+            if streaming and not cached_posts:
+                # 完整获取时边获取边写缓存和分组；增量刷新和续传仍走下面的常规路径
+                os.makedirs(os.path.dirname(raw_cache_path), exist_ok=True)
+                spool = _ReplySpool(base_url, time_window.resolve(config))
+                digest = _new_fingerprint()
+                with metrics.phase("fetch"):
+                    count = _stream_topic_posts(
+                        scraper, base_url, topic_id, config, raw_cache_path, spool,
+                        digest, progress_callback,
+                    )
+                if count is None:
+                    spool.close()
+                    return None
+                print(
+                    f"\n成功将新的原始数据写入缓存: '{os.path.basename(raw_cache_path)}'"
+                )
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                all_posts_raw = raw_cache.LazyPosts(raw_cache_path, count)
+                fingerprint = digest.hexdigest()
+            else:
+                if config.get("FETCH_MODE", "pages") == "stream":
+                    fetch_topic_posts = _fetch_topic_posts_by_stream
+                else:
+                    fetch_topic_posts = _fetch_topic_posts
+                with metrics.phase("fetch"):
+                    fetched_posts = fetch_topic_posts(
+                        scraper, base_url, topic_id, config, progress_callback, cached_posts
+                    )
+                if fetched_posts is None:
+                    return None
 
-                        wait_time = backoff_factor * (2**attempt)
-                        # 使用 print 来输出到GUI日志
+                if fetched_posts:
+                    all_posts_raw = fetched_posts
+                    if store is not None:
+                        with metrics.phase("raw_cache_write"):
+                            store.save_posts(topic_id, all_posts_raw)
+                        print("\n成功将新的原始数据写入 SQLite 帖子库。")
+                    else:
+                        raw_cache_directory = os.path.dirname(raw_cache_path)
+                        os.makedirs(raw_cache_directory, exist_ok=True)
+                        with metrics.phase("raw_cache_write"):
+                            _write_raw_cache(raw_cache_path, all_posts_raw, config)
                         print(
-                            f"请求失败 ({str(e)}), {wait_time:.1f}秒后重试 (第 {attempt + 1}/{max_retries} 次)..."
+                            f"\n成功将新的原始数据写入缓存: '{os.path.basename(raw_cache_path)}'"
                         )
-                        time.sleep(wait_time)
+                    if os.path.exists(partial_path):
+                        os.remove(partial_path)
 
-                if response is None:
-                    print("\n错误：所有重试尝试均失败。")
-                    return None
+            # 增量刷新之外的获取都包含话题的全部帖子，记为一次完整获取
+            if all_posts_raw and not incremental:
+                _record_full_fetch(topic_id)
+            if session_state_path is not None:
+                session_pool.save(base_url, scraper, session_state_path)
+        except sqlite3.Error as e:
+            print(f"\n错误: 写入 SQLite 帖子库失败: {e}")
+            return None
+        except (
+            FetchInterrupted,
+            requests.exceptions.RequestException,
+            cloudscraper.exceptions.CloudflareException,
+            cancellation.Cancelled,
+        ) as e:
+            cause = e.__cause__ if isinstance(e, FetchInterrupted) else e
+            if isinstance(cause, cancellation.Cancelled):
+                # 取消时保留已获取的帖子，同样作为下次获取的续传基础，然后把取消传给调用方
+                print(f"\n已取消获取 topic_id: {topic_id}。")
+                if isinstance(e, FetchInterrupted):
+                    _save_partial_posts(topic_id, e.partial_posts, config)
+                if spool is not None:
+                    spool.close()
+                raise cause
+            print(f"\n网络请求或解析错误: {cause}")
+            if isinstance(cause, cloudscraper.exceptions.CloudflareException):
+                print("检测到Cloudflare保护。Cloudscraper未能通过质询。")
+                metrics.increment("cloudflare_failures")
+            if _is_session_rejected(cause):
+                # 通行 cookie 失效，下次获取时重新创建会话并通过质询
+                session_pool.invalidate(base_url, session_state_path)
+            if isinstance(e, FetchInterrupted):
+                _save_partial_posts(topic_id, e.partial_posts, config)
+            if spool is not None:
+                spool.close()
+            return None
+        except OSError as e:
+            # 写缓存文件失败（磁盘已满、临时文件被删除等）；放在 RequestException 之后，
+            # 因为它也是 OSError 的子类
+            print(f"\n错误: 写入缓存文件失败: {e}")
+            if spool is not None:
+                spool.close()
+            return None
 
-                data = response.json()
+    if all_posts_raw:
+        _write_derived_files(
+            topic_id, base_url, all_posts_raw, store=store, config=config,
+            spool=spool, fingerprint=fingerprint,
+        )
+    elif spool is not None:
+        spool.close()
 
-                if page == 1:
-                    total_posts_count = data.get("posts_count", 0)
-                    if total_posts_count == 0:
-                        print("\n错误: 未找到任何帖子，或帖子URL无效。")
-                        return None
+    if revalidate:
+        _start_revalidation(base_url, topic_id, config)
+    return all_posts_raw
 
-                posts = data.get("post_stream", {}).get("posts", [])
-                if not posts:
-                    break
 
-                fetched_posts.extend(posts)
+# 正在后台刷新的话题 {topic_id: 线程}
+_revalidations = {}
+_revalidations_lock = threading.Lock()
 
-                # 调用回调函数来更新GUI进度条
-                if progress_callback:
-                    progress_callback(len(fetched_posts), total_posts_count)
 
-                if len(fetched_posts) >= total_posts_count:
-                    break
+def _start_revalidation(base_url, topic_id, config):
+    """在后台线程中重新获取话题。同一话题已在刷新时不重复启动。"""
+    with _revalidations_lock:
+        thread = _revalidations.get(topic_id)
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(
+            target=_revalidate, args=(base_url, topic_id, config), daemon=True
+        )
+        _revalidations[topic_id] = thread
+        thread.start()
 
-                page += 1
-                time.sleep(0.2)
 
-            # 确保进度条在循环结束后显示为100%
-            if progress_callback:
-                progress_callback(total_posts_count, total_posts_count)
+def _revalidate(base_url, topic_id, config):
+    # 缓存有效期设为 0 强制重新获取；启用增量刷新时只获取新增的帖子
+    refresh_config = dict(config, CACHE_DURATION_HOURS=0, STALE_WHILE_REVALIDATE=False)
+    with cache_manager.in_use(topic_id):
+        posts = get_all_posts(base_url, topic_id, refresh_config)
+    if posts:
+        print(
+            f"\n[已刷新] 话题 {topic_id} 的缓存和派生文件已更新为最新数据 ({len(posts)} 个帖子)，"
+            "重新生成 prompt 即可使用。"
+        )
+    else:
+        print(f"\n后台刷新话题 {topic_id} 失败，继续使用旧缓存，下次运行时会再次尝试。")
 
-            if fetched_posts:
-                all_posts_raw = fetched_posts
-                raw_cache_directory = os.path.dirname(raw_cache_path)
-                os.makedirs(raw_cache_directory, exist_ok=True)
-                with open(raw_cache_path, "w", encoding="utf-8") as f:
-                    json.dump(all_posts_raw, f, ensure_ascii=False, indent=4)
-                print(
-                    f"\n成功将新的原始数据写入缓存: '{os.path.basename(raw_cache_path)}'"
-                )
 
-        except (
-            requests.exceptions.RequestException,
-            cloudscraper.exceptions.CloudflareException,
-        ) as e:
-            print(f"\n网络请求或解析错误: {e}")
-            if isinstance(e, cloudscraper.exceptions.CloudflareException):
-                print("检测到Cloudflare保护。Cloudscraper未能通过质询。")
-            return None
+def wait_for_revalidation(timeout=None):
+    """等待所有后台刷新结束。批处理等进程退出前调用，避免刷新被中途终止。"""
+    with _revalidations_lock:
+        threads = list(_revalidations.values())
+    for thread in threads:
+        thread.join(timeout)
 
-    if all_posts_raw:
-        _write_derived_files(topic_id, base_url, all_posts_raw)
 
-    return all_posts_raw
+def merged_topic_id(topic_ids):
+    """多话题合并结果的标识，如 "12345+23456"，用作合并文件名的前缀。"""
+    return "+".join(sorted(set(str(topic_id) for topic_id in topic_ids), key=int))
+
+
+def _merge_grouped_data(grouped_by_topic, threshold):
+    """
+    把多个话题按用户分组的回复合并为一份：同一用户的回复按发布时间排列，
+    用户按其最早一条回复的时间排列，并合并跨话题的近似重复回复。
+    """
+    users = {}
+    for grouped_data in grouped_by_topic:
+        for user_data in grouped_data:
+            merged = users.get(user_data["user_id"])
+            if merged is None:
+                merged = users[user_data["user_id"]] = {
+                    "username": user_data["username"],
+                    "user_id": user_data["user_id"],
+                    "replies": [],
+                }
+            merged["replies"].extend(user_data.get("replies", []))
 
+    def created_at(reply):
+        return reply.get("created_at") or ""
 
-def generate_prompt(topic_id, user_credit_history):
-    """根据模板和用户输入生成最终的prompt文件。"""
+    for user_data in users.values():
+        user_data["replies"].sort(key=created_at)
+    merged_data = sorted(
+        users.values(), key=lambda user_data: created_at(user_data["replies"][0])
+    )
+    merged_data, stats = dedup.collapse_near_duplicates(
+        merged_data, threshold, order_key=created_at
+    )
+    if stats["replies_before"] > stats["replies_after"]:
+        print(
+            f"跨话题近似重复合并: 回复 {stats['replies_before']} -> "
+            f"{stats['replies_after']} 条。"
+        )
+    return merged_data
+
+
+@metrics.timed("aggregate_topics")
+def aggregate_topics(base_url, topic_ids, config, progress_callback=None):
+    """
+    并发获取多个话题，把它们的回复合并成一份按用户分组的语料，
+    写入 cache/{合并标识}_ai_input_file.json 和 _readable.txt，返回合并标识；全部失败时返回 None。
+    每个话题仍有自己的原始缓存和派生文件，新增一个话题时其余话题直接命中缓存；
+    各话题的派生文件都未变化时直接复用上次的合并结果。
+    """
+    topic_ids = sorted(set(str(topic_id) for topic_id in topic_ids), key=int)
+    concurrency = min(len(topic_ids), max(1, config.get("BATCH_CONCURRENCY", 2)))
+    done = [0]
+
+    def fetch_topic(topic_id):
+        with cache_manager.in_use(topic_id):
+            posts = get_all_posts(base_url, topic_id, config)
+        return topic_id, bool(posts)
+
+    def on_result(_):
+        done[0] += 1
+        if progress_callback:
+            progress_callback(done[0], len(topic_ids))
+
+    print(f"多话题模式: 并发获取 {len(topic_ids)} 个话题 ({', '.join(topic_ids)})。")
+    results = _fetch_concurrently(fetch_topic, topic_ids, concurrency, on_result)
+    fetched = [topic_id for topic_id in topic_ids if results[topic_id][1]]
+    failed = [topic_id for topic_id in topic_ids if not results[topic_id][1]]
+    if failed:
+        print(f"警告: 以下话题获取失败，未计入合并结果: {', '.join(failed)}")
+    if not fetched:
+        return None
+
+    merged_id = merged_topic_id(fetched)
+    cache_manager.touch(CACHE_DIR, merged_id)
+    grouped_path = os.path.join(CACHE_DIR, f"{merged_id}_ai_input_file.json")
+    readable_path = os.path.join(CACHE_DIR, f"{merged_id}_readable.txt")
+    manifest_path = _manifest_path(merged_id)
+    threshold = config.get("DEDUP_THRESHOLD", 0.8)
+    try:
+        # 合并结果以各话题派生文件的清单为键
+        topic_keys = []
+        for topic_id in fetched:
+            with open(_manifest_path(topic_id), "r", encoding="utf-8") as f:
+                topic_keys.append(f"{topic_id}={json.load(f)['key']}")
+        merged_key = f"dedup={threshold};" + ";".join(topic_keys)
+        if _derived_files_current(manifest_path, merged_key, (grouped_path, readable_path)):
+            print("各话题的派生文件均未变化，直接使用上次的合并结果。")
+            return merged_id
+
+        grouped_by_topic = []
+        for topic_id in fetched:
+            topic_path = os.path.join(CACHE_DIR, f"{topic_id}_ai_input_file.json")
+            with open(topic_path, "r", encoding="utf-8") as f:
+                grouped_by_topic.append(json.load(f))
+        merged_data = _merge_grouped_data(grouped_by_topic, threshold)
+        _write_grouped_and_readable(grouped_path, readable_path, merged_data)
+        _write_manifest(manifest_path, merged_key, (grouped_path, readable_path))
+    except (IOError, OSError, ValueError, KeyError) as e:
+        print(f"错误: 合并多个话题的回复失败: {e}")
+        return None
+
+    replies = sum(len(user_data["replies"]) for user_data in merged_data)
+    print(
+        f"已将 {len(fetched)} 个话题合并为 {len(merged_data)} 个用户的 {replies} 条回复，"
+        f"保存到 {os.path.basename(grouped_path)}。"
+    )
+    return merged_id
+
+
+def _load_reply_index(topic_id, grouped_path):
+    """读取话题的 AI 输入文件并构建 BM25 索引。同一进程内文件未变化时复用已构建的索引。"""
+    cache_key = (topic_id, os.path.getmtime(grouped_path))
+    cached = _reply_index_cache.get(topic_id)
+    if cached and cached[0] == cache_key:
+        return cached[1], cached[2]
+
+    with open(grouped_path, "r", encoding="utf-8") as f:
+        grouped_data = json.load(f)
+    index = build_reply_index(grouped_data)
+    _reply_index_cache.put(topic_id, (cache_key, grouped_data, index))
+    return grouped_data, index
+
+
+def _load_grouped_data(topic_id, grouped_path):
+    """读取话题的 AI 输入文件。相关度筛选刚读过同一文件时直接复用，不构建 BM25 索引。"""
+    cached = _reply_index_cache.get(topic_id)
+    if cached and cached[0] == (topic_id, os.path.getmtime(grouped_path)):
+        return cached[1]
+    with open(grouped_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_relevant_dps(topic_id, user_credit_history, config, output_path):
+    """按与用户信用记录的相关度选出 top-K 条回复，写入精简后的 AI 输入文件。"""
+    grouped_path = os.path.join(CACHE_DIR, f"{topic_id}_ai_input_file.json")
+    try:
+        grouped_data, index = _load_reply_index(topic_id, grouped_path)
+    except (IOError, OSError, json.JSONDecodeError) as e:
+        print(f"错误：无法读取 AI 输入文件，跳过相关度筛选: {e}")
+        return None
+
+    start = time.perf_counter()
+    selected_data, selected_count, total_count = select_relevant_replies(
+        grouped_data,
+        user_credit_history,
+        config.get("RELEVANCE_TOP_K", 200),
+        config.get("RELEVANCE_MAX_CHARS", 60000),
+        index=index,
+        half_life_days=config.get("RECENCY_HALF_LIFE_DAYS", 0),
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    try:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(selected_data, f, ensure_ascii=False, indent=4)
+    except IOError as e:
+        print(f"错误：无法写入相关度筛选结果: {e}")
+        return None
+    print(
+        f"相关度筛选: 从 {total_count} 条回复中选出 {selected_count} 条 "
+        f"(耗时 {elapsed_ms:.1f} 毫秒)，已保存到 {os.path.basename(output_path)}。"
+    )
+    return output_path
+
+
+def _write_budgeted_prompts(topic_id, prompt, config, output_path):
+    """按 token 预算把 DP 直接装入 prompt，写成一个或多个编号的分块 prompt 文件。"""
+    grouped_path = os.path.join(CACHE_DIR, f"{topic_id}_ai_input_file.json")
+    try:
+        grouped_data = _load_grouped_data(topic_id, grouped_path)
+    except (IOError, OSError, json.JSONDecodeError) as e:
+        print(f"错误：无法读取 AI 输入文件，跳过分块 prompt 生成: {e}")
+        return None
+
+    dp_table = load_dp_table(topic_id) if config.get("ENABLE_DP_EXTRACTION") else None
+    try:
+        paths, written, total = prompt_builder.write_chunked_prompts(
+            prompt,
+            grouped_data,
+            output_path,
+            config.get("PROMPT_TOKEN_BUDGET", 32000),
+            config.get("PROMPT_MAX_CHUNKS", 3),
+            dp_table=dp_table,
+            half_life_days=config.get("RECENCY_HALF_LIFE_DAYS", 0),
+        )
+    except IOError as e:
+        print(f"错误：无法写入分块 prompt 文件: {e}")
+        return None
+    print(
+        f"按每个 prompt 约 {config.get('PROMPT_TOKEN_BUDGET', 32000)} token 的预算，"
+        f"将 {total} 条回复中的 {written} 条写入 {len(paths)} 个分块 prompt:"
+    )
+    for path in paths:
+        print(f"  - {os.path.basename(path)}")
+    return paths
+
+
+# {模板路径: (修改时间, 内容)}，连续分析多个话题时不必每次都重新读取模板
+_prompt_template_cache = {}
+
+
+def _read_prompt_template():
+    """读取 prompt 模板，文件未修改时直接返回上次读取的内容。"""
     template_path = get_internal_path("prompt_template.md")
+    mtime = os.path.getmtime(template_path)
+    cached = _prompt_template_cache.get(template_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(template_path, "r", encoding="utf-8") as f:
+        prompt_template = f.read()
+    _prompt_template_cache[template_path] = (mtime, prompt_template)
+    return prompt_template
+
+
+@metrics.timed("generate_prompt")
+def generate_prompt(topic_id, user_credit_history, output_path=None, config=None):
+    """
+    根据模板和用户输入生成最终的prompt文件。
+    默认写入 cache/{topic_id}_prompt.md，成功时返回文件路径，失败时返回 None。
+    config 中启用 ENABLE_RELEVANCE_FILTER 时，还会按相关度选出 top-K 条回复，
+    写入与 prompt 文件同名前缀的 _ai_input_topk.json。
+    启用 ENABLE_PROMPT_BUDGET 时，还会把 DP 按 token 预算直接装入 prompt，
+    写入 _prompt_part1.md、_prompt_part2.md 等分块文件。
+    """
     try:
-        with open(template_path, "r", encoding="utf-8") as f:
-            prompt_template = f.read()
+        prompt_template = _read_prompt_template()
     except IOError as e:
         print(f"错误：无法读取prompt模板文件: {e}")
-        return
+        return None
 
     prompt = prompt_template.replace("{{user_credit_history}}", user_credit_history)
     if not os.path.exists(CACHE_DIR):
         os.makedirs(CACHE_DIR)
 
+    if output_path is None:
+        output_path = os.path.join(CACHE_DIR, f"{topic_id}_prompt.md")
     try:
-        with open(
-                os.path.join(CACHE_DIR, f"{topic_id}_prompt.md"), "w", encoding="utf-8"
-        ) as f2:
+        with open(output_path, "w", encoding="utf-8") as f2:
             f2.write(prompt)
     except IOError as e:
-        print(f"错误：无法写入prompt文件: {e}")
\ No newline at end of file
+        print(f"错误：无法写入prompt文件: {e}")
+        return None
+
+    if config and config.get("ENABLE_RELEVANCE_FILTER", False):
+        _write_relevant_dps(
+            topic_id, user_credit_history, config, topk_output_path(output_path)
+        )
+    if config and config.get("ENABLE_PROMPT_BUDGET", False):
+        _write_budgeted_prompts(topic_id, prompt, config, output_path)
+    return output_path
+
+
+def topk_output_path(prompt_path):
+    """与 prompt 文件对应的相关度筛选结果路径。"""
+    base = os.path.splitext(prompt_path)[0]
+    if base.endswith("_prompt"):
+        base = base[: -len("_prompt")]
+    return base + "_ai_input_topk.json"
@@ -0,0 +1,144 @@
+# relevance.py
+
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from time_window import recency_weight
+
+# 英文单词和数字（保留 "5/24"、"1.5x" 这类写法），以及连续的中文字符
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[./][a-z0-9]+)*|[\u4e00-\u9fff]+")
+_CJK_START = "\u4e00"
+
+
+def tokenize(text):
+    """
+    将中英文混合文本切分为词项。
+    英文和数字按单词切分并转为小写；中文没有空格分词，按相邻两字 (bigram) 切分，
+    单个汉字保留为一个词项。
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        word = match.group()
+        if word[0] >= _CJK_START:
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i : i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+class BM25Index:
+    """
+    内存中的 BM25 倒排索引。
+    构建时对每个文档分词一次，并预先算好每个 (词项, 文档) 的 BM25 词频权重；
+    查询只需遍历查询词项的倒排列表做乘加，与文档总数和文档长度无关。
+    """
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        term_counts_per_doc = [Counter(tokenize(document)) for document in documents]
+        self.doc_count = len(term_counts_per_doc)
+        doc_lengths = [sum(counts.values()) for counts in term_counts_per_doc]
+        # 所有回复都切不出词项时（只有表情或图片）平均长度为 0，此时不做长度归一化
+        avg_doc_length = (sum(doc_lengths) / self.doc_count if self.doc_count else 0) or 1
+
+        self.postings = defaultdict(list)
+        for doc_index, term_counts in enumerate(term_counts_per_doc):
+            length_norm = k1 * (1 - b + b * doc_lengths[doc_index] / avg_doc_length)
+            for term, count in term_counts.items():
+                weight = count * (k1 + 1) / (count + length_norm)
+                self.postings[term].append((doc_index, weight))
+
+    def _idf(self, term):
+        doc_freq = len(self.postings.get(term, ()))
+        return math.log(1 + (self.doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def search(self, query, top_k, weights=None):
+        """
+        返回得分最高的 top_k 个 (doc_index, score)，按得分从高到低排列，只包含命中查询的文档。
+        weights 为与文档一一对应的权重，得分乘以权重后再排序。
+        """
+        if not self.postings:
+            return []
+        scores = [0.0] * self.doc_count
+        for term, query_count in Counter(tokenize(query)).items():
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term) * query_count
+            for doc_index, weight in postings:
+                scores[doc_index] += idf * weight
+        if weights is not None:
+            scores = [score * weight for score, weight in zip(scores, weights)]
+        return heapq.nlargest(
+            top_k,
+            ((doc_index, score) for doc_index, score in enumerate(scores) if score > 0),
+            key=lambda item: item[1],
+        )
+
+
+def build_reply_index(grouped_data):
+    """为按用户分组的回复构建 BM25 索引，文档顺序与 _flatten_replies 一致。"""
+    return BM25Index(
+        reply.get("reply_content", "") for _, reply in _flatten_replies(grouped_data)
+    )
+
+
+def _flatten_replies(grouped_data):
+    return [
+        (user_index, reply)
+        for user_index, user_data in enumerate(grouped_data)
+        for reply in user_data.get("replies", [])
+    ]
+
+
+def select_relevant_replies(
+    grouped_data, query, top_k, max_chars, index=None, half_life_days=0
+):
+    """
+    从按用户分组的回复中选出与 query 最相关的至多 top_k 条，
+    且所选回复的 reply_content 总长度不超过 max_chars。
+    结果保持原有的分组格式，用户顺序和每个用户内的回复顺序不变。
+    index 为 build_reply_index 预先构建的索引，同一话题多次查询时可以复用。
+    half_life_days 不为 0 时，相关度再乘以按发布时间衰减的权重，每过 half_life_days 天减半。
+    返回 (selected_grouped_data, selected_count, total_count)。
+    """
+    replies = _flatten_replies(grouped_data)
+    if index is None:
+        index = build_reply_index(grouped_data)
+    weights = None
+    if half_life_days:
+        now = datetime.now(timezone.utc)
+        weights = [
+            recency_weight(reply.get("created_at"), half_life_days, now)
+            for _, reply in replies
+        ]
+
+    selected = set()
+    used_chars = 0
+    for doc_index, _score in index.search(query, top_k, weights):
+        reply_length = len(replies[doc_index][1].get("reply_content", ""))
+        if used_chars + reply_length > max_chars:
+            continue
+        selected.add(doc_index)
+        used_chars += reply_length
+
+    selected_users = {}
+    for doc_index, (user_index, reply) in enumerate(replies):
+        if doc_index not in selected:
+            continue
+        if user_index not in selected_users:
+            user_data = grouped_data[user_index]
+            selected_users[user_index] = {
+                "username": user_data.get("username"),
+                "user_id": user_data.get("user_id"),
+                "replies": [],
+            }
+        selected_users[user_index]["replies"].append(reply)
+
+    selected_grouped_data = [selected_users[i] for i in sorted(selected_users)]
+    return selected_grouped_data, len(selected), len(replies)
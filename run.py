@@ -1,40 +1,132 @@
 # run.py
 
-import re
+import time
+
+# 进程开始执行 Python 代码的时刻，用于统计窗口出现前的启动耗时
+# （打包为 --onefile 时，解压到临时目录的时间发生在这之前，不计入）
+_PROCESS_START = time.perf_counter()
+
 import sys
+import contextlib
+import contextvars
+import multiprocessing
+import os
 import tkinter as tk
 from tkinter import scrolledtext, messagebox, ttk
-import yaml
 import threading
 import traceback
 import queue
+import re
 
+from config_loader import load_config
+import cache_manager
+import cancellation
+import metrics
+import read_write_posts
 from read_write_posts import (
+    aggregate_topics,
+    extract_topic_id,
     get_all_posts,
     get_main_post,
     generate_prompt,
     clean_post_data,
-    get_persistent_path,
 )
 
 
+# 主线程处理消息队列、刷新日志和进度条的间隔（毫秒）
+QUEUE_POLL_INTERVAL_MS = 100
+# 日志文本框最多保留的行数，超出后删除最早的行，避免文本框越来越慢
+MAX_LOG_LINES = 5000
+# 关闭窗口时等待进行中的任务响应取消的最长时间（秒），应略长于单个请求的超时
+CLOSE_TIMEOUT_SECONDS = 20
+
+# 当前线程正在执行的任务标签，日志中的每一行会加上它，区分同时运行的多个任务的输出
+_log_label = contextvars.ContextVar("log_label", default=None)
+
+
 # 用于将print输出重定向到GUI的文本框
 class TextRedirector(object):
+    """
+    print 可能来自任意线程，write 只把文本追加到缓冲区；
+    由主线程定时调用 flush_to_widget，把积攒的文本一次性写入文本框。
+    在任务中输出的文本按整行加上任务标签，同时运行的任务的输出不会混在同一行。
+    """
+
     def __init__(self, widget):
         self.widget = widget
         self.widget.configure(state="disabled")
+        self._buffer = []
+        # {任务标签: 尚未遇到换行符的部分}
+        self._partial_lines = {}
+        self._lock = threading.Lock()
 
     def write(self, s):
-        self.widget.configure(state="normal")
-        self.widget.insert(tk.END, s)
-        self.widget.see(tk.END)  # 自动滚动到底部
-        self.widget.update_idletasks()  # 实时更新UI
-        self.widget.configure(state="disabled")
+        label = _log_label.get()
+        with self._lock:
+            if label is None:
+                self._buffer.append(s)
+                return
+            *lines, rest = (self._partial_lines.get(label, "") + s).split("\n")
+            self._partial_lines[label] = rest
+            for line in lines:
+                self._buffer.append(f"[{label}] {line}\n" if line else "\n")
+
+    def end_label(self, label):
+        """任务结束时调用，输出该任务最后一行没有换行符的文本。"""
+        with self._lock:
+            rest = self._partial_lines.pop(label, "")
+            if rest:
+                self._buffer.append(f"[{label}] {rest}\n")
 
     def flush(self):
         # 在GUI环境中，flush通常是无操作的
         pass
 
+    def clear(self):
+        """清空缓冲区和文本框，只能在主线程中调用。"""
+        with self._lock:
+            self._buffer = []
+            self._partial_lines = {}
+        self.widget.configure(state="normal")
+        self.widget.delete("1.0", tk.END)
+        self.widget.configure(state="disabled")
+
+    def flush_to_widget(self):
+        """把缓冲的文本合并后一次性插入文本框，只能在主线程中调用。"""
+        with self._lock:
+            if not self._buffer:
+                return
+            text = "".join(self._buffer)
+            self._buffer = []
+        self.widget.configure(state="normal")
+        self.widget.insert(tk.END, text)
+        line_count = int(self.widget.index("end-1c").split(".")[0])
+        if line_count > MAX_LOG_LINES:
+            self.widget.delete("1.0", f"{line_count - MAX_LOG_LINES + 1}.0")
+        self.widget.see(tk.END)  # 自动滚动到底部
+        self.widget.configure(state="disabled")
+
+
+class AnalysisJob:
+    """任务队列中的一次分析。status 只在主线程中修改。"""
+
+    def __init__(self, job_id, url, history, topic_ids):
+        self.job_id = job_id
+        self.url = url
+        self.history = history
+        self.topic_ids = topic_ids
+        self.token = cancellation.CancelToken()
+        self.status = "排队中"
+        self.progress = 0.0
+
+    @property
+    def label(self):
+        return f"#{self.job_id}"
+
+    @property
+    def finished(self):
+        return self.status in ("完成", "失败", "已取消")
+
 
 class App:
     def __init__(self, window):
@@ -49,12 +141,22 @@ class App:
 
         # 用于从工作线程向主线程传递消息的队列
         self.queue = queue.Queue()
-        self.window.after(100, self.process_queue)
+        # 工作线程报告的各任务最新进度 {job_id: (current, total)}，由主线程在 process_queue 中统一应用
+        self._pending_progress = {}
+        # 任务队列：jobs 按编号记录所有任务，pending_jobs 中为等待工作线程处理的任务
+        self.jobs = {}
+        self.pending_jobs = queue.Queue()
+        self.workers = []
+        self._next_job_id = 1
+        # 同一话题的任务串行获取：第一个任务写好缓存后，后续任务直接命中缓存
+        self._topic_locks = {}
+        self._topic_locks_lock = threading.Lock()
+        self.window.after(QUEUE_POLL_INTERVAL_MS, self.process_queue)
 
     def setup_ui(self):
         # --- 窗口居中和尺寸设置 ---
         window_width = 750
-        window_height = 650
+        window_height = 750
         screen_width = self.window.winfo_screenwidth()
         screen_height = self.window.winfo_screenheight()
         center_x = int(screen_width / 2 - window_width / 2)
@@ -66,7 +168,7 @@ class App:
         # --- 主框架 ---
         main_frame = tk.Frame(self.window)
         main_frame.pack(padx=15, pady=15, fill="both", expand=True)
-        main_frame.grid_rowconfigure(2, weight=1)
+        main_frame.grid_rowconfigure(3, weight=1)
         main_frame.grid_columnconfigure(0, weight=1)
 
         # --- 1. 输入部分 ---
@@ -74,7 +176,7 @@ class App:
         input_frame.grid(row=0, column=0, columnspan=2, sticky="ew", pady=(0, 10))
         input_frame.grid_columnconfigure(1, weight=1)
 
-        url_label = tk.Label(input_frame, text="帖子 URL:")
+        url_label = tk.Label(input_frame, text="帖子 URL:\n(多个用空格分隔)")
         url_label.grid(row=0, column=0, padx=10, pady=5, sticky="w")
         self.url_entry = tk.Entry(input_frame, width=70)
         self.url_entry.grid(row=0, column=1, padx=10, pady=5, sticky="ew")
@@ -102,13 +204,39 @@ class App:
         self.progress_bar.grid(row=0, column=0, sticky="ew", padx=(0, 10))
 
         self.run_button = tk.Button(
-            control_frame, text="开始分析", command=self.start_analysis_thread, width=15
+            control_frame, text="加入队列", command=self.enqueue_analysis, width=15
         )
         self.run_button.grid(row=0, column=1)
 
-        # --- 3. 日志输出部分 ---
+        self.cancel_button = tk.Button(
+            control_frame, text="取消所选任务", command=self.cancel_selected_jobs, width=15
+        )
+        self.cancel_button.grid(row=0, column=2, padx=(10, 0))
+
+        # --- 3. 任务队列部分 ---
+        jobs_frame = tk.LabelFrame(main_frame, text="任务队列")
+        jobs_frame.grid(row=2, column=0, columnspan=2, sticky="ew", pady=(10, 0))
+        jobs_frame.grid_columnconfigure(0, weight=1)
+
+        self.job_tree = ttk.Treeview(
+            jobs_frame,
+            columns=("job", "topics", "status", "progress"),
+            show="headings",
+            height=5,
+        )
+        for column, heading, width in (
+            ("job", "任务", 60),
+            ("topics", "话题", 360),
+            ("status", "状态", 100),
+            ("progress", "进度", 80),
+        ):
+            self.job_tree.heading(column, text=heading)
+            self.job_tree.column(column, width=width, stretch=column == "topics")
+        self.job_tree.grid(row=0, column=0, sticky="ew", padx=5, pady=5)
+
+        # --- 4. 日志输出部分 ---
         log_frame = tk.LabelFrame(main_frame, text="处理日志")
-        log_frame.grid(row=2, column=0, columnspan=2, sticky="nsew", pady=(10, 0))
+        log_frame.grid(row=3, column=0, columnspan=2, sticky="nsew", pady=(10, 0))
         log_frame.grid_rowconfigure(0, weight=1)
         log_frame.grid_columnconfigure(0, weight=1)
 
@@ -117,14 +245,29 @@ class App:
         )
         self.log_text.pack(expand=True, fill="both", padx=5, pady=5)
 
-    def update_progress(self, current, total):
+    def update_progress(self, job, current, total):
+        """进度回调，可在工作线程中调用。只记录最新进度，两次刷新之间的多次更新合并为一次。"""
         if total > 0:
-            percentage = (current / total) * 100
-            self.progress_bar["value"] = percentage
-            self.window.update_idletasks()
+            self._pending_progress[job.job_id] = (current, total)
+
+    def _apply_progress(self, progress):
+        """把各任务的最新进度写入任务列表，进度条显示所有运行中任务的平均进度。只能在主线程中调用。"""
+        for job_id, (current, total) in progress.items():
+            job = self.jobs[job_id]
+            job.progress = current / total
+            self.job_tree.set(str(job_id), "progress", f"{job.progress:.0%}")
+        running = [
+            job
+            for job in self.jobs.values()
+            if not job.finished and job.status != "排队中"
+        ]
+        if running:
+            self.progress_bar["value"] = (
+                sum(job.progress for job in running) / len(running) * 100
+            )
 
     def process_queue(self):
-        """处理来自工作线程的消息队列"""
+        """处理来自工作线程的消息队列，并刷新缓冲的日志和最新进度"""
         try:
             while True:
                 task = self.queue.get_nowait()
@@ -132,7 +275,11 @@ class App:
         except queue.Empty:
             pass
         finally:
-            self.window.after(100, self.process_queue)
+            self.log_redirector.flush_to_widget()
+            progress, self._pending_progress = self._pending_progress, {}
+            if progress:
+                self._apply_progress(progress)
+            self.window.after(QUEUE_POLL_INTERVAL_MS, self.process_queue)
 
     def show_message(self, title, message, type="info"):
         """线程安全地显示消息框"""
@@ -143,7 +290,7 @@ class App:
         else:
             messagebox.showinfo(title, message)
 
-    def start_analysis_thread(self):
+    def enqueue_analysis(self):
         url = self.url_entry.get().strip()
         history = self.history_text.get("1.0", tk.END).strip()
 
@@ -152,103 +299,156 @@ class App:
             messagebox.showwarning("输入错误", "URL 和信用记录均不能为空！")
             return
 
-        match = re.search(r"/t/(?:topic/)?(\d+)", url)
-        if not match:
-            messagebox.showerror(
-                "URL格式错误",
-                f"无法从输入的URL '{url}' 中找到有效的 topic_id。\n\n"
-                "请确保URL格式正确, 例如:\n"
-                "https://www.uscardforum.com/t/topic/12345",
-            )
-            return
-
-        topic_id = match.group(1)
-
-        # --- 禁用输入和按钮，启动线程 ---
-        self.run_button.config(state="disabled")
-        self.url_entry.config(state="disabled")
-        self.history_text.config(state="disabled")
-        self.progress_bar["value"] = 0
+        # 输入多个 URL 时进入多话题模式，合并所有话题的回复生成一份 prompt
+        topic_ids = []
+        for single_url in re.split(r"[\s,，]+", url):
+            topic_id = extract_topic_id(single_url)
+            if not topic_id:
+                messagebox.showerror(
+                    "URL格式错误",
+                    f"无法从输入的URL '{single_url}' 中找到有效的 topic_id。\n\n"
+                    "请确保URL格式正确, 例如:\n"
+                    "https://www.uscardforum.com/t/topic/12345",
+                )
+                return
+            if topic_id not in topic_ids:
+                topic_ids.append(topic_id)
+
+        # 没有未完成的任务时，清空之前的日志和进度
+        if all(job.finished for job in self.jobs.values()):
+            self.log_redirector.clear()
+            self.progress_bar["value"] = 0
+
+        job = AnalysisJob(self._next_job_id, url, history, topic_ids)
+        self._next_job_id += 1
+        self.jobs[job.job_id] = job
+        self.job_tree.insert(
+            "",
+            tk.END,
+            iid=str(job.job_id),
+            values=(job.label, ", ".join(topic_ids), job.status, "0%"),
+        )
+        # 清空 URL 以便继续输入下一个任务，信用记录通常相同，保留不动
+        self.url_entry.delete(0, tk.END)
 
-        # 清空之前的日志
-        self.log_text.configure(state="normal")
-        self.log_text.delete("1.0", tk.END)
-        self.log_text.configure(state="disabled")
+        self._start_workers()
+        self.pending_jobs.put(job)
+        print(f"任务 {job.label} 已加入队列: {', '.join(topic_ids)}")
 
-        print("--- 分析开始 ---\n")
+    def _start_workers(self):
+        """按 GUI_CONCURRENCY 启动工作线程，已启动的线程一直保留。"""
+        try:
+            worker_count = load_config()["GUI_CONCURRENCY"]
+        except (ValueError, IOError):
+            # 配置错误会在任务运行时报告，这里先用一个工作线程
+            worker_count = 1
+        while len(self.workers) < worker_count:
+            worker = threading.Thread(target=self._worker_loop, daemon=True)
+            self.workers.append(worker)
+            worker.start()
+
+    def _worker_loop(self):
+        while True:
+            job = self.pending_jobs.get()
+            # 排队期间已被取消的任务直接跳过
+            if not job.token.cancelled:
+                self.queue.put(lambda job=job: self._set_job_status(job, "运行中"))
+                self.run_analysis_task(job)
+
+    def _set_job_status(self, job, status):
+        """更新任务状态，只能在主线程中调用。"""
+        if job.finished:
+            return
+        if status == "运行中" and job.token.cancelled:
+            status = "正在取消"
+        job.status = status
+        self.job_tree.set(str(job.job_id), "status", status)
+
+    def cancel_selected_jobs(self):
+        selected = self.job_tree.selection()
+        if not selected:
+            messagebox.showinfo("取消任务", "请先在任务队列中选择要取消的任务。")
+            return
+        for item in selected:
+            self.cancel_job(self.jobs[int(item)])
 
-        # 在新线程中运行耗时任务
-        self.analysis_thread = threading.Thread(
-            target=self.run_analysis_task, args=(url, history, topic_id)
-        )
-        self.analysis_thread.daemon = True
-        self.analysis_thread.start()
+    def cancel_job(self, job):
+        """取消任务：排队中的任务不再运行，运行中的任务在下一个请求之前停止。只能在主线程中调用。"""
+        if job.finished:
+            return
+        job.token.cancel()
+        if job.status == "排队中":
+            self._set_job_status(job, "已取消")
+        else:
+            self._set_job_status(job, "正在取消")
+
+    @contextlib.contextmanager
+    def _fetch_lock(self, topic_ids):
+        """
+        获取期间持有这些话题的锁。按编号顺序加锁，多话题任务之间不会互相等待成死锁；
+        等待期间任务被取消时抛出 Cancelled。
+        """
+        with contextlib.ExitStack() as stack:
+            for topic_id in sorted(topic_ids, key=int):
+                with self._topic_locks_lock:
+                    lock = self._topic_locks.setdefault(topic_id, threading.Lock())
+                while not lock.acquire(timeout=QUEUE_POLL_INTERVAL_MS / 1000):
+                    cancellation.check()
+                stack.callback(lock.release)
+            yield
+
+    @contextlib.contextmanager
+    def _job_log(self, job):
+        """期间输出的日志每行加上任务标签。"""
+        reset_token = _log_label.set(job.label)
+        try:
+            yield
+        finally:
+            self.log_redirector.end_label(job.label)
+            _log_label.reset(reset_token)
 
-    def run_analysis_task(self, post_url, user_credit_history, topic_id):
+    def run_analysis_task(self, job):
+        status = "失败"
+        run_context = contextlib.ExitStack()
         try:
+            run_context.enter_context(self._job_log(job))
+            run_context.enter_context(cancellation.scope(job.token))
+            cancellation.check()
+            print("--- 分析开始 ---\n")
             config = load_config()
-            cache_hours = config.get("CACHE_DURATION_HOURS")
-            base_url = config.get("BASE_URL")
-
-            duration_str = (
-                f"{cache_hours // 24}天"
-                if cache_hours % 24 == 0 and cache_hours >= 24
-                else f"{cache_hours}小时"
-            )
-            print(f"配置加载成功。缓存有效期: {duration_str}")
-            print(f"输入验证通过。准备处理 Topic ID: {topic_id}\n")
-            print("开始获取帖子内容...")
-
-            # 将GUI更新函数作为回调传递
-            all_posts_raw = get_all_posts(
-                base_url, topic_id, config, progress_callback=self.update_progress
-            )
-
-            if not all_posts_raw:
-                print("\n未能获取任何帖子内容，程序终止。")
-                self.queue.put(
-                    lambda: self.show_message(
-                        "错误", "未能获取任何帖子内容，请检查URL或网络连接。", "error"
-                    )
-                )
-                return
-
-            print(f"\n成功获取或加载 {len(all_posts_raw)} 个帖子的内容.")
-            print("\n" + "=" * 25 + "\n  主贴内容预览\n" + "=" * 25)
-
-            main_post_raw = get_main_post(all_posts_raw)
-            if main_post_raw:
-                main_post_cleaned = clean_post_data(
-                    base_url=base_url, post=main_post_raw
-                )
-                print(
-                    f"作者: {main_post_cleaned.get('username')} (ID: {main_post_cleaned.get('user_id')})"
-                )
-                print(f"发布于: {main_post_cleaned.get('created_at')}")
-                print(
-                    f"内容预览: {main_post_cleaned.get('reply_content', '')[:200].strip()}..."
-                )
+            if len(job.topic_ids) > 1:
+                output_id = self.run_multi_topic(job, config, run_context)
             else:
-                print("错误：未在本话题中找到主贴 (post_number == 1)。")
+                output_id = self.run_single_topic(job, config, run_context)
+            if output_id is None:
+                return
 
-            generate_prompt(topic_id, user_credit_history)
+            cancellation.check()
+            generate_prompt(output_id, job.history, config=config)
 
             print("\n\n" + "=" * 15 + " 处理完成 " + "=" * 15)
             print("文件已成功保存到 cache/ 目录中：")
-            generated_json_path = f"cache/{topic_id}_ai_input_file.json"
-            generated_prompt_path = f"cache/{topic_id}_prompt.json"
+            if config.get("ENABLE_RELEVANCE_FILTER"):
+                generated_json_path = f"cache/{output_id}_ai_input_topk.json"
+            else:
+                generated_json_path = f"cache/{output_id}_ai_input_file.json"
+            generated_prompt_path = f"cache/{output_id}_prompt.md"
             print(f"  - {generated_json_path}")
             print(f"  - {generated_prompt_path}")
-            print("\n您现在可以关闭此窗口。")
+            status = "完成"
 
             self.queue.put(
                 lambda: self.show_message(
-                    "成功",
+                    f"任务 {job.label} 完成",
                     f"分析完成！\n\n相关文件已生成在 cache 目录中。\n\n{generated_json_path}\n\n{generated_prompt_path}",
                     "info",
                 )
             )
 
+        except cancellation.Cancelled:
+            print("\n任务已取消。")
+            status = "已取消"
+
         except Exception as e:
             # 打印详细错误到日志窗口
             print(f"\n发生未处理的严重错误: {e}")
@@ -256,51 +456,137 @@ class App:
             # 修正 lambda 函数，将 e 作为默认参数传入以立即捕获其值
             self.queue.put(
                 lambda e=e: self.show_message(
-                    "严重错误",
+                    f"任务 {job.label} 出错",
                     f"发生未处理的错误，请查看日志窗口获取详情。\n\n错误: {e}",
                     "error",
                 )
             )
 
         finally:
-            # 无论成功或失败，都重新启用按钮
-            self.queue.put(lambda: self.run_button.config(state="normal"))
-            self.queue.put(lambda: self.url_entry.config(state="normal"))
-            self.queue.put(lambda: self.history_text.config(state="normal"))
+            run_context.close()
+            self.queue.put(lambda status=status: self._set_job_status(job, status))
+
+    def _print_config_summary(self, config):
+        cache_hours = config.get("CACHE_DURATION_HOURS")
+        duration_str = (
+            f"{cache_hours // 24}天"
+            if cache_hours % 24 == 0 and cache_hours >= 24
+            else f"{cache_hours}小时"
+        )
+        print(f"配置加载成功。缓存有效期: {duration_str}")
+
+    def run_multi_topic(self, job, config, run_context):
+        """多话题模式：并发获取所有话题并合并回复，返回合并标识，失败时返回 None。"""
+        topic_ids = job.topic_ids
+        merged_id = read_write_posts.merged_topic_id(topic_ids)
+        for topic_id in topic_ids:
+            run_context.enter_context(cache_manager.in_use(topic_id))
+        run_context.enter_context(cache_manager.in_use(merged_id))
+        run_context.enter_context(
+            metrics.collect(
+                config,
+                os.path.join(read_write_posts.CACHE_DIR, "metrics"),
+                merged_id,
+                topic_ids=topic_ids,
+            )
+        )
+        self._print_config_summary(config)
+        print(f"输入验证通过。准备合并 {len(topic_ids)} 个话题: {', '.join(topic_ids)}\n")
+
+        with self._fetch_lock(topic_ids):
+            output_id = aggregate_topics(
+                config.get("BASE_URL"),
+                topic_ids,
+                config,
+                progress_callback=lambda current, total: self.update_progress(
+                    job, current, total
+                ),
+            )
+        if output_id is None:
+            print("\n未能获取任何话题的帖子内容，程序终止。")
+            self.queue.put(
+                lambda: self.show_message(
+                    "错误", "未能获取任何帖子内容，请检查URL或网络连接。", "error"
+                )
+            )
+        return output_id
+
+    def run_single_topic(self, job, config, run_context):
+        """获取单个话题并预览主贴，返回 topic_id，失败时返回 None。"""
+        topic_id = job.topic_ids[0]
+        # 分析期间该话题的缓存不会被后台清理删除
+        run_context.enter_context(cache_manager.in_use(topic_id))
+        run_context.enter_context(
+            metrics.collect(
+                config,
+                os.path.join(read_write_posts.CACHE_DIR, "metrics"),
+                str(topic_id),
+                topic_id=topic_id,
+            )
+        )
+        self._print_config_summary(config)
+        print(f"输入验证通过。准备处理 Topic ID: {topic_id}\n")
+        print("开始获取帖子内容...")
+
+        base_url = config.get("BASE_URL")
+        # 将GUI更新函数作为回调传递
+        with self._fetch_lock([topic_id]):
+            all_posts_raw = get_all_posts(
+                base_url,
+                topic_id,
+                config,
+                progress_callback=lambda current, total: self.update_progress(
+                    job, current, total
+                ),
+            )
+
+        if not all_posts_raw:
+            print("\n未能获取任何帖子内容，程序终止。")
+            self.queue.put(
+                lambda: self.show_message(
+                    "错误", "未能获取任何帖子内容，请检查URL或网络连接。", "error"
+                )
+            )
+            return None
+
+        print(f"\n成功获取或加载 {len(all_posts_raw)} 个帖子的内容.")
+        print("\n" + "=" * 25 + "\n  主贴内容预览\n" + "=" * 25)
+
+        main_post_raw = get_main_post(all_posts_raw)
+        if main_post_raw:
+            main_post_cleaned = clean_post_data(base_url=base_url, post=main_post_raw)
+            print(
+                f"作者: {main_post_cleaned.get('username')} (ID: {main_post_cleaned.get('user_id')})"
+            )
+            print(f"发布于: {main_post_cleaned.get('created_at')}")
+            print(
+                f"内容预览: {main_post_cleaned.get('reply_content', '')[:200].strip()}..."
+            )
+        else:
+            print("错误：未在本话题中找到主贴 (post_number == 1)。")
+        return topic_id
 
     def on_close(self):
         """关闭窗口时的确认"""
-        # 如果分析线程正在运行，给出提示
-        if hasattr(self, "analysis_thread") and self.analysis_thread.is_alive():
-            if messagebox.askyesno("确认退出", "分析仍在进行中，确定要退出吗？"):
-                self.window.destroy()
-        else:
+        # 还有未完成的任务时给出提示，确认后先取消它们，等进行中的任务保存已获取的帖子再退出
+        unfinished = [job for job in self.jobs.values() if not job.finished]
+        if not unfinished:
             self.window.destroy()
+            return
+        if not messagebox.askyesno(
+            "确认退出", f"还有 {len(unfinished)} 个任务未完成，确定要取消它们并退出吗？"
+        ):
+            return
+        for job in unfinished:
+            self.cancel_job(job)
+        print("正在取消所有任务，已获取的帖子会保存下来供下次继续...")
+        self._close_when_idle(time.monotonic() + CLOSE_TIMEOUT_SECONDS)
 
-
-def load_config(path="config.yaml"):
-    """加载并验证YAML配置文件。"""
-    config_path = get_persistent_path(path)
-    try:
-        with open(config_path, "r", encoding="utf-8") as f:
-            config = yaml.safe_load(f)
-    except (IOError, yaml.YAMLError) as e:
-        # 抛出异常而不是打印和退出
-        raise ValueError(f"无法加载或解析配置文件 '{config_path}': {e}")
-
-    if "CACHE_DURATION_HOURS" not in config or not isinstance(
-        config["CACHE_DURATION_HOURS"], int
-    ):
-        raise ValueError(f"配置文件 '{path}' 中缺少或无效的 'CACHE_DURATION_HOURS'。")
-    if "BASE_URL" not in config or not isinstance(config["BASE_URL"], str):
-        raise ValueError(f"配置文件 '{path}' 中缺少或无效的 'BASE_URL'。")
-    if "MAX_RETRIES" not in config or not isinstance(config["MAX_RETRIES"], int):
-        config["MAX_RETRIES"] = 5
-    if "BACKOFF_FACTOR" not in config or not isinstance(
-        config["BACKOFF_FACTOR"], (int, float)
-    ):
-        config["BACKOFF_FACTOR"] = 1
-    return config
+    def _close_when_idle(self, deadline):
+        if all(job.finished for job in self.jobs.values()) or time.monotonic() > deadline:
+            self.window.destroy()
+        else:
+            self.window.after(QUEUE_POLL_INTERVAL_MS, self._close_when_idle, deadline)
 
 
 def main():
@@ -308,6 +594,16 @@ def main():
     try:
         root = tk.Tk()
         app = App(root)
+        # 窗口绘制完成、进入事件循环后才会执行
+        root.after_idle(
+            lambda: print(f"启动耗时 {time.perf_counter() - _PROCESS_START:.2f} 秒。")
+        )
+        try:
+            cache_manager.start_background_cleanup(
+                read_write_posts.CACHE_DIR, load_config()
+            )
+        except (ValueError, IOError) as e:
+            print(f"警告: 无法加载配置，跳过缓存清理: {e}")
         root.mainloop()
     except Exception as e:
         # 这个捕获是为了在GUI完全无法启动时提供一个最后的反馈
@@ -318,4 +614,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # 打包为可执行文件后，DP 提取的进程池需要此调用才能正常启动子进程
+    multiprocessing.freeze_support()
     main()
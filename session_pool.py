@@ -0,0 +1,143 @@
+# session_pool.py
+
+"""
+进程内共用的 cloudscraper 会话，以及 Cloudflare 通行 cookie 的持久化。
+
+同一主机（和同一 User-Agent）的所有获取共用一个 scraper，只需通过一次 Cloudflare 质询。
+启用持久化时，质询得到的 cookie 和对应的 User-Agent 会写入状态文件，
+下次启动在有效期内直接复用；服务器拒绝这些 cookie 时调用 invalidate() 丢弃它们。
+"""
+
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+# 状态文件的读写锁，多个批处理任务可能同时保存
+_state_lock = threading.Lock()
+
+
+def _host(base_url):
+    return urlsplit(base_url).netloc
+
+
+def _load_state(state_path):
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _save_state(state_path, state):
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    temp_path = f"{state_path}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, state_path)
+
+
+def _restore(scraper, saved, user_agent, max_age_seconds):
+    """把保存的 cookie 装入 scraper，返回装入的 cookie 数。过期或 User-Agent 不符时不装入。"""
+    now = time.time()
+    if not saved or now - saved.get("saved_at", 0) > max_age_seconds:
+        return 0
+    if user_agent and saved.get("user_agent") != user_agent:
+        # Cloudflare 的通行 cookie 与发起质询的 User-Agent 绑定
+        return 0
+    restored = 0
+    for cookie in saved.get("cookies", []):
+        if cookie.get("expires") and cookie["expires"] < now:
+            continue
+        scraper.cookies.set(
+            cookie["name"],
+            cookie["value"],
+            domain=cookie.get("domain", ""),
+            path=cookie.get("path", "/"),
+            expires=cookie.get("expires"),
+            secure=cookie.get("secure", False),
+        )
+        restored += 1
+    if restored:
+        scraper.headers["User-Agent"] = saved["user_agent"]
+    return restored
+
+
+def get_scraper(base_url, user_agent=None, state_path=None, max_age_seconds=0):
+    """
+    返回 base_url 所在主机共用的 scraper，第一次调用时创建。
+    user_agent 为自定义 User-Agent，不同的 User-Agent 使用不同的 scraper。
+    state_path 不为 None 时，创建 scraper 后尝试从中恢复 max_age_seconds 内保存的 cookie。
+    """
+    import cloudscraper
+
+    key = (_host(base_url), user_agent)
+    with _sessions_lock:
+        scraper = _sessions.get(key)
+        if scraper is not None:
+            return scraper
+        scraper = cloudscraper.create_scraper()
+        if user_agent:
+            scraper.headers.update({"User-Agent": user_agent})
+        if state_path is not None:
+            with _state_lock:
+                saved = _load_state(state_path).get(_host(base_url))
+            restored = _restore(scraper, saved, user_agent, max_age_seconds)
+            if restored:
+                print(f"复用上次保存的 {restored} 个 Cloudflare cookie。")
+        _sessions[key] = scraper
+        return scraper
+
+
+def save(base_url, scraper, state_path):
+    """保存 scraper 当前的 cookie 和 User-Agent。没有 cookie 时删除该主机的记录。"""
+    cookies = [
+        {
+            "name": cookie.name,
+            "value": cookie.value,
+            "domain": cookie.domain,
+            "path": cookie.path,
+            "expires": cookie.expires,
+            "secure": cookie.secure,
+        }
+        for cookie in scraper.cookies
+    ]
+    host = _host(base_url)
+    with _state_lock:
+        state = _load_state(state_path)
+        if cookies:
+            state[host] = {
+                "saved_at": time.time(),
+                "user_agent": scraper.headers.get("User-Agent"),
+                "cookies": cookies,
+            }
+        elif host in state:
+            del state[host]
+        else:
+            return
+        try:
+            _save_state(state_path, state)
+        except (IOError, OSError) as e:
+            print(f"警告: 无法保存会话 cookie: {e}")
+
+
+def invalidate(base_url, state_path=None):
+    """服务器拒绝当前会话时调用：丢弃该主机的 scraper 和保存的 cookie，下次重新通过质询。"""
+    host = _host(base_url)
+    with _sessions_lock:
+        for key in [key for key in _sessions if key[0] == host]:
+            del _sessions[key]
+    if state_path is None:
+        return
+    with _state_lock:
+        state = _load_state(state_path)
+        if host in state:
+            del state[host]
+            try:
+                _save_state(state_path, state)
+            except (IOError, OSError):
+                pass
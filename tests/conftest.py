@@ -0,0 +1,39 @@
+# tests/conftest.py
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import read_write_posts  # noqa: E402
+from fake_discourse import FakeDiscourse  # noqa: E402
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """每个测试使用独立的缓存目录。"""
+    monkeypatch.setattr(read_write_posts, "CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def fake():
+    with FakeDiscourse() as server:
+        yield server
+
+
+@pytest.fixture
+def config():
+    """不限速、快速重试的最小配置，各测试按需覆盖。"""
+    return {
+        "CACHE_DURATION_HOURS": 24,
+        "MAX_RETRIES": 3,
+        "BACKOFF_FACTOR": 0.01,
+        "FETCH_CONCURRENCY": 4,
+        "FETCH_MODE": "pages",
+        "RATE_LIMIT_PER_SECOND": 0,
+    }
@@ -0,0 +1,69 @@
+# tests/test_cache_manager.py
+
+import os
+import threading
+
+import cache_manager
+import config_loader
+
+
+def _write_topic(cache_dir, topic_id, size):
+    internal = os.path.join(cache_dir, "internal")
+    os.makedirs(internal, exist_ok=True)
+    with open(os.path.join(internal, f"{topic_id}_raw.json"), "wb") as f:
+        f.write(b"x" * size)
+
+
+def test_evicts_least_recently_used_over_size(tmp_path):
+    cache_dir = str(tmp_path)
+    for topic_id in ("1", "2", "3"):
+        _write_topic(cache_dir, topic_id, 1000)
+        cache_manager.touch(cache_dir, topic_id)
+    cache_manager.touch(cache_dir, "1")
+
+    evicted, freed = cache_manager.enforce_limits(cache_dir, max_bytes=2000)
+
+    assert (evicted, freed) == (1, 1000)
+    assert sorted(cache_manager._scan_topics(cache_dir)) == ["1", "3"]
+
+
+def test_topic_used_during_cleanup_is_kept(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path)
+    _write_topic(cache_dir, "1", 1000)
+    _write_topic(cache_dir, "2", 1000)
+    cache_manager._save_index(cache_dir, {"1": 1.0, "2": 2.0})
+    context = cache_manager.in_use(2)
+    remove_files = cache_manager._remove_files
+
+    def remove_then_use(paths):
+        # 删除第一个话题时第二个话题开始被使用，删除前的再次检查应保留它
+        freed = remove_files(paths)
+        if not cache_manager._active_topics:
+            context.__enter__()
+        return freed
+
+    monkeypatch.setattr(cache_manager, "_remove_files", remove_then_use)
+    monkeypatch.setattr(cache_manager, "_index_lock", threading.RLock())
+    try:
+        assert cache_manager.enforce_limits(cache_dir, max_bytes=1) == (1, 1000)
+    finally:
+        context.__exit__(None, None, None)
+    assert sorted(cache_manager._scan_topics(cache_dir)) == ["2"]
+
+
+def test_limits_default_to_unlimited(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text(
+        "BASE_URL: https://example.com\nCACHE_DURATION_HOURS: 24\n", encoding="utf-8"
+    )
+    config = config_loader.load_config(str(path))
+    assert config["CACHE_MAX_SIZE_MB"] == 0
+    assert config["CACHE_MAX_AGE_DAYS"] == 0
+
+
+def test_shipped_config_enables_limits():
+    config = config_loader.load_config(
+        os.path.join(os.path.dirname(__file__), "..", "config.yaml")
+    )
+    assert config["CACHE_MAX_SIZE_MB"] > 0
+    assert config["CACHE_MAX_AGE_DAYS"] > 0
@@ -0,0 +1,48 @@
+# tests/test_dedup.py
+
+from dedup import _NON_WORD, _shingles_of, collapse_near_duplicates, find_duplicates, jaccard
+
+_REPORT = "申请了蓝宝石优选卡，信用历史很长，收入也不错，当天秒批，额度很高，非常满意这次的结果"
+
+
+def test_normalized_exact_duplicates_merge():
+    # 空白、标点和大小写不同的 "+1" 归入第一条
+    assert find_duplicates(["+1 同", "+1同！", "+1 同 "]) == [0, 0, 0]
+
+
+def test_empty_texts_are_not_merged():
+    assert find_duplicates(["", "  ", "!!"]) == [0, 1, 2]
+
+
+def test_different_numbers_are_not_merged():
+    assert find_duplicates(["FICO 720 秒批 CL 10k", "FICO 760 秒批 CL 10k"]) == [0, 1]
+
+
+def test_threshold_is_inclusive():
+    edited = _REPORT.replace("秒批", "秒过")
+    similarity = jaccard(
+        _shingles_of(_NON_WORD.sub("", _REPORT)), _shingles_of(_NON_WORD.sub("", edited))
+    )
+    assert 0.8 < similarity < 1
+    assert find_duplicates([_REPORT, edited], similarity) == [0, 0]
+    assert find_duplicates([_REPORT, edited], similarity + 1e-9) == [0, 1]
+
+
+def test_collapse_keeps_earliest_and_counts():
+    grouped_data = [
+        {"username": "a", "user_id": 1, "replies": [
+            {"post_number": 3, "reply_content": "+1 同"},
+        ]},
+        {"username": "b", "user_id": 2, "replies": [
+            {"post_number": 2, "reply_content": "+1同"},
+            {"post_number": 4, "reply_content": _REPORT},
+        ]},
+    ]
+    collapsed, stats = collapse_near_duplicates(grouped_data)
+
+    # 用户 a 唯一的回复被合并到更早的 2 楼，a 随之移除
+    assert [user["user_id"] for user in collapsed] == [2]
+    assert collapsed[0]["replies"][0] == {
+        "post_number": 2, "reply_content": "+1同", "duplicate_count": 1
+    }
+    assert (stats["replies_before"], stats["replies_after"], stats["groups"]) == (3, 2, 1)
@@ -0,0 +1,42 @@
+# tests/test_dp_extract.py
+
+import pytest
+
+from dp_extract import _classify_result, extract_dp_fields
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        # benchmarks/fake_discourse.py 中的 DP 模板
+        ("personal or biz? personal\napproved or rejected or pop-up window? approved", "approved"),
+        ("x/24 status? 5/24, FICO 720, income 120k", None),
+        ("秒批 CL 10k，信用历史 3 年", "approved"),
+        ("被拒了，5/24，recon 也没用", "denied"),
+        # recon 只修饰后面的结果
+        ("被拒后 recon 批了", "approved"),
+        ("等 recon", "pending"),
+        ("approved or rejected or pop-up window? pop up", "pending"),
+        # 否定的批准
+        ("not approved", "denied"),
+        ("没有获批", "denied"),
+        ("未获批准", "denied"),
+        ("还没批", "denied"),
+    ],
+)
+def test_classify_result(text, expected):
+    assert _classify_result(text) == expected
+
+
+def test_extract_dp_fields_from_template():
+    fields = extract_dp_fields(
+        "personal or biz? biz\napproved or rejected or pop-up window? rejected\n"
+        "x/24 status? 4/24, FICO 750, income 90k",
+        created_at="2024-03-01T00:00:00.000Z",
+    )
+    assert fields["account_type"] == "business"
+    assert fields["result"] == "denied"
+    assert fields["x24"] == 4
+    assert fields["fico"] == 750
+    assert fields["income_k"] == 90
+    assert fields["dp_date"] == "2024-03-01"
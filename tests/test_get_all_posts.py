@@ -0,0 +1,118 @@
+# tests/test_get_all_posts.py
+
+import os
+
+import pytest
+
+import cancellation
+from read_write_posts import get_all_posts, wait_for_revalidation
+
+
+def _raw_cache_path(cache_dir, topic_id):
+    return os.path.join(cache_dir, "internal", f"{topic_id}_raw.json")
+
+
+def test_unreadable_stale_cache_is_fetched_once(cache_dir, fake, config, capsys):
+    fake.add_topic(1, 200)
+    get_all_posts(fake.base_url, 1, config)
+    with open(_raw_cache_path(cache_dir, 1), "w", encoding="utf-8") as f:
+        f.write("[{not json")
+
+    fake.reset_stats()
+    swr_config = dict(config, CACHE_DURATION_HOURS=0, STALE_WHILE_REVALIDATE=True)
+    posts = get_all_posts(fake.base_url, 1, swr_config)
+    wait_for_revalidation(timeout=10)
+
+    assert len(posts) == 200
+    # 10 页各请求一次，不会在前台获取之后再启动一次后台刷新
+    assert fake.requests == 10
+    assert "先使用" not in capsys.readouterr().out
+
+
+def test_streaming_fetch_by_id_batches(cache_dir, fake, config, capsys):
+    fake.add_topic(1, 200)
+    stream_config = dict(
+        config,
+        STREAMING_PIPELINE=True,
+        FETCH_MODE="stream",
+        FETCH_CONCURRENCY=1,
+        POST_ID_BATCH_SIZE=50,
+    )
+    posts = get_all_posts(fake.base_url, 1, stream_config)
+
+    assert [p["id"] for p in posts] == [p["id"] for p in fake.topics[1]]
+    # 第 1 页 + 两批 id 窗口各 2 次批量请求（第 1 页的 20 个帖子不再重复获取）
+    assert fake.requests == 5
+    assert "按 id 分批获取" in capsys.readouterr().out
+
+
+def test_streaming_fetch_by_pages(cache_dir, fake, config):
+    fake.add_topic(1, 205)
+    posts = get_all_posts(fake.base_url, 1, dict(config, STREAMING_PIPELINE=True))
+
+    assert [p["id"] for p in posts] == [p["id"] for p in fake.topics[1]]
+    assert fake.requests == 11
+
+
+def test_retry_after_over_limit_fails_without_waiting(cache_dir, fake, config, capsys):
+    fake.add_topic(1, 40)
+    fake.throttle_rate = 1.0
+    fake.retry_after = 3600
+    posts = get_all_posts(
+        fake.base_url, 1, dict(config, RETRY_AFTER_MAX_SECONDS=60)
+    )
+
+    assert posts is None
+    assert fake.requests == 1
+    assert "超过 RETRY_AFTER_MAX_SECONDS" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("fetch_mode", ["pages", "stream"])
+def test_incremental_refresh_picks_up_edits_and_deletions(
+    cache_dir, fake, config, fetch_mode
+):
+    fake.add_topic(1, 200)
+    refresh_config = dict(
+        config, FETCH_MODE=fetch_mode, INCREMENTAL_REFRESH=True, INCREMENTAL_REFETCH_PAGES=1
+    )
+    get_all_posts(fake.base_url, 1, refresh_config)
+
+    # 先追加新回复：add_replies 按现有帖子数编号，删除之后再追加会与已有的 id 重复
+    fake.add_replies(1, 30)
+    posts = fake.topics[1]
+    deleted = posts.pop(50)
+    # 被编辑的回复位于新回复之前的一页内，会被重新获取
+    posts[189] = dict(posts[189], cooked="<p>edited</p>")
+    fake.reset_stats()
+    refreshed = get_all_posts(
+        fake.base_url, 1, dict(refresh_config, CACHE_DURATION_HOURS=0)
+    )
+
+    assert [p["id"] for p in refreshed] == [p["id"] for p in fake.topics[1]]
+    assert deleted["id"] not in {p["id"] for p in refreshed}
+    assert refreshed[189]["cooked"] == "<p>edited</p>"
+    # 完整获取需要 12 页，增量刷新只请求第 1 页和新回复附近的几页
+    assert fake.requests <= 5
+
+
+def test_cancelled_fetch_resumes_from_saved_posts(cache_dir, fake, config):
+    fake.add_topic(1, 200)
+    sequential = dict(config, FETCH_CONCURRENCY=1)
+    token = cancellation.CancelToken()
+
+    def cancel_after_four_pages(current, total):
+        if current >= 4:
+            token.cancel()
+
+    with cancellation.scope(token), pytest.raises(cancellation.Cancelled):
+        get_all_posts(fake.base_url, 1, sequential, cancel_after_four_pages)
+    assert fake.requests == 4
+    assert os.path.exists(os.path.join(cache_dir, "internal", "1_partial.json"))
+
+    fake.reset_stats()
+    posts = get_all_posts(fake.base_url, 1, sequential)
+
+    assert [p["id"] for p in posts] == [p["id"] for p in fake.topics[1]]
+    # 第 1 页 + 已保存部分的最后一页 + 剩余的 6 页
+    assert fake.requests == 8
+    assert not os.path.exists(os.path.join(cache_dir, "internal", "1_partial.json"))
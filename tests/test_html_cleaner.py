@@ -0,0 +1,34 @@
+# tests/test_html_cleaner.py
+
+import pytest
+
+from html_cleaner import html_to_text
+
+
+@pytest.mark.parametrize(
+    "raw_html, expected",
+    [
+        ("<p>a &amp; b</p><p>c</p>", "a & b\nc"),
+        # 嵌套引用整段去掉
+        (
+            '<aside class="quote"><blockquote><p>q1</p><blockquote>q2</blockquote>'
+            "</blockquote></aside><p>reply</p>",
+            "reply",
+        ),
+        # 大写标签也是引用
+        ("<BLOCKQUOTE>q</BLOCKQUOTE>x", "x"),
+        ('<p>a</p><ASIDE class="quote">q</Aside><p>b</p>', "a\nb"),
+        # 未闭合的引用一直删到末尾
+        ("<p>a</p><blockquote>q<blockquote>r</blockquote>", "a"),
+        # 普通的 aside 不是引用
+        ('<aside class="onebox">link</aside>', "link"),
+        ("a<!-- note -->b<br/>c", "ab\nc"),
+        ("a<!-- unclosed", "a"),
+        # 常见实体走 str.replace，其余实体交给 html.unescape
+        ("&amp;lt; &lt;b&gt; &quot;x&quot; &#39;", "&lt; <b> \"x\" '"),
+        ("&nbsp;a &copy; b&#x4e2d;", "a © b中"),
+        ("  <p> line </p>\n\n<DIV>next</DIV>  ", "line\nnext"),
+    ],
+)
+def test_html_to_text(raw_html, expected):
+    assert html_to_text(raw_html) == expected
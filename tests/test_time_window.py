@@ -0,0 +1,112 @@
+# tests/test_time_window.py
+
+import json
+from datetime import date
+
+import pytest
+
+import read_write_posts
+import time_window
+
+
+def _grouped_data():
+    return [
+        {
+            "username": "a",
+            "user_id": 1,
+            "replies": [
+                {"post_number": 2, "created_at": "2024-01-01T00:00:00.000Z"},
+                {"post_number": 5, "created_at": "2024-03-01T00:00:00.000Z"},
+            ],
+        },
+        {
+            "username": "b",
+            "user_id": 2,
+            "replies": [
+                {"post_number": 3, "created_at": None},
+                {"post_number": 4, "created_at": "2024-02-01T00:00:00.000Z"},
+            ],
+        },
+    ]
+
+
+def _post_numbers(grouped_data):
+    return [reply["post_number"] for user in grouped_data for reply in user["replies"]]
+
+
+@pytest.mark.parametrize(
+    "window, expected",
+    [
+        # since 包含在窗口内，until 不包含；没有 created_at 的回复不在任何窗口内
+        (("2024-01-01T00:00:00.000Z", None), [2, 5, 4]),
+        ((None, "2024-02-01T00:00:00.000Z"), [2]),
+        (("2024-02-01T00:00:00.000Z", "2024-03-01T00:00:00.000Z"), [4]),
+        (("2024-03-01T00:00:00.001Z", None), []),
+    ],
+)
+def test_window_boundaries(window, expected):
+    grouped_data = _grouped_data()
+    index = time_window.CreatedAtIndex(grouped_data)
+    assert _post_numbers(index.select(grouped_data, window)) == expected
+
+
+def test_parse_relative_date():
+    today = date(2024, 3, 31)
+    assert time_window.parse_date("1m", today) == "2024-02-29T00:00:00.000Z"
+    assert time_window.parse_date("2w", today) == "2024-03-17T00:00:00.000Z"
+    assert time_window.parse_date("") is None
+    with pytest.raises(ValueError):
+        time_window.parse_date("soon")
+
+
+def test_index_is_reused_from_disk(cache_dir, monkeypatch):
+    window = ("2024-02-01T00:00:00.000Z", None)
+    expected = time_window.CreatedAtIndex(_grouped_data()).select(_grouped_data(), window)
+    calls = []
+
+    def build_grouped_data():
+        calls.append(1)
+        return _grouped_data()
+
+    selected = read_write_posts._select_time_window(1, "key", window, build_grouped_data)
+    assert selected == expected
+    # 清空进程内缓存，模拟程序重启：索引从磁盘读取，不再重新分组
+    monkeypatch.setattr(
+        read_write_posts, "_time_index_cache", read_write_posts._LRUCache(4)
+    )
+    selected = read_write_posts._select_time_window(1, "key", window, build_grouped_data)
+    assert selected == expected
+    assert len(calls) == 1
+    # 内容键变化时重新分组
+    read_write_posts._select_time_window(1, "other", window, build_grouped_data)
+    assert len(calls) == 2
+
+
+def _windowed_post_numbers(cache_dir, fake, config):
+    window_config = dict(
+        config,
+        DP_SINCE=fake.topics[1][100]["created_at"],
+        DP_UNTIL=fake.topics[1][150]["created_at"],
+    )
+    read_write_posts.get_all_posts(fake.base_url, 1, window_config)
+    with open(cache_dir / "1_ai_input_file.json", encoding="utf-8") as f:
+        return sorted(
+            reply["post_number"] for user in json.load(f) for reply in user["replies"]
+        )
+
+
+def test_sqlite_store_window_matches_file_cache(
+    cache_dir, fake, config, tmp_path, monkeypatch, capsys
+):
+    fake.add_topic(1, 200)
+    expected = _windowed_post_numbers(cache_dir, fake, config)
+    assert expected == list(range(101, 151))
+
+    store_dir = tmp_path / "store"
+    store_dir.mkdir()
+    monkeypatch.setattr(read_write_posts, "CACHE_DIR", str(store_dir))
+    assert (
+        _windowed_post_numbers(store_dir, fake, dict(config, USE_SQLITE_STORE=True))
+        == expected
+    )
+    assert "从 SQLite 帖子库查询到 50 条回复" in capsys.readouterr().out
@@ -0,0 +1,170 @@
+# time_window.py
+
+"""
+按发帖时间 (created_at) 筛选和加权回复。
+
+Discourse 返回的 created_at 都是 "2024-01-01T12:34:56.789Z" 这样统一格式的 UTC 时间，
+按字符串比较的顺序就是时间顺序。CreatedAtIndex 把回复按 created_at 排好序，
+时间窗口的切片用二分查找得到，不需要逐条解析时间。
+"""
+
+import calendar
+import re
+from bisect import bisect_left
+from datetime import date, datetime, timedelta, timezone
+
+_RELATIVE = re.compile(r"^\s*(\d+)\s*([dwmy])\s*$", re.IGNORECASE)
+_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.000Z"
+
+
+def _months_before(day, months):
+    year, month = divmod(day.year * 12 + day.month - 1 - months, 12)
+    month += 1
+    # 目标月份没有这一天时（如 3 月 31 日往前 1 个月）取该月最后一天
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def parse_date(value, today=None):
+    """
+    把配置中的日期解析为与 created_at 可直接比较的 UTC 时间字符串，空值返回 None。
+    支持绝对日期 "2024-01-01"、"2024-01-01T08:00:00"（按 UTC），
+    以及相对日期 "90d"、"12w"、"18m"、"2y"（从今天往前数的天、周、月、年，取当天 0 点）。
+    无法识别时抛出 ValueError。
+    """
+    if value is None or str(value).strip() == "":
+        return None
+    if isinstance(value, datetime):
+        moment = value
+    elif isinstance(value, date):
+        moment = datetime(value.year, value.month, value.day)
+    else:
+        text = str(value).strip()
+        match = _RELATIVE.match(text)
+        if match:
+            amount, unit = int(match.group(1)), match.group(2).lower()
+            today = today or datetime.now(timezone.utc).date()
+            if unit == "d":
+                day = today - timedelta(days=amount)
+            elif unit == "w":
+                day = today - timedelta(weeks=amount)
+            elif unit == "m":
+                day = _months_before(today, amount)
+            else:
+                day = _months_before(today, amount * 12)
+            moment = datetime(day.year, day.month, day.day)
+        else:
+            try:
+                moment = datetime.fromisoformat(text.replace("Z", "+00:00"))
+            except ValueError:
+                raise ValueError(
+                    f"无法识别的日期 '{text}'，应为 2024-01-01 这样的日期或 18m 这样的相对时间"
+                )
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.strftime(_TIMESTAMP_FORMAT)
+
+
+def resolve(config):
+    """
+    返回配置中的时间窗口 (since, until)，两端都是 UTC 时间字符串或 None；未设置窗口时返回 None。
+    since 包含在窗口内，until 不包含。
+    """
+    if not config:
+        return None
+    since = parse_date(config.get("DP_SINCE"))
+    until = parse_date(config.get("DP_UNTIL"))
+    if since is None and until is None:
+        return None
+    return since, until
+
+
+def describe(window):
+    since, until = window
+    return f"{since[:10] if since else '最早'} ~ {until[:10] if until else '现在'}"
+
+
+def in_window(created_at, window):
+    """单条回复是否在窗口内。没有 created_at 的回复不在任何窗口内。"""
+    if not created_at:
+        return False
+    since, until = window
+    return (since is None or created_at >= since) and (until is None or created_at < until)
+
+
+class CreatedAtIndex:
+    """
+    按用户分组的回复的 created_at 有序索引。
+    keys 为排好序的 created_at，positions[i] 为对应回复的 (用户下标, 回复下标)。
+    """
+
+    def __init__(self, grouped_data):
+        entries = sorted(
+            (reply.get("created_at") or "", user_index, reply_index)
+            for user_index, user_data in enumerate(grouped_data)
+            for reply_index, reply in enumerate(user_data.get("replies", []))
+        )
+        self.keys = [entry[0] for entry in entries]
+        self.positions = [(entry[1], entry[2]) for entry in entries]
+        # 没有 created_at 的回复排在最前面，窗口切片从它们之后开始
+        self._dated_start = bisect_left(self.keys, "\x01")
+
+    @classmethod
+    def from_sorted(cls, keys, positions):
+        """用已经排好序的 keys 和 positions 构造索引，如从磁盘读取的索引。"""
+        index = cls.__new__(cls)
+        index.keys = keys
+        index.positions = positions
+        index._dated_start = bisect_left(keys, "\x01")
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def range(self, since=None, until=None):
+        """返回 created_at 在 [since, until) 内的回复位置，按时间顺序排列。"""
+        low = max(self._dated_start, bisect_left(self.keys, since) if since else 0)
+        high = bisect_left(self.keys, until) if until else len(self.keys)
+        return self.positions[low:high]
+
+    def selected_replies(self, window):
+        """返回 {用户下标: 窗口内回复下标的集合}。"""
+        selected = {}
+        for user_index, reply_index in self.range(*window):
+            selected.setdefault(user_index, set()).add(reply_index)
+        return selected
+
+    def select(self, grouped_data, window):
+        """返回只包含窗口内回复的分组数据，用户顺序和每个用户内的回复顺序不变。"""
+        selected = self.selected_replies(window)
+        result = []
+        for user_index in sorted(selected):
+            user_data = grouped_data[user_index]
+            replies = user_data.get("replies", [])
+            result.append(
+                dict(
+                    user_data,
+                    replies=[
+                        reply
+                        for reply_index, reply in enumerate(replies)
+                        if reply_index in selected[user_index]
+                    ],
+                )
+            )
+        return result
+
+
+def recency_weight(created_at, half_life_days, now=None):
+    """按半衰期计算的时间权重：刚发布的回复为 1，每过 half_life_days 天减半。没有时间的回复为 0.5。"""
+    if not half_life_days:
+        return 1.0
+    if not created_at:
+        return 0.5
+    try:
+        moment = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    except ValueError:
+        return 0.5
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    age_days = max(0.0, (now - moment).total_seconds() / 86400)
+    return 0.5 ** (age_days / half_life_days)